@@ -1,2 +1,2 @@
-from .model import Model
+from .model import Model, MemoryAttributes, ModelRegistry
 from .utility import Utility
@@ -12,41 +12,124 @@ cdef class Model(dict):
     cdef public str ATTRS_KEY
     cdef public set RESERVED_CHARACTERS
     cdef public str INTERNAL_ID_KEY
+    cdef public str LINE_LABELS_KEY
     cdef public str DICTIONARY_KEY
     cdef public str KEYWORDS_KEY
     cdef public str NORMALIZER_KEY
     cdef public str DEFAULT_NORMALIZER_KEY
     cdef public str DATASOURCE_KEY
+    cdef public str LAYOUT_KEY
+    cdef public str LABELS_KEY
+    cdef public str CHILDREN_KEY
+    cdef public str LEAVES_KEY
+    cdef public str ENTITY_IDS_KEY
+    cdef public str IGNORED_KEY
+    cdef public str FAILURE_KEY
+    cdef public str OUTPUT_KEY
+    cdef public str DEPTH_KEY
+    cdef public str SOURCE_KEY
+    cdef public str USED_NORMALIZERS_KEY
+    cdef public str VOCABULARY_KEY
+    cdef public str TOKENS_KEY
+    cdef public str DICT_LAYOUT
+    cdef public str COMPACT_LAYOUT
+    cdef public str TOKEN_LAYOUT
+    cdef public bytes MAPPED_SIGNATURE
+    cdef public int MAPPED_VERSION
+    cdef public bytes TRIE_SIGNATURE
+    cdef public int TRIE_VERSION
     cdef public str DEFAULT_DATASOURCE_PATH
     cdef public str DEFAULT_DATASOURCE_FILENAME
     cdef public str DEFAULT_DATASOURCE
     cdef public str DEFAULT_WORD_SEPARATOR
     cdef public int DEFAULT_TOKENIZER_OPTION
+    cdef public int ATTRS_BATCH_SIZE
+    cdef public int ATTRS_INSERT_BATCH_SIZE
+    cdef public list BULK_INSERT_PRAGMAS
     cdef public connection
     cdef public cursor
     cdef public normalizer_map
     cdef public sic_builder
+    cdef public attrs_cache
+    cdef public int attrs_cache_size
+    cdef public dict attrs_cache_stats
+    cdef public normalization_cache
+    cdef public int normalization_cache_size
+    cdef public dict normalization_cache_stats
+    cdef public dict filter_bitsets
+    cdef public attrs_rows
+    cdef public bint sort_attrs_rows
+    cdef public list saved_pragmas
+    cdef public bint normalized_attrs
+    cdef public attr_name_ids
+    cdef public attr_value_ids
+    cdef public attrs_store
+    cdef public saved_as
+    cdef public set dirty
+    cdef public bint lazy_tries
+    cdef public int resident_tries
+    cdef public bint pause_gc
+    cdef public bint thread_safe
+    cdef public lock
+    cdef public trie_usage
+    cdef public dict memory_sizes
 
     @cython.locals(
         normalizers=cython.dict,
-        dictionary_number=cython.int
+        dictionary_number=cython.int,
+        incremental=cython.bint,
+        extension=cython.str,
+        dictionary_filename=cython.str,
+        keywords_filename=cython.str,
+        stale_extension=cython.str,
+        trie=cython.dict
     )
     cpdef bint save(
+        self,
+        str filename,
+        bint mapped=*
+    )
+
+    cpdef bint write_pickle(
+        self,
+        str filename,
+        data
+    )
+
+    cpdef bint save_attributes(
         self,
         str filename
     )
 
+    cpdef bint mark_dirty(
+        self,
+        component=*
+    )
+
     @cython.locals(
         normalizers=cython.dict,
-        _filename=cython.str,
-        dictionary=cython.dict,
-        keywords=cython.dict
+        dictionary_number=cython.int,
+        keywords=cython.dict,
+        loaded_empty=cython.bint,
+        gc_paused=cython.bint
     )
     cpdef bint load(
         self,
         str filename
     )
 
+    cpdef bint connect(
+        self,
+        bint read_only=*
+    )
+
+    @cython.locals(
+        names=cython.set
+    )
+    cpdef bint detect_attrs_schema(
+        self
+    )
+
     cpdef bint add_normalizer(
         self,
         str normalizer_name,
@@ -54,11 +137,59 @@ cdef class Model(dict):
         bint default=*
     )
 
+    @cython.locals(
+        key=cython.tuple,
+        normalized=cython.str
+    )
+    cpdef str normalize_synonym(
+        self,
+        str normalizer_name,
+        str synonym,
+        str word_separator,
+        int tokenizer_option=*
+    )
+
+    cpdef clear_normalization_cache(
+        self
+    )
+
+    cpdef get_cached_attributes(
+        self,
+        tuple key
+    )
+
+    cpdef cache_attributes(
+        self,
+        tuple key,
+        dict attributes
+    )
+
+    cpdef clear_attrs_cache(
+        self
+    )
+
+    @cython.locals(
+        query=cython.str,
+        params=cython.tuple,
+        ns=cython.list,
+        bitset=bytearray,
+        n=cython.long
+    )
+    cpdef bytearray get_filter_bitset(
+        self,
+        tuple conditions
+    )
+
     cpdef bint create_recognizer_schema(
         self,
         cursor
     )
 
+    cpdef bint create_recognizer_index(
+        self,
+        cursor
+    )
+
     @cython.locals(
         children=cython.dict,
         child_count=cython.int,
@@ -86,7 +217,342 @@ cdef class Model(dict):
     )
 
     @cython.locals(
-        k=cython.str
+        ret=cython.dict,
+        stack=cython.list,
+        source=cython.dict,
+        target=cython.dict,
+        key=cython.str,
+        child=cython.dict,
+        node=cython.dict,
+        radix=cython.str,
+        character=cython.str
+    )
+    cpdef dict expand_subtrie(
+        self,
+        dict trie,
+        bint compressed
+    )
+
+    @cython.locals(
+        labels=cython.list,
+        ignored=cython.set,
+        node_count=cython.long,
+        node_id=cython.long,
+        node=cython.dict,
+        key=cython.str
+    )
+    cpdef dict compact_subtrie(
+        self,
+        dict trie
+    )
+
+    @cython.locals(
+        nodes=cython.list,
+        node_id=cython.long,
+        node=cython.dict,
+        child_id=cython.long
+    )
+    cpdef dict restore_subtrie(
+        self,
+        dict compact
+    )
+
+    @cython.locals(
+        vocabulary=cython.dict,
+        tokens=cython.dict,
+        stack=cython.list,
+        node=cython.dict,
+        token_node=cython.dict,
+        leaf=cython.dict,
+        child=cython.dict,
+        word=cython.str,
+        token_id=cython.long
+    )
+    cpdef dict tokenize_subtrie(
+        self,
+        dict trie,
+        str word_separator
+    )
+
+    @cython.locals(
+        vocabulary=cython.dict,
+        words=cython.list,
+        ret=cython.dict,
+        stack=cython.list,
+        token_node=cython.dict,
+        node=cython.dict,
+        target=cython.dict,
+        prefix=cython.str,
+        label=cython.str,
+        character=cython.str
+    )
+    cpdef dict detokenize_subtrie(
+        self,
+        dict subtrie
+    )
+
+    @cython.locals(
+        ignored=cython.set,
+        total_nodes=cython.long,
+        node=cython.long,
+        child=cython.long,
+        state=cython.long,
+        found=cython.long,
+        character=cython.str
+    )
+    cpdef dict link_subtrie(
+        self,
+        dict compact,
+        str word_separator
+    )
+
+    @cython.locals(
+        ret=cython.dict,
+        normalizer_name=cython.str
+    )
+    cpdef dict link_trie(
+        self,
+        dict trie
+    )
+
+    @cython.locals(
+        ret=cython.dict,
+        normalizer_name=cython.str,
+        expanded=cython.dict
+    )
+    cpdef dict compact_trie(
+        self,
+        dict trie,
+        bint compressed
+    )
+
+    @cython.locals(
+        ret=cython.dict,
+        normalizer_name=cython.str,
+        expanded=cython.dict
+    )
+    cpdef dict tokenize_trie(
+        self,
+        dict trie,
+        bint compressed
+    )
+
+    @cython.locals(
+        ret=cython.dict,
+        normalizer_name=cython.str
+    )
+    cpdef dict detokenize_trie(
+        self,
+        dict trie
+    )
+
+    @cython.locals(
+        dictionary_number=cython.int,
+        trie=cython.dict,
+        restored=cython.dict,
+        current_layout=cython.str,
+        linked=cython.bint,
+        normalizer_name=cython.str
+    )
+    cpdef bint set_trie_layout(
+        self,
+        str layout,
+        bint compressed=*,
+        bint failure_links=*
+    )
+
+    @cython.locals(
+        positions=cython.list,
+        position=cython.long,
+        offset=cython.long,
+        length=cython.long,
+        i=cython.int
+    )
+    cpdef bint write_mapped_file(
+        self,
+        str filename,
+        list sections
+    )
+
+    @cython.locals(
+        signature=bytes,
+        version=cython.int,
+        section_count=cython.int,
+        positions=cython.list
+    )
+    cpdef tuple read_mapped_file(
+        self,
+        str filename
+    )
+
+    cpdef mapped_array(
+        self,
+        buffer,
+        tuple position
+    )
+
+    @cython.locals(
+        header=cython.dict,
+        sections=cython.list,
+        normalizer_name=cython.str,
+        content=cython.dict,
+        keys=cython.list
+    )
+    cpdef bint save_mapped_trie(
+        self,
+        str filename,
+        dict trie
+    )
+
+    @cython.locals(
+        positions=cython.list,
+        header=cython.dict,
+        trie=cython.dict,
+        i=cython.int,
+        normalizer_header=cython.tuple,
+        normalizer_name=cython.str,
+        ignored=cython.list
+    )
+    cpdef dict load_mapped_trie(
+        self,
+        str filename
+    )
+
+    @cython.locals(
+        vocabulary=cython.dict,
+        token=cython.str,
+        pool=bytearray,
+        header=bytes
+    )
+    cpdef bint save_mapped_keywords(
+        self,
+        str filename,
+        dict keywords
+    )
+
+    @cython.locals(
+        index=cython.dict,
+        normalizer_name=cython.str,
+        index_offset=cython.long
+    )
+    cpdef dict save_trie(
+        self,
+        str filename,
+        dict trie
+    )
+
+    @cython.locals(
+        signature=cython.bytes,
+        version=cython.int,
+        trie=cython.dict,
+        content_offset=cython.long,
+        index=cython.dict
+    )
+    cpdef dict load_trie(
+        self,
+        str filename,
+        bint lazy=*
+    )
+
+    @cython.locals(
+        content=cython.dict,
+        normalizer_name=cython.str
+    )
+    cpdef dict load_trie_content(
+        self,
+        str filename,
+        long offset
+    )
+
+    @cython.locals(
+        trie=cython.dict,
+        filename=cython.str,
+        index=cython.dict,
+        _normalizer_name=cython.str
+    )
+    cpdef dict get_trie(
+        self,
+        int dictionary_number,
+        str normalizer_name=*
+    )
+
+    @cython.locals(
+        dictionary_number=cython.int
+    )
+    cpdef bint load_tries(
+        self
+    )
+
+    @cython.locals(
+        trie=cython.dict
+    )
+    cpdef bint unload_trie(
+        self,
+        int dictionary_number,
+        str normalizer_name
+    )
+
+    cpdef bint is_empty_trie(
+        self,
+        dict trie,
+        str normalizer_name
+    )
+
+    cpdef list get_used_normalizers(
+        self
+    )
+
+    @cython.locals(
+        size=cython.longlong,
+        seen=cython.set,
+        stack=cython.list
+    )
+    cpdef long long get_object_size(
+        self,
+        obj
+    )
+
+    @cython.locals(
+        usage=cython.dict,
+        parts=cython.list,
+        dictionary_number=cython.int,
+        content=cython.dict,
+        size=cython.longlong
+    )
+    cpdef dict memory_usage(
+        self
+    )
+
+    @cython.locals(
+        positions=cython.list,
+        header=cython.dict,
+        keywords=cython.dict
+    )
+    cpdef dict load_mapped_keywords(
+        self,
+        str filename
+    )
+
+    @cython.locals(
+        ret=cython.dict,
+        normalizer_name=cython.str,
+        content=cython.dict
+    )
+    cpdef dict unmap_trie(
+        self,
+        dict trie
+    )
+
+    cpdef bint convert(
+        self,
+        str filename,
+        str target_filename,
+        bint mapped=*
+    )
+
+    @cython.locals(
+        k=cython.str,
+        rows=cython.list
     )
     cpdef store_attributes(
         self,
@@ -97,6 +563,56 @@ cdef class Model(dict):
         list columns
     )
 
+    @cython.locals(
+        pragma=cython.str
+    )
+    cpdef bint begin_bulk_insert(
+        self,
+        bint sort_rows=*
+    )
+
+    cpdef flush_attributes(
+        self
+    )
+
+    @cython.locals(
+        new_names=cython.list,
+        new_values=cython.list,
+        row=cython.tuple
+    )
+    cpdef insert_attributes(
+        self,
+        list rows
+    )
+
+    @cython.locals(
+        pragma=cython.str
+    )
+    cpdef bint end_bulk_insert(
+        self
+    )
+
+    @cython.locals(
+        table=cython.str,
+        i=cython.int,
+        batch=cython.tuple,
+        n=cython.long
+    )
+    cpdef bint delete_attributes(
+        self,
+        list line_numbers
+    )
+
+    @cython.locals(
+        id_name=cython.str,
+        entity_ids=cython.dict,
+        line_numbers=cython.dict
+    )
+    cpdef tuple get_entity_ids(
+        self,
+        dict specs
+    )
+
     @cython.locals(
         columns=cython.list,
         internal_id=cython.int,
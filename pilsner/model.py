@@ -1,4 +1,5 @@
 import os
+import gc
 import logging
 import random
 import string
@@ -6,11 +7,314 @@ import sqlite3
 import sic
 import pickle
 import shutil
+import sys
+import mmap
+import struct
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+
+class MappedLabels():
+    """This class is a read-only string of characters stored in memory-mapped file (4 bytes per character) that can be looked up in place."""
+
+    def __init__(self, buffer, offset, length):
+        """Creates MappedLabels instance.
+
+        Args:
+            mmap.mmap *buffer*: memory-mapped file
+            int *offset*: position of the first character in *buffer*
+            int *length*: number of characters
+        """
+        self.buffer = buffer
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.length:
+            raise IndexError('Character index out of range')
+        return self.buffer[self.offset + 4 * index:self.offset + 4 * index + 4].decode('utf-32-le', 'surrogatepass')
+
+    def __str__(self):
+        return self.buffer[self.offset:self.offset + 4 * self.length].decode('utf-32-le', 'surrogatepass')
+
+    def find(self, character, start, end):
+        """Does the same as str.find() for a single character.
+        Returns int index of *character* between *start* and *end*, or -1 if not found.
+
+        Args:
+            str *character*: character to look up
+            int *start*: index to start search from
+            int *end*: index to stop search at
+        """
+        needle = character.encode('utf-32-le', 'surrogatepass')
+        end = self.offset + 4 * end
+        position = self.buffer.find(needle, self.offset + 4 * start, end)
+        while position >= 0 and (position - self.offset) % 4 != 0:
+            position = self.buffer.find(needle, position + 1, end)
+        if position < 0:
+            return -1
+        return (position - self.offset) // 4
+
+class MappedIds(Mapping):
+    """This class is a read-only dict of non-negative int keys and int values stored in memory-mapped file."""
+
+    MISSING = 0xFFFFFFFF
+
+    def __init__(self, values, count):
+        """Creates MappedIds instance.
+
+        Args:
+            memoryview *values*: values indexed by keys (MISSING where key is absent)
+            int *count*: number of keys
+        """
+        self.values = values
+        self.count = count
+
+    def __contains__(self, key):
+        return isinstance(key, int) and 0 <= key < len(self.values) and self.values[key] != self.MISSING
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self.values[key]
+
+    def __iter__(self):
+        return (key for key in range(len(self.values)) if self.values[key] != self.MISSING)
+
+    def __len__(self):
+        return self.count
+
+class MappedKeywords(Mapping):
+    """This class is a read-only dict of non-negative int keys and sets of tokens stored in memory-mapped file."""
+
+    def __init__(self, buffer, starts, ends, token_ids, token_offsets, pool_offset, count):
+        """Creates MappedKeywords instance.
+
+        Args:
+            mmap.mmap *buffer*: memory-mapped file
+            memoryview *starts*: position of the first token of each key in *token_ids* (MappedIds.MISSING where key is absent)
+            memoryview *ends*: position after the last token of each key in *token_ids*
+            memoryview *token_ids*: concatenated token IDs
+            memoryview *token_offsets*: positions of tokens (UTF-8) in the pool of tokens
+            int *pool_offset*: position of the pool of tokens in *buffer*
+            int *count*: number of keys
+        """
+        self.buffer = buffer
+        self.starts = starts
+        self.ends = ends
+        self.token_ids = token_ids
+        self.token_offsets = token_offsets
+        self.pool_offset = pool_offset
+        self.count = count
+
+    def __contains__(self, key):
+        return isinstance(key, int) and 0 <= key < len(self.starts) and self.starts[key] != MappedIds.MISSING
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return set([
+            self.buffer[self.pool_offset + self.token_offsets[token_id]:self.pool_offset + self.token_offsets[token_id + 1]].decode('utf8', 'surrogatepass')
+            for token_id in self.token_ids[self.starts[key]:self.ends[key]]
+        ])
+
+    def __iter__(self):
+        return (key for key in range(len(self.starts)) if self.starts[key] != MappedIds.MISSING)
+
+    def __len__(self):
+        return self.count
+
+class NoLock():
+    """This class stands in for the lock of Model that is not thread-safe: entering and leaving `with` block does nothing."""
+
+    def __enter__(self):
+        """Enter `with`."""
+        return self
+
+    def __exit__(self, ex_type, ex_value, ex_traceback):
+        """Exit `with`."""
+        return False
+
+class MemoryAttributes():
+    """This class stores attributes of entities in memory, in columns indexed by line number, and can be used instead of SQLite database (see Model).
+    Each column is a tuple (array *offsets*, array *value_ids*) of unsigned ints, where values of line *n* are value_ids[offsets[n]:offsets[n + 1]], so that it is saved and loaded as it is.
+    Any object that has the same methods (insert, delete, match, lines, fetch, rows, save, load) can be used as store of attributes.
+    """
+
+    def __init__(self):
+        """Creates empty MemoryAttributes instance."""
+        self.names = []
+        self.name_ids = {}
+        self.values = []
+        self.value_ids = {}
+        self.internal_ids = array('q')
+        self.columns = []
+        self.resolved = {}
+
+    def intern(self, value):
+        """Returns int ID of *value* (new ID is assigned if *value* has not been seen before)."""
+        if value not in self.value_ids:
+            self.value_ids[value] = len(self.values)
+            self.values.append(value)
+        return self.value_ids[value]
+
+    def insert(self, rows):
+        """Stores attributes.
+        Values are appended to the end of a column when lines come in ascending order; values of an earlier line are inserted into the middle of the column, which takes time proportional to its length.
+
+        Args:
+            list *rows*: list of tuples (int *line_number*, int *internal_id*, str *attr_name*, str *attr_value*)
+        """
+        for n, internal_id, attr_name, attr_value in rows:
+            if attr_name not in self.name_ids:
+                self.name_ids[attr_name] = len(self.names)
+                self.names.append(attr_name)
+                self.columns.append((array('I', [0]), array('I')))
+            offsets, value_ids = self.columns[self.name_ids[attr_name]]
+            if n >= len(offsets) - 1:
+                offsets.extend([offsets[-1]] * (n + 2 - len(offsets)))
+            if n >= len(self.internal_ids):
+                self.internal_ids.extend([-1] * (n + 1 - len(self.internal_ids)))
+            self.internal_ids[n] = internal_id
+            value_id = self.intern(attr_value)
+            if value_id in value_ids[offsets[n]:offsets[n + 1]]:
+                continue
+            value_ids.insert(offsets[n + 1], value_id)
+            for i in range(n + 1, len(offsets)):
+                offsets[i] += 1
+        self.resolved.clear()
+
+    def delete(self, line_numbers):
+        """Drops attributes of given lines (each column that has values for any of them is rewritten once).
+
+        Args:
+            list *line_numbers*: line numbers to drop attributes for
+        """
+        line_numbers = set(line_numbers)
+        for n in line_numbers:
+            if n < len(self.internal_ids):
+                self.internal_ids[n] = -1
+        for name_id in range(len(self.columns)):
+            offsets, value_ids = self.columns[name_id]
+            if not [n for n in line_numbers if n < len(offsets) - 1 and offsets[n] < offsets[n + 1]]:
+                continue
+            kept_offsets = array('I', [0])
+            kept_value_ids = array('I')
+            for n in range(len(offsets) - 1):
+                if n not in line_numbers:
+                    kept_value_ids.extend(value_ids[offsets[n]:offsets[n + 1]])
+                kept_offsets.append(len(kept_value_ids))
+            self.columns[name_id] = (kept_offsets, kept_value_ids)
+        self.resolved.clear()
+
+    def resolve(self, conditions):
+        """Returns list of tuples (array *offsets*, array *value_ids*, set *wanted_value_ids*) for columns named in given *conditions* (see match())."""
+        if conditions not in self.resolved:
+            wanted = {}
+            for attr_name, attr_value in conditions:
+                if attr_name in self.name_ids and attr_value in self.value_ids:
+                    wanted.setdefault(self.name_ids[attr_name], set()).add(self.value_ids[attr_value])
+            self.resolved[conditions] = [self.columns[name_id] + (wanted[name_id],) for name_id in wanted]
+        return self.resolved[conditions]
+
+    def match(self, line_numbers, conditions):
+        """Returns set of line numbers from *line_numbers* that satisfy at least one of *conditions*.
+
+        Args:
+            list *line_numbers*: line numbers to check
+            tuple *conditions*: tuple of tuples (str *attr_name*, str *attr_value*); if empty, every line that has attributes qualifies
+        """
+        if len(conditions) == 0:
+            return set([n for n in line_numbers if n < len(self.internal_ids) and self.internal_ids[n] >= 0])
+        ret = set()
+        wanted = self.resolve(conditions)
+        for n in line_numbers:
+            for offsets, value_ids, wanted_value_ids in wanted:
+                if n < len(offsets) - 1 and not wanted_value_ids.isdisjoint(value_ids[offsets[n]:offsets[n + 1]]):
+                    ret.add(n)
+                    break
+        return ret
+
+    def lines(self, conditions):
+        """Returns list of all line numbers that satisfy at least one of *conditions* (see match())."""
+        return sorted(self.match(range(len(self.internal_ids)), conditions))
+
+    def fetch(self, line_numbers, attr_names):
+        """Returns dict {int *line_number*: {str *attr_name*: [str *attr_value*]}} for given lines, with values sorted.
+
+        Args:
+            list *line_numbers*: line numbers to fetch attributes for
+            tuple *attr_names*: names of attributes to fetch (all attributes if empty)
+        """
+        name_ids = sorted([self.name_ids[x] for x in set(attr_names) if x in self.name_ids] if len(attr_names) > 0 else range(len(self.names)), key=lambda x: self.names[x])
+        ret = {}
+        for n in line_numbers:
+            ret[n] = {}
+            for name_id in name_ids:
+                offsets, value_ids = self.columns[name_id]
+                if n < len(offsets) - 1 and offsets[n] < offsets[n + 1]:
+                    ret[n][self.names[name_id]] = sorted([self.values[x] for x in value_ids[offsets[n]:offsets[n + 1]]])
+        return ret
+
+    def rows(self, attr_name):
+        """Returns list of tuples (int *line_number*, int *internal_id*, str *attr_value*) for all values of given attribute.
+
+        Args:
+            str *attr_name*: name of attribute
+        """
+        if attr_name not in self.name_ids:
+            return []
+        offsets, value_ids = self.columns[self.name_ids[attr_name]]
+        ret = []
+        for n in range(len(offsets) - 1):
+            ret.extend([(n, self.internal_ids[n], self.values[value_id]) for value_id in value_ids[offsets[n]:offsets[n + 1]]])
+        return ret
+
+    def save(self, model, filename):
+        """Writes attributes to a file (see Model.write_mapped_file()).
+
+        Args:
+            Model *model*: Model instance to use for writing
+            str *filename*: path and name of the file to write
+        """
+        sections = [pickle.dumps({'names': self.names, 'values': self.values}), self.internal_ids]
+        for offsets, value_ids in self.columns:
+            sections += [offsets, value_ids]
+        return model.write_mapped_file(filename, sections)
+
+    def load(self, model, filename):
+        """Reads attributes from a file written by save() (arrays are copied from the file as they are).
+
+        Args:
+            Model *model*: Model instance to use for reading
+            str *filename*: path and name of the file to read
+        """
+        buffer, positions = model.read_mapped_file(filename)
+        header = pickle.loads(buffer[positions[0][0]:positions[0][0] + positions[0][1]])
+        self.__init__()
+        self.names = header['names']
+        self.name_ids = {self.names[i]: i for i in range(len(self.names))}
+        self.values = header['values']
+        self.value_ids = {self.values[i]: i for i in range(len(self.values))}
+        sections = [array('q' if i == 1 else 'I', buffer[positions[i][0]:positions[i][0] + positions[i][1]]) for i in range(1, len(positions))]
+        if sys.byteorder != 'little':
+            for section in sections:
+                section.byteswap()
+        self.internal_ids = sections[0]
+        self.columns = [(sections[1 + 2 * i], sections[2 + 2 * i]) for i in range(len(self.names))]
+        buffer.close()
+        return True
 
 class Model(dict):
     """This class is a dict that stores tries and metadata, and provides functions and methods associated with the storage."""
 
-    def __init__(self, filename='', storage_location='', simple=False, debug_mode=False, verbose_mode=False):
+    def __init__(self, filename='', storage_location='', simple=False, debug_mode=False, verbose_mode=False, attrs_cache_size=0, normalized_attrs=False, attrs_store=None, normalization_cache_size=0, lazy_tries=False, resident_tries=0, pause_gc=False, thread_safe=False):
         """Creates Model instance.
 
         Args:
@@ -19,6 +323,14 @@ class Model(dict):
             bool *simple*: when True, attributes will not be stored or processed, only labels and primary IDs (defaulr False)
             bool *debug_mode*: increase verbosity (default False)
             bool *verbose_mode*: increase verbosity even more (default False)
+            int *attrs_cache_size*: maximum number of resolved trie leaves to keep in LRU cache of attributes (default 0, no caching)
+            bool *normalized_attrs*: when True, names and values of attributes are stored in lookup tables and referenced by integer IDs (see create_recognizer_schema()); ignored when model is loaded from disk (default False)
+            *attrs_store*: object that stores attributes instead of SQLite database, for example MemoryAttributes instance (default None, attributes are stored in SQLite database)
+            int *normalization_cache_size*: maximum number of normalized dictionary labels to keep in LRU cache while model is compiled (default 0, no caching)
+            bool *lazy_tries*: when True, tries are read from disk when they are first used rather than when model is loaded, see get_trie() (default False)
+            int *resident_tries*: maximum number of tries (of a normalization unit in a shard) read lazily to keep in memory, least recently used ones are unloaded (default 0, no limit)
+            bool *pause_gc*: when True, garbage collector is disabled while tries are read by load() and collects once after that; this affects the whole process (default False)
+            bool *thread_safe*: when True, connection to the database that stores attributes can be used from any thread, and attribute queries, attributes cache, and tries read lazily are guarded by a lock, so that model can be used by several threads at once (default False)
         """
         self.CONTENT_KEY = '~content'
         self.SPECS_KEY = '~specs'
@@ -30,11 +342,34 @@ class Model(dict):
         self.ATTRS_KEY = '\x05' # ENQ, formerly '~p'
         self.RESERVED_CHARACTERS = set([self.IGNORE_KEY, self.ENTITY_KEY, self.ATTRS_KEY])
         self.INTERNAL_ID_KEY = '~internal_id_map'
+        self.LINE_LABELS_KEY = '~line_labels'
         self.DICTIONARY_KEY = '~dictionary'
         self.KEYWORDS_KEY = '~keywords'
         self.NORMALIZER_KEY = '~normalization'
         self.DEFAULT_NORMALIZER_KEY = '~default_normalizer'
         self.DATASOURCE_KEY = '~datasource'
+        self.LAYOUT_KEY = '~layout'
+        self.LABELS_KEY = '~labels'
+        self.CHILDREN_KEY = '~children'
+        self.LEAVES_KEY = '~leaves'
+        self.ENTITY_IDS_KEY = '~entity_ids'
+        self.IGNORED_KEY = '~ignored'
+        self.FAILURE_KEY = '~failure'
+        self.OUTPUT_KEY = '~output'
+        self.DEPTH_KEY = '~depth'
+        self.SOURCE_KEY = '~source'
+        self.USED_NORMALIZERS_KEY = '~used_normalizers'
+        self.VOCABULARY_KEY = '~vocabulary'
+        self.TOKENS_KEY = '~tokens'
+
+        self.DICT_LAYOUT = 'dict'
+        self.COMPACT_LAYOUT = 'compact'
+        self.TOKEN_LAYOUT = 'token'
+
+        self.MAPPED_SIGNATURE = b'PILSNERM'
+        self.MAPPED_VERSION = 1
+        self.TRIE_SIGNATURE = b'PILSNERT'
+        self.TRIE_VERSION = 1
 
         self.DEFAULT_DATASOURCE_PATH = '.'
         self.DEFAULT_DATASOURCE_FILENAME = ''
@@ -43,6 +378,10 @@ class Model(dict):
         self.DEFAULT_WORD_SEPARATOR = ' '
         self.DEFAULT_TOKENIZER_OPTION = 0
 
+        self.ATTRS_BATCH_SIZE = 500 # keeps number of bound parameters per query below SQLite limit
+        self.ATTRS_INSERT_BATCH_SIZE = 50000
+        self.BULK_INSERT_PRAGMAS = [('journal_mode', 'OFF'), ('synchronous', 'OFF'), ('cache_size', '-262144')] # cache size in KiB
+
         self.DEFAULT_DATASOURCE_FILENAME = storage_location
         if self.DEFAULT_DATASOURCE_FILENAME.lower() != ':memory:':
             while self.DEFAULT_DATASOURCE_FILENAME == '' or os.path.exists(self.DEFAULT_DATASOURCE):
@@ -58,19 +397,46 @@ class Model(dict):
         self[self.DATASOURCE_KEY] = self.DEFAULT_DATASOURCE
         self[self.WORD_SEPARATOR_KEY] = self.DEFAULT_WORD_SEPARATOR
         self[self.TOKENIZER_OPTION_KEY] = self.DEFAULT_TOKENIZER_OPTION
-        if not simple:
-            self.connection = sqlite3.connect(self[self.DATASOURCE_KEY])
+        self.attrs_store = attrs_store
+        self.thread_safe = thread_safe
+        self.lock = threading.RLock() if thread_safe else NoLock()
+        if not simple and attrs_store is None:
+            self.connection = sqlite3.connect(self[self.DATASOURCE_KEY], check_same_thread=not self.thread_safe)
             self.cursor = self.connection.cursor()
         else:
             self.connection = None
             self.cursor = None
         self.normalizer_map = {}
         self.sic_builder = sic.Builder(debug_mode=debug_mode, verbose_mode=verbose_mode)
+        self.attrs_cache = OrderedDict()
+        self.attrs_cache_size = attrs_cache_size
+        self.attrs_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.normalization_cache = OrderedDict()
+        self.normalization_cache_size = normalization_cache_size
+        self.normalization_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.filter_bitsets = {}
+        self.attrs_rows = None
+        self.sort_attrs_rows = False
+        self.saved_pragmas = []
+        self.normalized_attrs = normalized_attrs
+        self.attr_name_ids = None
+        self.attr_value_ids = None
+        self.saved_as = None
+        self.dirty = set()
+        self.lazy_tries = lazy_tries
+        self.resident_tries = resident_tries
+        self.pause_gc = pause_gc
+        self.trie_usage = OrderedDict()
+        self.memory_sizes = {}
         if filename != '':
             self.load(filename)
 
     def destroy(self):
         """Closes connection, removes temporary database."""
+        self.clear_attrs_cache()
+        self.clear_normalization_cache()
+        self.trie_usage.clear()
+        self.memory_sizes.clear()
         if self.connection is not None:
             self.connection.close()
         if os.path.exists(self.DEFAULT_DATASOURCE):
@@ -91,55 +457,146 @@ class Model(dict):
         """Exit `with`."""
         self.destroy()
 
-    def save(self, filename):
+    def save(self, filename, mapped=False):
         """Saves model to disk.
-        Note: this will throw exception if temporary database is stored in memory.
+        If the model is saved to the same files it was last saved to or loaded from (same *filename* and *mapped*), only parts that have changed since then are written (see mark_dirty()).
+        Files are written next to the targets and then renamed, so that files that are possibly mapped by the model stay intact, and the database that stores attributes is copied using SQLite online backup while connection stays open.
 
         Args:
             str *filename*: path and filename prefix for names of files that will be written.
+            bool *mapped*: whether write tries and keywords in the format that can be memory-mapped when loaded (tries are converted into compact representation, see compact_trie())
 
         Example: model.save('filename') will write the following files:
             filename.normalizers
             filename.*.dictionary (can be multiple files, depends on model settings)
             filename.keywords
             filename.attributes
+
+        Example: model.save('filename', mapped=True) will write the following files:
+            filename.normalizers
+            filename.*.mapped_dictionary (can be multiple files, depends on model settings)
+            filename.mapped_keywords
+            filename.attributes
+
+        If attributes are stored in attrs_store object, filename.memory_attributes is written instead of filename.attributes.
+        Tries and keywords with the same *filename* that are left from a model saved in another format or with more tries are removed.
         """
         try:
-            assert self.connection is None or os.path.exists(self[self.DATASOURCE_KEY]), 'Cannot find temporary database on disk'
+            assert self.connection is None or self[self.DATASOURCE_KEY] == ':memory:' or os.path.exists(self[self.DATASOURCE_KEY]), 'Cannot find temporary database on disk'
             assert len(self[self.DICTIONARY_KEY]) > 0, 'Model is empty, nothing to save'
         except Exception as e:
             self.destroy()
             raise e
         logging.debug('Saving model "%s"' % (filename))
-        if self.connection is not None:
-            self.cursor.close()
-            self.connection.close()
-        normalizers = {
-            self.DEFAULT_NORMALIZER_KEY: self[self.DEFAULT_NORMALIZER_KEY],
-            self.WORD_SEPARATOR_KEY: self[self.WORD_SEPARATOR_KEY],
-            self.TOKENIZER_OPTION_KEY: self[self.TOKENIZER_OPTION_KEY],
-            self.NORMALIZER_KEY: {normalizer_name: self[self.NORMALIZER_KEY][normalizer_name].data for normalizer_name in self[self.NORMALIZER_KEY]}
-        }
-        with open('%s.normalizers' % (filename), mode='wb') as f:
-            pickle.dump(normalizers, f)
-        logging.debug('Saved "%s"' % ('%s.normalizers' % (filename)))
+        incremental = self.saved_as == (filename, mapped)
+        if not incremental or self.NORMALIZER_KEY in self.dirty or not os.path.exists('%s.normalizers' % (filename)):
+            normalizers = {
+                self.DEFAULT_NORMALIZER_KEY: self[self.DEFAULT_NORMALIZER_KEY],
+                self.WORD_SEPARATOR_KEY: self[self.WORD_SEPARATOR_KEY],
+                self.TOKENIZER_OPTION_KEY: self[self.TOKENIZER_OPTION_KEY],
+                self.NORMALIZER_KEY: {normalizer_name: self[self.NORMALIZER_KEY][normalizer_name].data for normalizer_name in self[self.NORMALIZER_KEY]}
+            }
+            self.write_pickle('%s.normalizers' % (filename), normalizers)
+            logging.debug('Saved "%s"' % ('%s.normalizers' % (filename)))
+        extension = 'mapped_dictionary' if mapped else 'dictionary'
         for dictionary_number in range(len(self[self.DICTIONARY_KEY])):
-            with open('%s.%d.dictionary' % (filename, dictionary_number), mode='wb') as f:
-                pickle.dump(self[self.DICTIONARY_KEY][dictionary_number], f)
-                logging.debug('Saved "%s"' % ('%s.%d.dictionary' % (filename, dictionary_number)))
-        with open('%s.keywords' % (filename), mode='wb') as f:
-            pickle.dump(self[self.KEYWORDS_KEY], f)
-            logging.debug('Saved "%s"' % ('%s.keywords' % (filename)))
+            dictionary_filename = '%s.%d.%s' % (filename, dictionary_number, extension)
+            if incremental and dictionary_number not in self.dirty and os.path.exists(dictionary_filename):
+                continue
+            trie = self.get_trie(dictionary_number)
+            if mapped:
+                self.save_mapped_trie(dictionary_filename, trie)
+                trie.pop(self.SOURCE_KEY, None)
+            elif self.SOURCE_KEY in trie:
+                trie[self.SOURCE_KEY] = (dictionary_filename, self.save_trie(dictionary_filename, trie))
+            else:
+                self.save_trie(dictionary_filename, trie)
+            logging.debug('Saved "%s"' % (dictionary_filename))
+        keywords_filename = '%s.%s' % (filename, 'mapped_keywords' if mapped else 'keywords')
+        if not incremental or self.KEYWORDS_KEY in self.dirty or not os.path.exists(keywords_filename):
+            if mapped:
+                self.save_mapped_keywords(keywords_filename, self[self.KEYWORDS_KEY])
+            else:
+                self.write_pickle(keywords_filename, {k: self[self.KEYWORDS_KEY][k] if isinstance(self[self.KEYWORDS_KEY][k], dict) else dict(self[self.KEYWORDS_KEY][k]) for k in self[self.KEYWORDS_KEY]})
+            logging.debug('Saved "%s"' % (keywords_filename))
+        for stale_extension in ['dictionary', 'mapped_dictionary']:
+            dictionary_number = len(self[self.DICTIONARY_KEY]) if stale_extension == extension else 0
+            while os.path.exists('%s.%d.%s' % (filename, dictionary_number, stale_extension)):
+                os.remove('%s.%d.%s' % (filename, dictionary_number, stale_extension))
+                logging.debug('Removed "%s"' % ('%s.%d.%s' % (filename, dictionary_number, stale_extension)))
+                dictionary_number += 1
+        if os.path.exists('%s.%s' % (filename, 'keywords' if mapped else 'mapped_keywords')):
+            os.remove('%s.%s' % (filename, 'keywords' if mapped else 'mapped_keywords'))
         if self.connection is not None:
-            shutil.copyfile(self[self.DATASOURCE_KEY], '%s.attributes' % (filename))
-            logging.debug('Saved "%s"' % ('%s.attributes' % (filename)))
-            self.connection = sqlite3.connect(self[self.DATASOURCE_KEY])
-            self.cursor = self.connection.cursor()
+            if not incremental or self.DATASOURCE_KEY in self.dirty or not os.path.exists('%s.attributes' % (filename)):
+                self.save_attributes('%s.attributes' % (filename))
+                logging.debug('Saved "%s"' % ('%s.attributes' % (filename)))
+        elif self.attrs_store is not None:
+            if not incremental or self.DATASOURCE_KEY in self.dirty or not os.path.exists('%s.memory_attributes' % (filename)):
+                self.attrs_store.save(self, '%s.memory_attributes' % (filename))
+                logging.debug('Saved "%s"' % ('%s.memory_attributes' % (filename)))
         else:
             logging.warning('Attributes database not found, model has been saved as "simple"')
+        self.saved_as = (filename, mapped)
+        self.dirty.clear()
         logging.debug('Saved "%s"' % (filename))
         return True
 
+    def write_pickle(self, filename, data):
+        """Pickles object to a file that is written next to the target and then renamed, so that the target is never left incomplete.
+
+        Args:
+            str *filename*: path and name of the file to write
+            *data*: object to pickle
+        """
+        with open('%s.tmp' % (filename), mode='wb') as f:
+            pickle.dump(data, f)
+        os.replace('%s.tmp' % (filename), filename)
+        return True
+
+    def save_attributes(self, filename):
+        """Copies the database that stores attributes to a file using SQLite online backup, so that connection stays open (the file is written next to the target and then renamed).
+        If the database is stored in the file itself, changes are only committed.
+        Where online backup is not available (Python 3.6), committed database file is copied, and database stored in memory is dumped into the file.
+
+        Args:
+            str *filename*: path and name of the file to write
+        """
+        self.connection.commit()
+        if self[self.DATASOURCE_KEY] != ':memory:' and os.path.exists(filename) and os.path.samefile(self[self.DATASOURCE_KEY], filename):
+            return True
+        if os.path.exists('%s.tmp' % (filename)):
+            os.remove('%s.tmp' % (filename))
+        if hasattr(self.connection, 'backup'):
+            target = sqlite3.connect('%s.tmp' % (filename))
+            self.connection.backup(target)
+            target.close()
+        elif self[self.DATASOURCE_KEY] != ':memory:':
+            shutil.copyfile(self[self.DATASOURCE_KEY], '%s.tmp' % (filename))
+        else:
+            target = sqlite3.connect('%s.tmp' % (filename))
+            target.executescript('\n'.join(self.connection.iterdump()))
+            target.close()
+        os.replace('%s.tmp' % (filename), filename)
+        return True
+
+    def mark_dirty(self, component=None):
+        """Flags part of the model as changed since the model was last saved or loaded, so that save() writes it again.
+        Methods of Model and Utility that change the model call it themselves, so it only has to be called after tries, keywords, or normalizers are changed directly.
+
+        Args:
+            *component*: int number of trie in model[DICTIONARY_KEY], or one of NORMALIZER_KEY, KEYWORDS_KEY, DATASOURCE_KEY (attributes); if None, next save() writes the whole model
+        """
+        if component is None:
+            self.saved_as = None
+            self.dirty.clear()
+            self.memory_sizes.clear()
+        else:
+            self.dirty.add(component)
+            for key in [key for key in self.memory_sizes if key == component or isinstance(key, tuple) and key[0] == component]:
+                del self.memory_sizes[key]
+        return True
+
     def load(self, filename):
         """Loads model from disk.
 
@@ -151,8 +608,18 @@ class Model(dict):
             filename.*.dictionary
             filename.keywords
             filename.attributes
+
+        If filename.mapped_keywords file exists, the model is assumed to be saved with mapped=True (see save()), and the following files are read instead of pickled ones:
+            filename.*.mapped_dictionary (memory-mapped)
+            filename.mapped_keywords (memory-mapped)
+
+        If filename.memory_attributes file exists, attributes are loaded into MemoryAttributes instance rather than read from SQLite database.
+        If the model is created with pause_gc=True, garbage collector is disabled while tries are read.
+        If the model is created with lazy_tries=True, only metadata of tries is read from filename.*.dictionary files, and tries themselves are read when they are first used (see get_trie()).
         """
         logging.debug('Loading model "%s"' % (filename))
+        loaded_empty = len(self[self.DICTIONARY_KEY]) == 0
+        self.clear_attrs_cache()
         self[self.DATASOURCE_KEY] = '%s.attributes' % (filename)
         if self.connection is not None:
             self.cursor.close()
@@ -165,27 +632,80 @@ class Model(dict):
             self[self.WORD_SEPARATOR_KEY] = normalizers[self.WORD_SEPARATOR_KEY]
             self[self.TOKENIZER_OPTION_KEY] = normalizers[self.TOKENIZER_OPTION_KEY]
         self[self.DEFAULT_NORMALIZER_KEY] = normalizers[self.DEFAULT_NORMALIZER_KEY]
+        self.clear_normalization_cache()
         logging.debug('Loaded "%s"' % ('%s.normalizers' % (filename)))
-        for _filename in sorted(os.listdir(os.path.dirname(filename))) if os.path.dirname(filename) != '' else sorted(os.listdir()):
-            if _filename.startswith(os.path.basename(filename) + '.') and _filename.endswith('.dictionary'):
-                with open('%s/%s' % (os.path.dirname(filename), _filename) if os.path.dirname(filename) != '' else _filename, mode='rb') as f:
-                    dictionary = pickle.load(f)
-                    self[self.DICTIONARY_KEY].append(dictionary)
-                    logging.debug('Loaded "%s"' % ('%s/%s' % (os.path.dirname(filename), _filename) if os.path.dirname(filename) != '' else _filename))
-        with open('%s.keywords' % (filename), mode='rb') as f:
-            keywords = pickle.load(f)
-            self[self.KEYWORDS_KEY] = keywords
-        logging.debug('Loaded "%s"' % ('%s.keywords' % (filename)))
+        if os.path.exists('%s.mapped_keywords' % (filename)):
+            dictionary_number = 0
+            while os.path.exists('%s.%d.mapped_dictionary' % (filename, dictionary_number)):
+                self[self.DICTIONARY_KEY].append(self.load_mapped_trie('%s.%d.mapped_dictionary' % (filename, dictionary_number)))
+                logging.debug('Loaded "%s"' % ('%s.%d.mapped_dictionary' % (filename, dictionary_number)))
+                dictionary_number += 1
+            self[self.KEYWORDS_KEY] = self.load_mapped_keywords('%s.mapped_keywords' % (filename))
+            logging.debug('Loaded "%s"' % ('%s.mapped_keywords' % (filename)))
+        else:
+            # garbage collector would scan objects being read many times over as their number grows, while none of them can be freed
+            gc_paused = self.pause_gc and gc.isenabled() and not self.lazy_tries
+            if gc_paused:
+                gc.disable()
+            try:
+                dictionary_number = 0
+                while os.path.exists('%s.%d.dictionary' % (filename, dictionary_number)):
+                    self[self.DICTIONARY_KEY].append(self.load_trie('%s.%d.dictionary' % (filename, dictionary_number), self.lazy_tries))
+                    logging.debug('Loaded "%s"' % ('%s.%d.dictionary' % (filename, dictionary_number)))
+                    dictionary_number += 1
+                with open('%s.keywords' % (filename), mode='rb') as f:
+                    keywords = pickle.load(f)
+                    self[self.KEYWORDS_KEY] = keywords
+                logging.debug('Loaded "%s"' % ('%s.keywords' % (filename)))
+            finally:
+                if gc_paused:
+                    gc.enable()
+                    gc.collect()
         self[self.DATASOURCE_KEY] = '%s.attributes' % (filename)
-        if os.path.exists(self[self.DATASOURCE_KEY]):
-            self.connection = sqlite3.connect(self[self.DATASOURCE_KEY])
+        self.attrs_store = None
+        if os.path.exists('%s.memory_attributes' % (filename)):
+            self.connection = None
+            self.cursor = None
+            self.attrs_store = MemoryAttributes()
+            self.attrs_store.load(self, '%s.memory_attributes' % (filename))
+            logging.debug('Loaded "%s"' % ('%s.memory_attributes' % (filename)))
+        elif os.path.exists(self[self.DATASOURCE_KEY]):
+            self.connection = sqlite3.connect(self[self.DATASOURCE_KEY], check_same_thread=not self.thread_safe)
             self.cursor = self.connection.cursor()
+            self.detect_attrs_schema()
         else:
             self.connection = None
             self.cursor = None
             logging.warning('Could not load attributes, model is in "simple" mode')
+        self.saved_as = (filename, os.path.exists('%s.mapped_keywords' % (filename))) if loaded_empty else None
+        self.dirty.clear()
+        return True
+
+    def connect(self, read_only=False):
+        """Opens new connection to the database that stores attributes (for example, in a process that cannot use connection opened by another process).
+
+        Args:
+            bool *read_only*: whether open database in read-only mode
+        """
+        if read_only:
+            self.connection = sqlite3.connect('file:%s?mode=ro' % (pathname2url(os.path.abspath(self[self.DATASOURCE_KEY]))), uri=True, check_same_thread=not self.thread_safe)
+        else:
+            self.connection = sqlite3.connect(self[self.DATASOURCE_KEY], check_same_thread=not self.thread_safe)
+        self.cursor = self.connection.cursor()
+        self.detect_attrs_schema()
         return True
 
+    def detect_attrs_schema(self):
+        """Checks which schema the database that stores attributes has, and sets *normalized_attrs* accordingly (unless the database is empty).
+        Returns bool *normalized_attrs*.
+        """
+        self.attr_name_ids = None
+        self.attr_value_ids = None
+        names = set([row[0] for row in self.cursor.execute('select name from sqlite_master where name in (\'attrs\', \'attr_names\');')])
+        if 'attrs' in names:
+            self.normalized_attrs = 'attr_names' in names
+        return self.normalized_attrs
+
     def add_normalizer(self, normalizer_name, filename, default=False):
         """Adds normalization unit to the model.
 
@@ -206,25 +726,141 @@ class Model(dict):
         )
         self[self.NORMALIZER_KEY][normalizer_name] = normalizer
         self.normalizer_map[normalizer_name] = normalizer_name
+        self.clear_normalization_cache()
+        self.mark_dirty(self.NORMALIZER_KEY)
         if len(self[self.NORMALIZER_KEY]) == 1 or default:
             self[self.DEFAULT_NORMALIZER_KEY] = normalizer_name
         logging.debug('Added normalizer "%s" from "%s"' % (normalizer_name, filename))
         return True
 
+    def normalize_synonym(self, normalizer_name, synonym, word_separator, tokenizer_option=0):
+        """Normalizes dictionary label with given normalization unit, reuses result if the same label has been normalized the same way before.
+        Returns str normalized label.
+
+        Args:
+            str *normalizer_name*: name of normalization unit
+            str *synonym*: label to normalize
+            str *word_separator*: word separator to use for tokenization
+            int *tokenizer_option*: tokenizer mode (see documentation for normalization for details)
+        """
+        if self.normalization_cache_size <= 0:
+            return self[self.NORMALIZER_KEY][normalizer_name].normalize(synonym, word_separator, tokenizer_option)
+        key = (normalizer_name, synonym, word_separator, tokenizer_option)
+        normalized = self.normalization_cache.get(key)
+        if normalized is not None:
+            self.normalization_cache_stats['hits'] += 1
+            self.normalization_cache.move_to_end(key)
+            return normalized
+        self.normalization_cache_stats['misses'] += 1
+        normalized = self[self.NORMALIZER_KEY][normalizer_name].normalize(synonym, word_separator, tokenizer_option)
+        self.normalization_cache[key] = normalized
+        while len(self.normalization_cache) > self.normalization_cache_size:
+            self.normalization_cache.popitem(last=False)
+            self.normalization_cache_stats['evictions'] += 1
+        return normalized
+
+    def clear_normalization_cache(self):
+        """Drops all cached normalized labels (statistics are kept)."""
+        self.normalization_cache.clear()
+
+    def get_cached_attributes(self, key):
+        """Looks up attributes previously resolved for a trie leaf and marks them as recently used.
+        Returns dict with attributes, or None if *key* is not in the cache.
+
+        Args:
+            tuple *key*: tuple(tuple *leaf_ids*, *filter_1*, ..., *filter_n*) identifying a leaf and a filter applied to it
+        """
+        if key not in self.attrs_cache:
+            self.attrs_cache_stats['misses'] += 1
+            return None
+        self.attrs_cache_stats['hits'] += 1
+        self.attrs_cache.move_to_end(key)
+        return self.attrs_cache[key]
+
+    def cache_attributes(self, key, attributes):
+        """Puts attributes resolved for a trie leaf in the cache, evicts least recently used entries if the cache is full.
+
+        Args:
+            tuple *key*: tuple(tuple *leaf_ids*, *filter_1*, ..., *filter_n*) identifying a leaf and a filter applied to it
+            dict *attributes*: attributes as returned by Utility.unpack_attributes()
+        """
+        if self.attrs_cache_size <= 0:
+            return
+        self.attrs_cache[key] = attributes
+        self.attrs_cache.move_to_end(key)
+        while len(self.attrs_cache) > self.attrs_cache_size:
+            self.attrs_cache.popitem(last=False)
+            self.attrs_cache_stats['evictions'] += 1
+
+    def clear_attrs_cache(self):
+        """Drops all cached attributes and filter bitsets (statistics are kept)."""
+        self.attrs_cache.clear()
+        self.filter_bitsets.clear()
+
+    def get_filter_bitset(self, conditions):
+        """Resolves attribute conditions into bitset of line numbers that satisfy at least one of them (bit *n* is set if line *n* qualifies).
+        Bitsets are computed once per set of conditions and kept until the model is reloaded or its attributes are changed.
+        Returns bytearray with the bitset.
+
+        Args:
+            tuple *conditions*: tuple of tuples (str *attr_name*, str *attr_value*); if empty, every line that has attributes qualifies
+        """
+        if conditions in self.filter_bitsets:
+            return self.filter_bitsets[conditions]
+        if self.attrs_store is not None:
+            ns = self.attrs_store.lines(conditions)
+        else:
+            query = 'select distinct n from attrs'
+            params = ()
+            if len(conditions) > 0:
+                query += ' where ' + ' or '.join(['(attr_name = ? and attr_value = ?)'] * len(conditions))
+                params = tuple([x for condition in conditions for x in condition])
+            ns = [int(row[0]) for row in self.cursor.execute(query + ';', params)]
+        bitset = bytearray((max(ns) >> 3) + 1 if ns else 0)
+        for n in ns:
+            bitset[n >> 3] |= 1 << (n & 7)
+        self.filter_bitsets[conditions] = bitset
+        logging.debug('Resolved filter bitset for %d condition(s), %d line(s) qualify' % (len(conditions), len(ns)))
+        return bitset
+
     def create_recognizer_schema(self, cursor):
         """Creates tables in the database that stores attributes of entities.
 
         Args:
             sqlite3.connect.cursor *cursor*: cursor to use for throwing queries
         """
+        self.clear_attrs_cache()
         if cursor is not None:
+            self.mark_dirty(self.DATASOURCE_KEY)
             logging.debug('Creating schema for permanent storage')
-            cursor.execute('create table attrs (n integer, iid integer, attr_name text, attr_value text);')
+            if self.normalized_attrs:
+                cursor.execute('create table attr_names (id integer primary key, attr_name text not null unique);')
+                cursor.execute('create table attr_values (id integer primary key, attr_value text not null unique);')
+                cursor.execute('create table attrs_data (n integer, iid integer, name_id integer, value_id integer);')
+                cursor.execute('create view attrs as select d.n as n, d.iid as iid, a.attr_name as attr_name, v.attr_value as attr_value from attrs_data d join attr_names a on a.id = d.name_id join attr_values v on v.id = d.value_id;')
+                self.attr_name_ids = {}
+                self.attr_value_ids = {}
+            else:
+                cursor.execute('create table attrs (n integer, iid integer, attr_name text, attr_value text);')
             logging.debug('Created schema for permanent storage')
         else:
             logging.debug('No cursor is provided, schema is not created')
         return True
 
+    def create_recognizer_index(self, cursor):
+        """Creates index on attributes of entities (it is faster to do once all attributes are stored).
+
+        Args:
+            sqlite3.connect.cursor *cursor*: cursor to use for throwing queries
+        """
+        if cursor is None:
+            return False
+        if self.normalized_attrs:
+            cursor.execute('create index ix_attrs_data_n_name_id_value_id on attrs_data (n asc, name_id asc, value_id asc, iid asc);')
+        else:
+            cursor.execute('create index ix_attrs_n_attr_name_attr_value on attrs (n asc, attr_name asc, attr_value asc);')
+        return True
+
     def pack_subtrie(self, trie, compressed, prefix):
         """Recursively compresses a trie.
         Returns tuple (dict compressed_trie, str prefix).
@@ -275,13 +911,788 @@ class Model(dict):
             dict *trie*: part of model that contains tries
             bool *compressed*: whether tries in a given structure must be compressed
         """
-        ret = {k: trie[k] for k in trie if k != self.CONTENT_KEY}
+        ret = {k: trie[k] for k in trie if k not in (self.CONTENT_KEY, self.SOURCE_KEY)}
         ret[self.CONTENT_KEY] = {}
         for normalizer_name in trie[self.CONTENT_KEY]:
             packed = self.pack_subtrie(trie[self.CONTENT_KEY][normalizer_name], compressed, '')[0]
             ret[self.CONTENT_KEY][normalizer_name] = packed
         return ret
 
+    def expand_subtrie(self, trie, compressed):
+        """Turns a trie compressed by pack_subtrie() back into uncompressed one.
+        Returns dict object representing uncompressed trie (branches that cannot be reached by Utility.spot_entities() are dropped).
+
+        Args:
+            dict *trie*: object representing a trie
+            bool *compressed*: whether a given trie is compressed
+        """
+        ret = {}
+        stack = [(trie, ret)]
+        while stack:
+            source, target = stack.pop()
+            for key in source:
+                if key == self.ENTITY_KEY or key == self.IGNORE_KEY:
+                    target[key] = list(source[key])
+                    continue
+                if len(key) != 1 or not isinstance(source[key], dict):
+                    continue
+                child = source[key]
+                node = {}
+                target[key] = node
+                while compressed and len(child) == 1:
+                    radix = next(iter(child))
+                    if radix == self.ENTITY_KEY or len(radix) <= 1:
+                        break
+                    for character in radix:
+                        node[character] = {}
+                        node = node[character]
+                    child = child[radix]
+                stack.append((child, node))
+        return ret
+
+    def compact_subtrie(self, trie):
+        """Converts uncompressed trie into compact array-backed representation.
+        Nodes are numbered breadth first, so that children of a node take consecutive numbers.
+        Returns dict {LABELS_KEY: str, CHILDREN_KEY: array, LEAVES_KEY: array, ENTITY_IDS_KEY: array, IGNORED_KEY: set} where n-th character of labels is the character leading to n-th node,
+        children of n-th node are nodes from children[n] to children[n + 1] - 1, and entity IDs of n-th node are entity_ids[leaves[n]:leaves[n + 1]].
+
+        Args:
+            dict *trie*: object representing uncompressed trie
+        """
+        labels = ['\x00']
+        children = array('I')
+        leaves = array('I')
+        entity_ids = array('I')
+        ignored = set()
+        node_count = 1
+        node_id = 0
+        queue = deque([trie])
+        while queue:
+            node = queue.popleft()
+            children.append(node_count)
+            leaves.append(len(entity_ids))
+            for key in sorted(node):
+                if key in self.RESERVED_CHARACTERS:
+                    continue
+                labels.append(key)
+                queue.append(node[key])
+                node_count += 1
+            if self.ENTITY_KEY in node:
+                entity_ids.extend(node[self.ENTITY_KEY])
+            if self.IGNORE_KEY in node:
+                ignored.add(node_id)
+            node_id += 1
+        children.append(node_count)
+        leaves.append(len(entity_ids))
+        return {
+            self.LABELS_KEY: ''.join(labels),
+            self.CHILDREN_KEY: children,
+            self.LEAVES_KEY: leaves,
+            self.ENTITY_IDS_KEY: entity_ids,
+            self.IGNORED_KEY: ignored
+        }
+
+    def restore_subtrie(self, compact):
+        """Converts compact trie (see compact_subtrie()) back into dict object.
+        Returns dict object representing uncompressed trie.
+
+        Args:
+            dict *compact*: object representing compact trie
+        """
+        labels = compact[self.LABELS_KEY]
+        children = compact[self.CHILDREN_KEY]
+        leaves = compact[self.LEAVES_KEY]
+        entity_ids = compact[self.ENTITY_IDS_KEY]
+        nodes = [{}]
+        for node_id in range(len(labels)):
+            node = nodes[node_id]
+            for child_id in range(children[node_id], children[node_id + 1]):
+                nodes.append({})
+                node[labels[child_id]] = nodes[child_id]
+            if leaves[node_id] < leaves[node_id + 1]:
+                node[self.ENTITY_KEY] = entity_ids[leaves[node_id]:leaves[node_id + 1]].tolist()
+            if node_id in compact[self.IGNORED_KEY]:
+                node[self.IGNORE_KEY] = []
+        return nodes[0]
+
+    def tokenize_subtrie(self, trie, word_separator):
+        """Converts uncompressed trie into token trie, where edges are keyed by IDs of whole words rather than by characters.
+        Returns dict {VOCABULARY_KEY: dict, TOKENS_KEY: dict, WORD_SEPARATOR_KEY: str} where vocabulary maps each word that occurs in labels to int ID,
+        and tokens is nested dict object keyed by word IDs (terminal nodes also have ENTITY_KEY and, if ignored, IGNORE_KEY).
+        Chains of nodes that have a single child and no entity IDs are merged into the edge that leads to them, so that such edge leads to tuple (array *tail*, dict *node*) where *tail* are IDs of the words that follow, and *node* is the node they lead to.
+
+        Args:
+            dict *trie*: object representing uncompressed trie
+            str *word_separator*: word separator the trie has been made with
+        """
+        vocabulary = {}
+        tokens = {}
+        stack = [(trie, tokens, '')]
+        while stack:
+            node, token_node, word = stack.pop()
+            for key in node:
+                if key in self.RESERVED_CHARACTERS or not isinstance(node[key], dict):
+                    continue
+                if key == word_separator:
+                    token_id = vocabulary.setdefault(word, len(vocabulary))
+                    stack.append((node[key], token_node.setdefault(token_id, {}), ''))
+                else:
+                    stack.append((node[key], token_node, word + key))
+            if node is not trie and (self.ENTITY_KEY in node or self.IGNORE_KEY in node):
+                token_id = vocabulary.setdefault(word, len(vocabulary))
+                leaf = token_node.setdefault(token_id, {})
+                for key in (self.ENTITY_KEY, self.IGNORE_KEY):
+                    if key in node:
+                        leaf[key] = list(node[key])
+        stack = [tokens]
+        while stack:
+            token_node = stack.pop()
+            for key in token_node:
+                if not isinstance(key, int):
+                    continue
+                child = token_node[key]
+                tail = array('I')
+                while len(child) == 1:
+                    child_key = next(iter(child))
+                    if not isinstance(child_key, int):
+                        break
+                    tail.append(child_key)
+                    child = child[child_key]
+                if len(tail) > 0:
+                    token_node[key] = (tail, child)
+                stack.append(child)
+        return {
+            self.VOCABULARY_KEY: vocabulary,
+            self.TOKENS_KEY: tokens,
+            self.WORD_SEPARATOR_KEY: word_separator
+        }
+
+    def detokenize_subtrie(self, subtrie):
+        """Converts token trie (see tokenize_subtrie()) back into dict object keyed by characters.
+        Returns dict object representing uncompressed trie.
+
+        Args:
+            dict *subtrie*: object representing token trie
+        """
+        vocabulary = subtrie[self.VOCABULARY_KEY]
+        words = sorted(vocabulary, key=vocabulary.__getitem__)
+        ret = {}
+        stack = [(subtrie[self.TOKENS_KEY], ret, '')]
+        while stack:
+            token_node, node, prefix = stack.pop()
+            for key in token_node:
+                if key == self.ENTITY_KEY or key == self.IGNORE_KEY:
+                    node[key] = list(token_node[key])
+                    continue
+                child = token_node[key]
+                label = prefix + words[key]
+                if isinstance(child, tuple):
+                    label += ''.join([subtrie[self.WORD_SEPARATOR_KEY] + words[token_id] for token_id in child[0]])
+                    child = child[1]
+                target = node
+                for character in label:
+                    target = target.setdefault(character, {})
+                stack.append((child, target, subtrie[self.WORD_SEPARATOR_KEY]))
+        return ret
+
+    def get_trie_leaves(self, trie):
+        """Walks a trie of any layout (compressed or not, see pack_subtrie(), compact_subtrie(), and tokenize_subtrie()).
+        Yields tuple (str *label*, list *line_numbers*) for each terminal node.
+
+        Args:
+            dict *trie*: object representing a trie
+        """
+        if self.LABELS_KEY in trie:
+            labels = str(trie[self.LABELS_KEY])
+            children = trie[self.CHILDREN_KEY]
+            leaves = trie[self.LEAVES_KEY]
+            entity_ids = trie[self.ENTITY_IDS_KEY]
+            stack = [(0, '')]
+            while stack:
+                node, label = stack.pop()
+                if leaves[node] < leaves[node + 1]:
+                    yield label, list(entity_ids[leaves[node]:leaves[node + 1]])
+                stack.extend([(child, label + labels[child]) for child in range(children[node], children[node + 1])])
+        elif self.TOKENS_KEY in trie:
+            vocabulary = trie[self.VOCABULARY_KEY]
+            words = sorted(vocabulary, key=vocabulary.__getitem__)
+            stack = [(trie[self.TOKENS_KEY], None)]
+            while stack:
+                node, label = stack.pop()
+                for key in node:
+                    if key == self.ENTITY_KEY:
+                        yield label, list(node[key])
+                    elif isinstance(key, int):
+                        child = node[key]
+                        key_label = words[key] if label is None else label + trie[self.WORD_SEPARATOR_KEY] + words[key]
+                        if isinstance(child, tuple):
+                            key_label += ''.join([trie[self.WORD_SEPARATOR_KEY] + words[token_id] for token_id in child[0]])
+                            child = child[1]
+                        stack.append((child, key_label))
+        else:
+            stack = [(trie, '')]
+            while stack:
+                node, label = stack.pop()
+                for key in node:
+                    if key == self.ENTITY_KEY:
+                        yield label, list(node[key])
+                    elif key not in self.RESERVED_CHARACTERS and isinstance(node[key], dict):
+                        stack.append((node[key], label + key))
+
+    def link_subtrie(self, compact, word_separator):
+        """Computes failure links of compact trie (see compact_subtrie()) that let Utility.spot_linked_entities() scan a string in one pass without going back.
+        Failure link of a node leads to the deepest node whose label is a proper suffix of the node's label that begins after *word_separator* (root if there is none), output link leads to the nearest node on the chain of failure links that has entity IDs (root if there is none).
+        Returns dict {FAILURE_KEY: array, OUTPUT_KEY: array, DEPTH_KEY: array} where n-th member of each array is failure link, output link, and length of label of n-th node respectively.
+
+        Args:
+            dict *compact*: compact trie
+            str *word_separator*: word separator the trie has been made with
+        """
+        labels = compact[self.LABELS_KEY]
+        children = compact[self.CHILDREN_KEY]
+        leaves = compact[self.LEAVES_KEY]
+        ignored = compact[self.IGNORED_KEY]
+        total_nodes = int(len(labels))
+        failure = array('I', [0]) * total_nodes
+        output = array('I', [0]) * total_nodes
+        depth = array('I', [0]) * total_nodes
+        # nodes are numbered breadth first, so links of shallower nodes are known when a node is linked
+        for node in range(total_nodes):
+            for child in range(children[node], children[node + 1]):
+                depth[child] = depth[node] + 1
+                if node > 0:
+                    character = labels[child]
+                    state = failure[node]
+                    while True:
+                        # root only continues labels of nodes that end with word separator
+                        if state > 0 or labels[node] == word_separator:
+                            found = labels.find(character, children[state], children[state + 1])
+                            if found > 0:
+                                failure[child] = found
+                                break
+                        if state == 0:
+                            break
+                        state = failure[state]
+                state = failure[child]
+                output[child] = state if leaves[state] < leaves[state + 1] and state not in ignored else output[state]
+        return {
+            self.FAILURE_KEY: failure,
+            self.OUTPUT_KEY: output,
+            self.DEPTH_KEY: depth
+        }
+
+    def link_trie(self, trie):
+        """Adds failure links (see link_subtrie()) to all compact tries in a model.
+        Returns dict that contains linked compact tries.
+
+        Args:
+            dict *trie*: part of model that contains compact tries
+        """
+        assert trie.get(self.LAYOUT_KEY) == self.COMPACT_LAYOUT, 'Only compact tries can have failure links'
+        ret = {k: trie[k] for k in trie if k not in (self.CONTENT_KEY, self.SOURCE_KEY)}
+        ret[self.CONTENT_KEY] = {}
+        for normalizer_name in trie[self.CONTENT_KEY]:
+            ret[self.CONTENT_KEY][normalizer_name] = dict(trie[self.CONTENT_KEY][normalizer_name])
+            ret[self.CONTENT_KEY][normalizer_name].update(self.link_subtrie(trie[self.CONTENT_KEY][normalizer_name], trie[self.WORD_SEPARATOR_KEY]))
+        return ret
+
+    def compact_trie(self, trie, compressed):
+        """Converts all tries in a model into compact array-backed representation (see compact_subtrie()).
+        Returns dict that contains all compact tries.
+
+        Args:
+            dict *trie*: part of model that contains tries
+            bool *compressed*: whether tries in a given structure are compressed
+        """
+        ret = {k: trie[k] for k in trie if k not in (self.CONTENT_KEY, self.SOURCE_KEY)}
+        ret[self.CONTENT_KEY] = {}
+        for normalizer_name in trie[self.CONTENT_KEY]:
+            expanded = self.expand_subtrie(trie[self.CONTENT_KEY][normalizer_name], compressed)
+            ret[self.CONTENT_KEY][normalizer_name] = self.compact_subtrie(expanded)
+        ret[self.COMPRESSED_KEY] = 0
+        ret[self.LAYOUT_KEY] = self.COMPACT_LAYOUT
+        return ret
+
+    def tokenize_trie(self, trie, compressed):
+        """Converts all tries in a model into token tries (see tokenize_subtrie()).
+        Returns dict that contains all token tries.
+
+        Args:
+            dict *trie*: part of model that contains tries of either DICT_LAYOUT or COMPACT_LAYOUT
+            bool *compressed*: whether tries in a given structure are compressed
+        """
+        ret = {k: trie[k] for k in trie if k not in (self.CONTENT_KEY, self.LAYOUT_KEY, self.SOURCE_KEY)}
+        ret[self.CONTENT_KEY] = {}
+        for normalizer_name in trie[self.CONTENT_KEY]:
+            if trie.get(self.LAYOUT_KEY) == self.COMPACT_LAYOUT:
+                expanded = self.restore_subtrie(trie[self.CONTENT_KEY][normalizer_name])
+            else:
+                expanded = self.expand_subtrie(trie[self.CONTENT_KEY][normalizer_name], compressed)
+            ret[self.CONTENT_KEY][normalizer_name] = self.tokenize_subtrie(expanded, trie[self.WORD_SEPARATOR_KEY])
+        ret[self.COMPRESSED_KEY] = 0
+        ret[self.LAYOUT_KEY] = self.TOKEN_LAYOUT
+        return ret
+
+    def detokenize_trie(self, trie):
+        """Converts all token tries in a model (see tokenize_subtrie()) back into uncompressed tries of DICT_LAYOUT.
+        Returns dict that contains all uncompressed tries.
+
+        Args:
+            dict *trie*: part of model that contains token tries
+        """
+        ret = {k: trie[k] for k in trie if k not in (self.CONTENT_KEY, self.LAYOUT_KEY, self.SOURCE_KEY)}
+        ret[self.CONTENT_KEY] = {normalizer_name: self.detokenize_subtrie(trie[self.CONTENT_KEY][normalizer_name]) for normalizer_name in trie[self.CONTENT_KEY]}
+        ret[self.COMPRESSED_KEY] = 0
+        return ret
+
+    def set_trie_layout(self, layout, compressed=True, failure_links=False):
+        """Converts tries of a model into given representation.
+
+        Args:
+            str *layout*: DICT_LAYOUT (nested dict objects), COMPACT_LAYOUT (arrays, see compact_subtrie()), or TOKEN_LAYOUT (nested dict objects keyed by word IDs, see tokenize_subtrie())
+            bool *compressed*: whether tries must be compressed once converted to DICT_LAYOUT
+            bool *failure_links*: whether tries converted to COMPACT_LAYOUT must have failure links (see link_subtrie()); compact tries that already have them keep them either way
+        """
+        assert layout in (self.DICT_LAYOUT, self.COMPACT_LAYOUT, self.TOKEN_LAYOUT), 'Unknown trie layout: %s' % (layout)
+        for dictionary_number in range(len(self[self.DICTIONARY_KEY])):
+            trie = self.get_trie(dictionary_number)
+            current_layout = trie.get(self.LAYOUT_KEY, self.DICT_LAYOUT)
+            linked = all([self.FAILURE_KEY in trie[self.CONTENT_KEY][normalizer_name] for normalizer_name in trie[self.CONTENT_KEY]])
+            if layout == current_layout and (linked or not failure_links or layout != self.COMPACT_LAYOUT):
+                continue
+            if current_layout == self.TOKEN_LAYOUT:
+                trie = self.detokenize_trie(trie)
+                current_layout = self.DICT_LAYOUT
+            if layout == self.COMPACT_LAYOUT:
+                if current_layout != self.COMPACT_LAYOUT:
+                    trie = self.compact_trie(trie, bool(trie[self.COMPRESSED_KEY]))
+                if failure_links:
+                    trie = self.link_trie(trie)
+            elif layout == self.TOKEN_LAYOUT:
+                trie = self.tokenize_trie(trie, bool(trie[self.COMPRESSED_KEY]))
+            elif current_layout == self.COMPACT_LAYOUT:
+                restored = {k: trie[k] for k in trie if k not in (self.CONTENT_KEY, self.LAYOUT_KEY, self.SOURCE_KEY)}
+                restored[self.CONTENT_KEY] = {normalizer_name: self.restore_subtrie(trie[self.CONTENT_KEY][normalizer_name]) for normalizer_name in trie[self.CONTENT_KEY]}
+                restored[self.COMPRESSED_KEY] = int(compressed)
+                trie = self.pack_trie(restored, compressed)
+            else:
+                trie[self.COMPRESSED_KEY] = int(compressed)
+                trie = self.pack_trie(trie, compressed)
+            self[self.DICTIONARY_KEY][dictionary_number] = trie
+            self.mark_dirty(dictionary_number)
+        return True
+
+    def write_mapped_file(self, filename, sections):
+        """Writes sections of data to a file that can be memory-mapped by read_mapped_file().
+        File is written next to the target and then renamed, so that the file that is possibly mapped by the model stays intact.
+
+        Args:
+            str *filename*: path and name of the file to write
+            list *sections*: bytes-like objects (arrays of unsigned ints are written little-endian)
+        """
+        positions = []
+        position = 16 + 16 * len(sections)
+        for section in sections:
+            position += -position % 8
+            positions.append((position, memoryview(section).nbytes))
+            position += memoryview(section).nbytes
+        with open('%s.tmp' % (filename), mode='wb') as f:
+            f.write(struct.pack('<8sII', self.MAPPED_SIGNATURE, self.MAPPED_VERSION, len(sections)))
+            for offset, length in positions:
+                f.write(struct.pack('<QQ', offset, length))
+            for i in range(len(sections)):
+                f.write(b'\x00' * (positions[i][0] - f.tell()))
+                if isinstance(sections[i], array) and sys.byteorder != 'little':
+                    section = array(sections[i].typecode, sections[i])
+                    section.byteswap()
+                    f.write(section)
+                else:
+                    f.write(sections[i])
+        os.replace('%s.tmp' % (filename), filename)
+        return True
+
+    def read_mapped_file(self, filename):
+        """Memory-maps file written by write_mapped_file().
+        Returns tuple(mmap.mmap *buffer*, list *positions*) where *positions* are tuples (int offset, int length) of sections in *buffer*.
+
+        Args:
+            str *filename*: path and name of the file to map
+        """
+        with open(filename, mode='rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        signature, version, section_count = struct.unpack_from('<8sII', buffer, 0)
+        assert signature == self.MAPPED_SIGNATURE, 'File %s is not a memory-mapped model' % (filename)
+        assert version == self.MAPPED_VERSION, 'File %s has unsupported version %d' % (filename, version)
+        positions = [struct.unpack_from('<QQ', buffer, 16 + 16 * i) for i in range(section_count)]
+        return buffer, positions
+
+    def mapped_array(self, buffer, position):
+        """Returns array of unsigned ints that is stored in a section of memory-mapped file (no copy is made unless the platform is big-endian).
+
+        Args:
+            mmap.mmap *buffer*: memory-mapped file
+            tuple *position*: (int offset, int length) of the section
+        """
+        values = memoryview(buffer)[position[0]:position[0] + position[1]].cast('I')
+        if sys.byteorder != 'little':
+            values = array('I', values)
+            values.byteswap()
+        return values
+
+    def save_mapped_trie(self, filename, trie):
+        """Writes tries to a file that can be memory-mapped by load_mapped_trie() (tries are converted into compact representation first).
+
+        Args:
+            str *filename*: path and name of the file to write
+            dict *trie*: part of model that contains tries
+        """
+        if trie.get(self.LAYOUT_KEY) == self.TOKEN_LAYOUT:
+            trie = self.detokenize_trie(trie)
+        if trie.get(self.LAYOUT_KEY) != self.COMPACT_LAYOUT:
+            trie = self.compact_trie(trie, bool(trie[self.COMPRESSED_KEY]))
+        header = {k: trie[k] for k in trie if k not in (self.CONTENT_KEY, self.SOURCE_KEY)}
+        header[self.CONTENT_KEY] = []
+        sections = [b'']
+        for normalizer_name in trie[self.CONTENT_KEY]:
+            content = trie[self.CONTENT_KEY][normalizer_name]
+            keys = [self.CHILDREN_KEY, self.LEAVES_KEY, self.ENTITY_IDS_KEY]
+            if self.FAILURE_KEY in content:
+                keys += [self.FAILURE_KEY, self.OUTPUT_KEY, self.DEPTH_KEY]
+                header[self.CONTENT_KEY].append((normalizer_name, sorted(content[self.IGNORED_KEY]), True))
+            else:
+                header[self.CONTENT_KEY].append((normalizer_name, sorted(content[self.IGNORED_KEY])))
+            sections.append(str(content[self.LABELS_KEY]).encode('utf-32-le', 'surrogatepass'))
+            sections += [array('I', content[k]) if not isinstance(content[k], array) else content[k] for k in keys]
+        sections[0] = pickle.dumps(header)
+        return self.write_mapped_file(filename, sections)
+
+    def load_mapped_trie(self, filename):
+        """Memory-maps file written by save_mapped_trie().
+        Returns dict that contains compact tries whose arrays are looked up in place.
+
+        Args:
+            str *filename*: path and name of the file to map
+        """
+        buffer, positions = self.read_mapped_file(filename)
+        header = pickle.loads(buffer[positions[0][0]:positions[0][0] + positions[0][1]])
+        trie = {k: header[k] for k in header if k != self.CONTENT_KEY}
+        trie[self.CONTENT_KEY] = {}
+        i = 1
+        for normalizer_header in header[self.CONTENT_KEY]:
+            normalizer_name, ignored = normalizer_header[0], normalizer_header[1]
+            trie[self.CONTENT_KEY][normalizer_name] = {
+                self.LABELS_KEY: MappedLabels(buffer, positions[i][0], positions[i][1] // 4),
+                self.CHILDREN_KEY: self.mapped_array(buffer, positions[i + 1]),
+                self.LEAVES_KEY: self.mapped_array(buffer, positions[i + 2]),
+                self.ENTITY_IDS_KEY: self.mapped_array(buffer, positions[i + 3]),
+                self.IGNORED_KEY: set(ignored)
+            }
+            i += 4
+            # tries saved with failure links (see link_subtrie()) have three more arrays
+            if len(normalizer_header) > 2 and normalizer_header[2]:
+                trie[self.CONTENT_KEY][normalizer_name][self.FAILURE_KEY] = self.mapped_array(buffer, positions[i])
+                trie[self.CONTENT_KEY][normalizer_name][self.OUTPUT_KEY] = self.mapped_array(buffer, positions[i + 1])
+                trie[self.CONTENT_KEY][normalizer_name][self.DEPTH_KEY] = self.mapped_array(buffer, positions[i + 2])
+                i += 3
+        return trie
+
+    def save_mapped_keywords(self, filename, keywords):
+        """Writes keywords to a file that can be memory-mapped by load_mapped_keywords().
+
+        Args:
+            str *filename*: path and name of the file to write
+            dict *keywords*: keywords of a model
+        """
+        internal_ids = keywords[self.INTERNAL_ID_KEY]
+        content = keywords[self.CONTENT_KEY]
+        ids = array('I', [MappedIds.MISSING]) * (max(internal_ids) + 1 if internal_ids else 0)
+        for line_number in internal_ids:
+            ids[line_number] = internal_ids[line_number]
+        starts = array('I', [MappedIds.MISSING]) * (max(content) + 1 if content else 0)
+        ends = array('I', [0]) * len(starts)
+        token_ids = array('I')
+        vocabulary = {}
+        for internal_id in sorted(content):
+            starts[internal_id] = len(token_ids)
+            for token in sorted(content[internal_id]):
+                if token not in vocabulary:
+                    vocabulary[token] = len(vocabulary)
+                token_ids.append(vocabulary[token])
+            ends[internal_id] = len(token_ids)
+        pool = bytearray()
+        token_offsets = array('I', [0])
+        for token in vocabulary:
+            pool += token.encode('utf8', 'surrogatepass')
+            token_offsets.append(len(pool))
+        header = pickle.dumps({self.INTERNAL_ID_KEY: len(internal_ids), self.CONTENT_KEY: len(content)})
+        return self.write_mapped_file(filename, [header, ids, starts, ends, token_ids, token_offsets, pool])
+
+    def save_trie(self, filename, trie):
+        """Writes tries to a file that can be read by load_trie().
+        The file starts with TRIE_SIGNATURE and TRIE_VERSION, followed by pickled dict with everything but tries, and then by pickled tuples (str *normalizer_name*, *key*, *value*), one for each item at the root of each trie, and None.
+        So the file is written and read piece by piece rather than as one deeply nested object.
+        The file ends with pickled dict {str *normalizer_name*: int *offset*} that tells where tries of each normalization unit start, and 8-byte offset of this dict.
+        Returns dict {str *normalizer_name*: int *offset*}.
+
+        Args:
+            str *filename*: path and name of the file to write
+            dict *trie*: part of model that contains tries
+        """
+        trie = self.unmap_trie(trie)
+        index = {}
+        with open('%s.tmp' % (filename), mode='wb') as f:
+            f.write(struct.pack('<8sI', self.TRIE_SIGNATURE, self.TRIE_VERSION))
+            pickle.dump({k: trie[k] for k in trie if k not in (self.CONTENT_KEY, self.SOURCE_KEY)}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            if self.CONTENT_KEY in trie:
+                for normalizer_name in trie[self.CONTENT_KEY]:
+                    index[normalizer_name] = f.tell()
+                    pickle.dump((normalizer_name, None, None), f, protocol=pickle.HIGHEST_PROTOCOL)
+                    for key in trie[self.CONTENT_KEY][normalizer_name]:
+                        pickle.dump((normalizer_name, key, trie[self.CONTENT_KEY][normalizer_name][key]), f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(None, f, protocol=pickle.HIGHEST_PROTOCOL)
+            index_offset = f.tell()
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.write(struct.pack('<Q', index_offset))
+        os.replace('%s.tmp' % (filename), filename)
+        return index
+
+    def load_trie(self, filename, lazy=False):
+        """Reads file written by save_trie() (or pickled tries written by earlier versions).
+        Returns dict that contains tries.
+
+        Args:
+            str *filename*: path and name of the file to read
+            bool *lazy*: if True, tries themselves are not read; instead, SOURCE_KEY of returned dict is set to tuple (str *filename*, dict *index*) where *index* tells where to read tries of each normalization unit from (see get_trie()); ignored for files written by earlier versions
+        """
+        with open(filename, mode='rb') as f:
+            signature = f.read(8)
+            if signature != self.TRIE_SIGNATURE:
+                f.seek(0)
+                return pickle.load(f)
+            version = struct.unpack('<I', f.read(4))[0]
+            assert version == self.TRIE_VERSION, 'File %s has unsupported version %d' % (filename, version)
+            trie = pickle.load(f)
+            if lazy:
+                content_offset = f.tell()
+                f.seek(-8, os.SEEK_END)
+                f.seek(struct.unpack('<Q', f.read(8))[0])
+                index = pickle.load(f)
+                if index:
+                    trie[self.CONTENT_KEY] = {}
+                    trie[self.SOURCE_KEY] = (filename, index)
+                    return trie
+                f.seek(content_offset)
+            item = pickle.load(f)
+            if item is not None:
+                trie[self.CONTENT_KEY] = {}
+            while item is not None:
+                normalizer_name, key, value = item
+                if key is None:
+                    trie[self.CONTENT_KEY][normalizer_name] = {}
+                else:
+                    trie[self.CONTENT_KEY][normalizer_name][key] = value
+                item = pickle.load(f)
+        return trie
+
+    def load_trie_content(self, filename, offset):
+        """Reads tries of one normalization unit from file written by save_trie().
+        Returns dict object representing a trie.
+
+        Args:
+            str *filename*: path and name of the file to read
+            int *offset*: position in the file where tries of the normalization unit start (see save_trie())
+        """
+        content = {}
+        with open(filename, mode='rb') as f:
+            f.seek(offset)
+            normalizer_name = pickle.load(f)[0]
+            item = pickle.load(f)
+            while item is not None and item[0] == normalizer_name:
+                content[item[1]] = item[2]
+                item = pickle.load(f)
+        return content
+
+    def get_trie(self, dictionary_number, normalizer_name=None):
+        """Returns dict that contains tries of a shard (member of model[DICTIONARY_KEY]), making sure that tries of a given normalization unit are in memory.
+        Tries of models loaded with lazy_tries=True (see load()) are read from disk here when they are first used.
+        If resident_tries > 0, tries that have been read for least recently used normalization units and shards are unloaded, so that no more than resident_tries are kept in memory (tries of shards that have changed since the model was saved are kept, see mark_dirty()).
+        In that case, thread-safe model returns a copy of the dict that holds tries, so that tries being used by a thread stay in it when another thread unloads them.
+
+        Args:
+            int *dictionary_number*: number of shard in model[DICTIONARY_KEY]
+            str *normalizer_name*: name of normalization unit (if None, tries of all normalization units are read, and they are not unloaded until used again)
+        """
+        trie = self[self.DICTIONARY_KEY][dictionary_number]
+        if self.SOURCE_KEY not in trie:
+            return trie
+        filename, index = trie[self.SOURCE_KEY]
+        with self.lock:
+            for _normalizer_name in index if normalizer_name is None else [normalizer_name]:
+                if _normalizer_name in index and _normalizer_name not in trie[self.CONTENT_KEY]:
+                    trie[self.CONTENT_KEY][_normalizer_name] = self.load_trie_content(filename, index[_normalizer_name])
+                    logging.debug('Loaded "%s" from "%s"' % (_normalizer_name, filename))
+            if normalizer_name is not None and self.resident_tries > 0:
+                self.trie_usage[(dictionary_number, normalizer_name)] = True
+                self.trie_usage.move_to_end((dictionary_number, normalizer_name))
+                while len(self.trie_usage) > self.resident_tries:
+                    self.unload_trie(*self.trie_usage.popitem(last=False)[0])
+                if self.thread_safe:
+                    # another thread may unload tries of this shard while they are being scanned
+                    trie = dict(trie)
+                    trie[self.CONTENT_KEY] = dict(trie[self.CONTENT_KEY])
+        return trie
+
+    def load_tries(self):
+        """Reads all tries that have not been read yet (see get_trie())."""
+        for dictionary_number in range(len(self[self.DICTIONARY_KEY])):
+            self.get_trie(dictionary_number)
+        return True
+
+    def unload_trie(self, dictionary_number, normalizer_name):
+        """Drops tries of a normalization unit from a shard, so that they are read from disk again when used next time (see get_trie()).
+        Returns True if tries have been dropped, or False if they cannot be read again (model is not loaded with lazy_tries=True, or the shard has changed since it was saved).
+
+        Args:
+            int *dictionary_number*: number of shard in model[DICTIONARY_KEY]
+            str *normalizer_name*: name of normalization unit
+        """
+        if dictionary_number >= len(self[self.DICTIONARY_KEY]) or dictionary_number in self.dirty:
+            return False
+        trie = self[self.DICTIONARY_KEY][dictionary_number]
+        if self.SOURCE_KEY not in trie or normalizer_name not in trie[self.SOURCE_KEY][1] or normalizer_name not in trie[self.CONTENT_KEY]:
+            return False
+        del trie[self.CONTENT_KEY][normalizer_name]
+        logging.debug('Unloaded "%s" of "%s"' % (normalizer_name, trie[self.SOURCE_KEY][0]))
+        return True
+
+    def is_empty_trie(self, trie, normalizer_name):
+        """Returns True if a shard (member of model[DICTIONARY_KEY]) has no labels normalized by a given normalization unit, in any layout.
+        Tries that have not been read yet (see get_trie()) are looked up in the list of normalization units that have labels in the shard (trie[USED_NORMALIZERS_KEY], filled when the model is compiled or updated, and saved with tries), or considered not empty if there is no such list.
+
+        Args:
+            dict *trie*: part of model that contains tries
+            str *normalizer_name*: name of normalization unit
+        """
+        if normalizer_name not in trie[self.CONTENT_KEY]:
+            if self.USED_NORMALIZERS_KEY in trie:
+                return normalizer_name not in trie[self.USED_NORMALIZERS_KEY]
+            return self.SOURCE_KEY not in trie or normalizer_name not in trie[self.SOURCE_KEY][1]
+        if trie.get(self.LAYOUT_KEY) == self.COMPACT_LAYOUT:
+            return len(trie[self.CONTENT_KEY][normalizer_name][self.LABELS_KEY]) < 2
+        if trie.get(self.LAYOUT_KEY) == self.TOKEN_LAYOUT:
+            return len(trie[self.CONTENT_KEY][normalizer_name][self.TOKENS_KEY]) == 0
+        return len(trie[self.CONTENT_KEY][normalizer_name]) == 0
+
+    def get_used_normalizers(self):
+        """Returns list of names of normalization units that have labels in at least one shard (see is_empty_trie()), in the order they are stored in model[NORMALIZER_KEY]."""
+        return [normalizer_name for normalizer_name in self[self.NORMALIZER_KEY] if not all([self.is_empty_trie(trie, normalizer_name) for trie in self[self.DICTIONARY_KEY]])]
+
+    def get_object_size(self, obj):
+        """Returns number of bytes taken by an object together with all objects it contains (members of dicts, lists, tuples, and sets), each object counted once.
+
+        Args:
+            *obj*: object to measure
+        """
+        size = 0
+        seen = set()
+        stack = [obj]
+        while len(stack) > 0:
+            item = stack.pop()
+            if id(item) in seen:
+                continue
+            seen.add(id(item))
+            size += sys.getsizeof(item)
+            if isinstance(item, dict):
+                stack.extend(item.keys())
+                stack.extend(item.values())
+            elif isinstance(item, (list, tuple, set, frozenset)):
+                stack.extend(item)
+        return size
+
+    def memory_usage(self):
+        """Returns estimated number of bytes taken by tries, keywords, and attributes that model keeps in memory (see get_object_size()) as dict {'tries': int, 'keywords': int, 'attributes': int, 'total': int}.
+        Tries that have not been read yet (see get_trie()), memory-mapped files, and SQLite database are not counted.
+        Sizes of tries, keywords, and attrs_store are remembered once they are saved or loaded, and measured again while they are flagged as changed (see mark_dirty()), so only new or changed parts of the model are measured again.
+        """
+        usage = {'tries': 0, 'keywords': 0, 'attributes': 0}
+        parts = []
+        for dictionary_number in range(len(self[self.DICTIONARY_KEY])):
+            content = self[self.DICTIONARY_KEY][dictionary_number].get(self.CONTENT_KEY, {})
+            parts.extend([('tries', dictionary_number, (dictionary_number, normalizer_name), content[normalizer_name]) for normalizer_name in content])
+        parts.append(('keywords', self.KEYWORDS_KEY, self.KEYWORDS_KEY, self[self.KEYWORDS_KEY]))
+        if self.attrs_store is not None:
+            parts.append(('attributes', self.DATASOURCE_KEY, self.DATASOURCE_KEY, self.attrs_store))
+        for component, dirty_key, key, obj in parts:
+            if dirty_key not in self.dirty and key in self.memory_sizes and self.memory_sizes[key][0] == id(obj):
+                usage[component] += self.memory_sizes[key][1]
+                continue
+            size = self.get_object_size(obj.__dict__ if hasattr(obj, '__dict__') else obj)
+            if dirty_key not in self.dirty:
+                self.memory_sizes[key] = (id(obj), size)
+            usage[component] += size
+        usage['attributes'] += self.get_object_size([self.attrs_cache, self.filter_bitsets])
+        usage['total'] = usage['tries'] + usage['keywords'] + usage['attributes']
+        return usage
+
+    def load_mapped_keywords(self, filename):
+        """Memory-maps file written by save_mapped_keywords().
+        Returns dict that contains keywords looked up in place.
+
+        Args:
+            str *filename*: path and name of the file to map
+        """
+        buffer, positions = self.read_mapped_file(filename)
+        header = pickle.loads(buffer[positions[0][0]:positions[0][0] + positions[0][1]])
+        keywords = {
+            self.CONTENT_KEY: MappedKeywords(
+                buffer,
+                self.mapped_array(buffer, positions[2]),
+                self.mapped_array(buffer, positions[3]),
+                self.mapped_array(buffer, positions[4]),
+                self.mapped_array(buffer, positions[5]),
+                positions[6][0],
+                header[self.CONTENT_KEY]
+            ),
+            self.INTERNAL_ID_KEY: MappedIds(self.mapped_array(buffer, positions[1]), header[self.INTERNAL_ID_KEY])
+        }
+        return keywords
+
+    def unmap_trie(self, trie):
+        """Copies memory-mapped compact tries (see load_mapped_trie()) into memory, so that they can be pickled.
+        Returns dict that contains tries (tries that are not memory-mapped are returned as they are).
+
+        Args:
+            dict *trie*: part of model that contains tries
+        """
+        if trie.get(self.LAYOUT_KEY) != self.COMPACT_LAYOUT:
+            return trie
+        ret = {k: trie[k] for k in trie if k not in (self.CONTENT_KEY, self.SOURCE_KEY)}
+        ret[self.CONTENT_KEY] = {}
+        for normalizer_name in trie[self.CONTENT_KEY]:
+            content = trie[self.CONTENT_KEY][normalizer_name]
+            ret[self.CONTENT_KEY][normalizer_name] = {
+                self.LABELS_KEY: str(content[self.LABELS_KEY]),
+                self.CHILDREN_KEY: content[self.CHILDREN_KEY] if isinstance(content[self.CHILDREN_KEY], array) else array('I', content[self.CHILDREN_KEY]),
+                self.LEAVES_KEY: content[self.LEAVES_KEY] if isinstance(content[self.LEAVES_KEY], array) else array('I', content[self.LEAVES_KEY]),
+                self.ENTITY_IDS_KEY: content[self.ENTITY_IDS_KEY] if isinstance(content[self.ENTITY_IDS_KEY], array) else array('I', content[self.ENTITY_IDS_KEY]),
+                self.IGNORED_KEY: set(content[self.IGNORED_KEY])
+            }
+            for k in [self.FAILURE_KEY, self.OUTPUT_KEY, self.DEPTH_KEY]:
+                if k in content:
+                    ret[self.CONTENT_KEY][normalizer_name][k] = content[k] if isinstance(content[k], array) else array('I', content[k])
+        return ret
+
+    def convert(self, filename, target_filename, mapped=True):
+        """Loads model from disk and saves it in another format.
+
+        Args:
+            str *filename*: path and filename prefix of the model to load (see load())
+            str *target_filename*: path and filename prefix for names of files that will be written (see save())
+            bool *mapped*: whether write the model in the format that can be memory-mapped, or in the format that is read (see save_trie())
+        """
+        self.load(filename)
+        return self.save(target_filename, mapped)
+
     def store_attributes(self, line_number, internal_id, subtrie, specs, columns):
         """Flags terminus of a trie and writes attributes of an entry to the temporary database.
 
@@ -295,17 +1706,140 @@ class Model(dict):
         if self.ENTITY_KEY not in subtrie:
             subtrie[self.ENTITY_KEY] = []
         subtrie[self.ENTITY_KEY].append(line_number)
-        if self.cursor is not None:
-            for k in specs['fields']:
-                if specs['fields'][k][3]:
+        if self.attrs_cache:
+            self.clear_attrs_cache()
+        self.mark_dirty(self.DATASOURCE_KEY)
+        if self.cursor is not None or self.attrs_store is not None:
+            rows = []
+            for k, field in specs['fields'].items():
+                if field[3]:
                     continue
-                if not specs['fields'][k][1]:
-                    self.cursor.execute('insert into attrs (n, iid, attr_name, attr_value) select ?, ?, ?, ?;', (line_number, internal_id, k, columns[specs['fields'][k][0]]))
+                if not field[1]:
+                    rows.append((line_number, internal_id, k, columns[field[0]]))
                 else:
-                    _ = [self.cursor.execute('insert into attrs (n, iid, attr_name, attr_value) select ?, ?, ?, ?;', (line_number, internal_id, k, s)) for s in set(columns[specs['fields'][k][0]].split(specs['fields'][k][1]))]
+                    rows.extend([(line_number, internal_id, k, s) for s in set(columns[field[0]].split(field[1]))])
+            if self.attrs_store is not None:
+                self.attrs_store.insert(rows)
+            elif self.attrs_rows is None:
+                self.insert_attributes(rows)
+            else:
+                self.attrs_rows.extend(rows)
+                if len(self.attrs_rows) >= self.ATTRS_INSERT_BATCH_SIZE:
+                    self.flush_attributes()
         else:
             self[self.INTERNAL_ID_KEY][line_number] = columns[specs['id'][0]]
 
+    def begin_bulk_insert(self, sort_rows=False):
+        """Switches the database that stores attributes to bulk loading: store_attributes() buffers rows and inserts them in batches of ATTRS_INSERT_BATCH_SIZE, and pragmas in BULK_INSERT_PRAGMAS (no journal, no syncing to disk, large cache) are applied until end_bulk_insert() is called.
+
+        Args:
+            bool *sort_rows*: whether sort each batch of rows by line number, attribute name, and attribute value before insertion (makes index on these columns faster to build if rows are stored in order of line numbers, which is the case for compile)
+
+        NB: if the process crashes before end_bulk_insert() is called, the database may be left incomplete or corrupted.
+        """
+        if self.cursor is None or self.attrs_rows is not None:
+            return False
+        self.attrs_rows = []
+        self.sort_attrs_rows = sort_rows
+        self.saved_pragmas = []
+        for pragma, value in self.BULK_INSERT_PRAGMAS:
+            for row in self.cursor.execute('pragma %s;' % (pragma)):
+                self.saved_pragmas.append((pragma, row[0]))
+            self.cursor.execute('pragma %s = %s;' % (pragma, value))
+        return True
+
+    def flush_attributes(self):
+        """Inserts attributes buffered by store_attributes() into the database."""
+        if self.attrs_rows:
+            if self.sort_attrs_rows:
+                self.attrs_rows.sort(key=lambda row: (row[0], row[2], row[3]))
+            self.insert_attributes(self.attrs_rows)
+            self.attrs_rows = []
+
+    def insert_attributes(self, rows):
+        """Inserts attributes into the database (if names and values of attributes are normalized, new ones are added to lookup tables).
+
+        Args:
+            list *rows*: list of tuples (int *line_number*, int *internal_id*, str *attr_name*, str *attr_value*)
+        """
+        self.mark_dirty(self.DATASOURCE_KEY)
+        if not self.normalized_attrs:
+            self.cursor.executemany('insert into attrs (n, iid, attr_name, attr_value) values (?, ?, ?, ?);', rows)
+            return
+        if self.attr_name_ids is None:
+            self.attr_name_ids = {row[1]: row[0] for row in self.cursor.execute('select id, attr_name from attr_names;')}
+            self.attr_value_ids = {row[1]: row[0] for row in self.cursor.execute('select id, attr_value from attr_values;')}
+        new_names = []
+        new_values = []
+        for row in rows:
+            if row[2] not in self.attr_name_ids:
+                self.attr_name_ids[row[2]] = len(self.attr_name_ids) + 1
+                new_names.append((self.attr_name_ids[row[2]], row[2]))
+            if row[3] not in self.attr_value_ids:
+                self.attr_value_ids[row[3]] = len(self.attr_value_ids) + 1
+                new_values.append((self.attr_value_ids[row[3]], row[3]))
+        self.cursor.executemany('insert into attr_names (id, attr_name) values (?, ?);', new_names)
+        self.cursor.executemany('insert into attr_values (id, attr_value) values (?, ?);', new_values)
+        self.cursor.executemany('insert into attrs_data (n, iid, name_id, value_id) values (?, ?, ?, ?);', [(row[0], row[1], self.attr_name_ids[row[2]], self.attr_value_ids[row[3]]) for row in rows])
+
+    def end_bulk_insert(self):
+        """Inserts remaining buffered attributes, commits, and restores pragmas that were changed by begin_bulk_insert()."""
+        if self.attrs_rows is None:
+            return False
+        self.flush_attributes()
+        self.attrs_rows = None
+        self.connection.commit()
+        for pragma, value in self.saved_pragmas:
+            self.cursor.execute('pragma %s = %s;' % (pragma, value))
+        self.saved_pragmas = []
+        return True
+
+    def delete_attributes(self, line_numbers):
+        """Deletes attributes of given lines from the database (or from *attrs_store*, or IDs kept in memory if model is simple).
+
+        Args:
+            list *line_numbers*: line numbers to delete attributes for
+        """
+        self.clear_attrs_cache()
+        self.mark_dirty(self.DATASOURCE_KEY)
+        if self.attrs_store is not None:
+            self.attrs_store.delete(line_numbers)
+        elif self.cursor is not None:
+            table = 'attrs_data' if self.normalized_attrs else 'attrs'
+            for i in range(0, len(line_numbers), self.ATTRS_BATCH_SIZE):
+                batch = tuple(line_numbers[i:i + self.ATTRS_BATCH_SIZE])
+                self.cursor.execute('delete from %s where n in (%s);' % (table, ', '.join(['?'] * len(batch))), batch)
+        else:
+            for n in line_numbers:
+                self[self.INTERNAL_ID_KEY].pop(n, None)
+        return True
+
+    def get_entity_ids(self, specs):
+        """Restores maps between real entity IDs, line numbers, and internally generated entity IDs of a compiled model from its attributes (see get_dictionary_line()).
+        Returns tuple (dict *entity_ids*, dict *line_numbers*).
+
+        Args:
+            dict *specs*: specs for columns in a file the model was compiled from
+
+        NB: if model is simple, real entity IDs are only known for lines stored since the model was created (they are not saved), and internal IDs are assigned in order of lines unless the model has keywords.
+        """
+        id_name = [k for k in specs['fields'] if specs['fields'][k] == specs['id']][0]
+        if self.attrs_store is not None:
+            rows = self.attrs_store.rows(id_name)
+        elif self.cursor is not None:
+            rows = self.cursor.execute('select n, iid, attr_value from attrs where attr_name = ?;', (id_name,))
+        else:
+            internal_ids = self[self.KEYWORDS_KEY][self.INTERNAL_ID_KEY]
+            rows = [(n, internal_ids[n] if n in internal_ids else None, self[self.INTERNAL_ID_KEY][n]) for n in sorted(self[self.INTERNAL_ID_KEY])]
+        entity_ids = {}
+        line_numbers = {}
+        for n, internal_id, entity_id in rows:
+            if internal_id is None:
+                internal_id = entity_ids[entity_id] if entity_id in entity_ids else len(entity_ids)
+            entity_ids[entity_id] = internal_id
+            line_numbers[n] = internal_id
+        return entity_ids, line_numbers
+
     def get_dictionary_line(self, specs, entity_ids, line_numbers, line_number, line, column_separator, column_enclosure):
         """Extracts values of columns in a file and associates them with internal entity ID.
         Returns tuple (list *column_values*, int *internal_id*).
@@ -350,7 +1884,7 @@ class Model(dict):
             else:
                 normalizer_name = self[self.DEFAULT_NORMALIZER_KEY]
         if normalizer_name is not None:
-            synonym = self[self.NORMALIZER_KEY][normalizer_name].normalize(synonym, word_separator, tokenizer_option)
+            synonym = self.normalize_synonym(normalizer_name, synonym, word_separator, tokenizer_option)
         return synonym, normalizer_name
 
     def next_trie(self, specs, compressed, tokenizer_option, word_separator):
@@ -369,6 +1903,154 @@ class Model(dict):
             self.SPECS_KEY: specs,
             self.COMPRESSED_KEY: int(compressed),
             self.TOKENIZER_OPTION_KEY: tokenizer_option,
-            self.WORD_SEPARATOR_KEY: word_separator
+            self.WORD_SEPARATOR_KEY: word_separator,
+            self.USED_NORMALIZERS_KEY: []
         }
         return new_trie
+
+class ModelRegistry():
+    """This class hosts multiple models in one process: loads them by name when they are used, and keeps memory they take within a budget by unloading models (or tries of them) that are not in use."""
+
+    def __init__(self, memory_budget=0):
+        """Creates ModelRegistry instance.
+
+        Args:
+            int *memory_budget*: maximum number of bytes that loaded models may take (see Model.memory_usage()), least recently used models that are not in use are unloaded to stay within it (default 0, no limit)
+        """
+        self.memory_budget = memory_budget
+        self.specs = {}
+        self.models = OrderedDict()
+        self.references = {}
+        self.sizes = {}
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        """Enter `with`."""
+        return self
+
+    def __exit__(self, ex_type, ex_value, ex_traceback):
+        """Exit `with`."""
+        self.destroy()
+
+    def register(self, name, filename, **kwargs):
+        """Registers model saved on disk (see Model.save()) under a name, model is not loaded until it is used.
+
+        Args:
+            str *name*: name of the model
+            str *filename*: path and name of the model files
+            dict *kwargs*: keyword arguments passed to Model() when model is loaded, for example lazy_tries=True lets registry unload tries of a model rather than the whole model (thread_safe=True unless given, so that model can be used by any thread)
+        """
+        with self.lock:
+            if name in self.specs:
+                self.unload(name)
+            self.specs[name] = (filename, dict({'thread_safe': True}, **kwargs))
+        return True
+
+    def acquire(self, name):
+        """Returns model registered under a name, loading it if needed, and marks it as in use until release() is called as many times as acquire().
+        Models in use are never unloaded by the registry.
+
+        Args:
+            str *name*: name of the model
+        """
+        with self.lock:
+            if name not in self.models:
+                if name not in self.specs:
+                    raise KeyError('Model "%s" is not registered' % (name))
+                filename, kwargs = self.specs[name]
+                self.models[name] = Model(filename=filename, **kwargs)
+                self.references[name] = 0
+                logging.debug('Loaded model "%s" from "%s"' % (name, filename))
+            self.models.move_to_end(name)
+            self.references[name] += 1
+            model = self.models[name]
+            if name not in self.sizes:
+                self.sizes[name] = model.memory_usage()['total']
+            self.trim()
+        return model
+
+    def release(self, name):
+        """Marks model acquired with acquire() as no longer used by the caller.
+
+        Args:
+            str *name*: name of the model
+        """
+        with self.lock:
+            if self.references.get(name, 0) < 1:
+                return False
+            self.references[name] -= 1
+            if self.references[name] == 0:
+                self.sizes[name] = self.models[name].memory_usage()['total']
+                self.trim()
+        return True
+
+    @contextmanager
+    def use(self, name):
+        """Context manager that acquires model for the duration of `with` block, and releases it at the end.
+
+        Args:
+            str *name*: name of the model
+        """
+        model = self.acquire(name)
+        try:
+            yield model
+        finally:
+            self.release(name)
+
+    def unload(self, name):
+        """Unloads model, unless it is in use. Returns True if model has been unloaded.
+
+        Args:
+            str *name*: name of the model
+        """
+        with self.lock:
+            if name not in self.models or self.references[name] > 0:
+                return False
+            model = self.models.pop(name)
+            del self.references[name]
+            del self.sizes[name]
+            model.destroy()
+            logging.debug('Unloaded model "%s"' % (name))
+        return True
+
+    def memory_usage(self):
+        """Returns dict {name: dict} with memory usage of each loaded model (see Model.memory_usage())."""
+        with self.lock:
+            usage = {name: self.models[name].memory_usage() for name in self.models}
+            for name in usage:
+                self.sizes[name] = usage[name]['total']
+        return usage
+
+    def trim(self):
+        """Unloads least recently used models that are not in use until memory they take is within memory_budget.
+        Tries that have been read lazily (see Model.get_trie()) are unloaded first, then whole models.
+        Returns number of bytes taken by loaded models.
+        """
+        with self.lock:
+            total = sum(self.sizes.values())
+            if self.memory_budget <= 0 or total <= self.memory_budget:
+                return total
+            idle = [name for name in self.models if self.references[name] == 0]
+            for name in idle:
+                model = self.models[name]
+                unloaded = [model.unload_trie(*key) for key in [(dictionary_number, normalizer_name) for dictionary_number in range(len(model[model.DICTIONARY_KEY])) for normalizer_name in list(model[model.DICTIONARY_KEY][dictionary_number].get(model.CONTENT_KEY, {}))]]
+                if any(unloaded):
+                    model.trie_usage.clear()
+                    self.sizes[name] = model.memory_usage()['total']
+                    total = sum(self.sizes.values())
+                    if total <= self.memory_budget:
+                        return total
+            for name in idle:
+                self.unload(name)
+                total = sum(self.sizes.values())
+                if total <= self.memory_budget:
+                    break
+        return total
+
+    def destroy(self):
+        """Unloads all models regardless of whether they are in use."""
+        with self.lock:
+            for name in list(self.models):
+                self.references[name] = 0
+                self.unload(name)
+        return True
@@ -7,6 +7,7 @@ cdef class Utility():
     cdef public logger
     cdef public callback_status
     cdef public callback_progress
+    cdef public shard_workers
 
     cpdef push_message(
         self,
@@ -60,7 +61,10 @@ cdef class Utility():
         content=cython.dict,
         tokenizer_key=cython.str,
         trie=cython.dict,
-        character_index=cython.int
+        character_index=cython.int,
+        node=cython.long,
+        token_node=cython.dict,
+        dictionary_number=cython.int
     )
     cpdef ignore_node(
         self,
@@ -97,7 +101,12 @@ cdef class Utility():
         bint compressed,
         str column_separator,
         str column_enclosure,
-        int tokenizer_option
+        int tokenizer_option,
+        bint compact=*,
+        int workers=*,
+        bint sort_attrs=*,
+        tuple keywords=*,
+        bint token_level=*
     )
 
     @cython.locals(
@@ -106,18 +115,13 @@ cdef class Utility():
         this_progress_position=cython.int,
         last_progress_position=cython.int,
         entity_ids=cython.dict,
-        internal_id_map=cython.dict,
-        synonyms=cython.dict,
+        collected=cython.tuple,
         line_count=cython.int,
         chars_read=cython.int,
         line=cython.str,
         columns=cython.list,
         internal_id=cython.int,
-        synonym=cython.str,
-        overlapping_ids=cython.dict,
-        s=cython.str,
-        tokens=cython.list,
-        keywords=cython.dict
+        synonym=cython.str
     )
     cpdef dict make_keywords(
         self,
@@ -132,10 +136,45 @@ cdef class Utility():
         int tokenizer_option
     )
 
+    cpdef tuple start_keywords(
+        self
+    )
+
+    @cython.locals(
+        synonyms=cython.dict,
+        tokens=cython.dict,
+        internal_id_map=cython.dict
+    )
+    cpdef collect_keywords(
+        self,
+        tuple collected,
+        int line_number,
+        int internal_id,
+        str synonym,
+        str word_separator
+    )
+
+    @cython.locals(
+        synonyms=cython.dict,
+        tokens=cython.dict,
+        internal_id_map=cython.dict,
+        overlapping_ids=cython.dict,
+        s=cython.str,
+        internal_id=cython.int,
+        keywords=cython.dict
+    )
+    cpdef dict finish_keywords(
+        self,
+        model,
+        tuple collected,
+        bint disambiguate_all
+    )
+
     @cython.locals(
         specs=cython.dict,
         tries=cython.list,
         line_numbers=cython.dict,
+        collected=cython.tuple,
         keywords=cython.dict
     )
     cpdef bint compile_model(
@@ -150,9 +189,146 @@ cdef class Utility():
         int item_limit=*,
         int tokenizer_option=*,
         bint include_keywords=*,
+        bint disambiguate_all=*,
+        bint compact=*,
+        int workers=*,
+        bint sort_attrs=*,
+        bint failure_links=*,
+        bint token_level=*
+    )
+
+    @cython.locals(
+        specs=cython.dict,
+        word_separator=cython.str,
+        tokenizer_option=cython.int,
+        entity_ids=cython.dict,
+        line_numbers=cython.dict,
+        line_number=cython.int,
+        next_internal_id=cython.int,
+        last_dictionary_number=cython.int,
+        branches=cython.dict,
+        added_lines=cython.list,
+        removed_lines=cython.list,
+        internal_ids=cython.set,
+        labels=cython.set,
+        line=cython.str,
+        operation=cython.str,
+        columns=cython.list,
+        synonym=cython.str,
+        normalizer_name=cython.str,
+        internal_id=cython.int,
+        dictionary_number=cython.int,
+        subtrie=dict,
+        depth=cython.int,
+        branch=dict,
+        node=dict,
+        character=cython.str,
+        kept=cython.list,
+        internal_id_map=cython.dict
+    )
+    cpdef tuple update_model(
+        self,
+        model,
+        str filename,
+        str column_separator,
+        str column_enclosure,
         bint disambiguate_all=*
     )
 
+    @cython.locals(
+        string_so_far=cython.str,
+        character=cython.str,
+        node=cython.long,
+        token_node=cython.dict
+    )
+    cpdef list find_label_ids(
+        self,
+        model,
+        dict trie,
+        str normalizer_name,
+        str label
+    )
+
+    @cython.locals(
+        trie=cython.dict,
+        node=dict,
+        depth=cython.int,
+        branch=dict,
+        branch_depth=cython.int,
+        character=cython.str
+    )
+    cpdef tuple edit_subtrie(
+        self,
+        model,
+        dict branches,
+        int dictionary_number,
+        str normalizer_name,
+        str label,
+        bint removal
+    )
+
+    @cython.locals(
+        packed=cython.dict
+    )
+    cpdef pack_branch(
+        self,
+        model,
+        dict branch,
+        str character,
+        dict subtrie
+    )
+
+    @cython.locals(
+        dictionary_number=cython.int,
+        normalizer_name=cython.str,
+        trie=cython.dict,
+        compact=cython.dict
+    )
+    cpdef commit_subtries(
+        self,
+        model,
+        dict branches
+    )
+
+    @cython.locals(
+        line_labels=cython.dict,
+        trie=cython.dict,
+        normalizer_name=cython.str,
+        label=cython.str,
+        line_numbers=cython.list
+    )
+    cpdef dict index_labels(
+        self,
+        model
+    )
+
+    @cython.locals(
+        internal_ids=cython.set,
+        trie=cython.dict,
+        normalizer_name=cython.str
+    )
+    cpdef set find_label_entities(
+        self,
+        model,
+        str label
+    )
+
+    @cython.locals(
+        synonyms=cython.dict,
+        entity_labels=cython.dict,
+        line_labels=cython.dict,
+        label=cython.str,
+        affected_ids=cython.set
+    )
+    cpdef bint update_keywords(
+        self,
+        model,
+        set internal_ids,
+        set labels,
+        str word_separator,
+        bint disambiguate_all
+    )
+
     @cython.locals(
         branches=cython.list,
         radix=cython.str,
@@ -171,10 +347,20 @@ cdef class Utility():
         attributes=cython.dict,
         include_attrs=cython.set,
         exclude_attrs=cython.set,
+        unique_ids=cython.list,
+        batch_size=cython.int,
+        i=cython.int,
+        batch=cython.tuple,
+        placeholders=cython.str,
         n=cython.int,
-        ns=cython.set,
+        ns=cython.list,
         attr_name=cython.str,
-        attr_value=cython.str
+        attr_value=cython.str,
+        include_params=cython.tuple,
+        exclude_params=cython.tuple,
+        attrs_out_params=cython.tuple,
+        include_bitset=bytearray,
+        exclude_bitset=bytearray
     )
     cpdef dict unpack_attributes(
         self,
@@ -184,11 +370,14 @@ cdef class Utility():
         str include_query,
         str exclude_query,
         bint process_exclude,
-        str attrs_out_query
+        str attrs_out_query,
+        dict attrs_filter=*
     )
 
     @cython.locals(
-        this_trie_leaf=cython.dict
+        this_trie_leaf=cython.dict,
+        cache_key=cython.tuple,
+        attributes=cython.dict
     )
     cpdef dict check_attrs(
         self,
@@ -198,18 +387,66 @@ cdef class Utility():
         str include_query,
         str exclude_query,
         bint process_exclude,
-        str attrs_out_query
+        str attrs_out_query,
+        dict attrs_filter=*
+    )
+
+    cpdef list spot_entities(
+        self,
+        model,
+        str source_string,
+        str normalizer_name,
+        str include_query=*,
+        str exclude_query=*,
+        bint process_exclude=*,
+        str attrs_out_query=*,
+        int progress_from=*,
+        int progress_to=*,
+        dict attrs_filter=*
     )
 
     @cython.locals(
-        rets=cython.list,
-        this_progress_position=cython.int,
-        last_progress_position=cython.int,
+        rets=cython.dict,
+        spotted=cython.list,
         total_tries=cython.int,
+        total_steps=cython.int,
         progress_share=cython.int,
-        trie_increment=cython.int,
+        current_step=cython.int,
+        step_from=cython.int,
+        step_to=cython.int,
         current_trie_index=cython.int,
-        trie=cython.dict,
+        normalizer_name=cython.str,
+        trie=cython.dict
+    )
+    cpdef dict spot_normalized_entities(
+        self,
+        model,
+        dict normalized_strings,
+        str include_query=*,
+        str exclude_query=*,
+        bint process_exclude=*,
+        str attrs_out_query=*,
+        int progress_from=*,
+        int progress_to=*,
+        dict attrs_filter=*
+    )
+
+    cpdef list spot_trie_entities(
+        self,
+        model,
+        dict trie,
+        str source_string,
+        str normalizer_name,
+        str include_query=*,
+        str exclude_query=*,
+        bint process_exclude=*,
+        str attrs_out_query=*,
+        int progress_from=*,
+        int progress_to=*,
+        dict attrs_filter=*
+    )
+
+    @cython.locals(
         ret=cython.list,
         word_separator=cython.str,
         start_index=cython.int,
@@ -218,18 +455,170 @@ cdef class Utility():
         reading_entity=cython.bint,
         trie_is_compressed=cython.bint,
         subtrie=cython.dict,
+        radix=cython.str,
+        radix_index=cython.int,
+        radix_length=cython.int,
+        matched=cython.bint,
         shorter_alternative=cython.tuple,
         current_index=cython.int,
         temporary_index=cython.int,
         total_length=cython.int,
+        progress_share=cython.int,
         increment_chars=cython.int,
+        this_progress_position=cython.int,
+        last_progress_position=cython.int,
         character=cython.str,
         found_object=cython.dict,
         identified=cython.tuple
     )
-    cpdef list spot_entities(
+    cpdef list spot_dict_entities(
+        self,
+        model,
+        dict trie,
+        str source_string,
+        str normalizer_name,
+        str include_query=*,
+        str exclude_query=*,
+        bint process_exclude=*,
+        str attrs_out_query=*,
+        int progress_from=*,
+        int progress_to=*,
+        dict attrs_filter=*
+    )
+
+    @cython.locals(
+        node=cython.long,
+        character=cython.str
+    )
+    cpdef long find_compact_node(
+        self,
+        model,
+        dict compact,
+        str label
+    )
+
+    @cython.locals(
+        ret=cython.list,
+        content=cython.dict,
+        ignored=cython.set,
+        word_separator=cython.str,
+        start_index=cython.int,
+        end_index=cython.int,
+        string_so_far=cython.str,
+        reading_entity=cython.bint,
+        node=cython.long,
+        child=cython.long,
+        shorter_alternative=cython.tuple,
+        current_index=cython.int,
+        temporary_index=cython.int,
+        total_length=cython.int,
+        progress_share=cython.int,
+        increment_chars=cython.int,
+        this_progress_position=cython.int,
+        last_progress_position=cython.int,
+        character=cython.str,
+        found_object=cython.dict
+    )
+    cpdef list spot_compact_entities(
+        self,
+        model,
+        dict trie,
+        str source_string,
+        str normalizer_name,
+        str include_query=*,
+        str exclude_query=*,
+        bint process_exclude=*,
+        str attrs_out_query=*,
+        int progress_from=*,
+        int progress_to=*,
+        dict attrs_filter=*
+    )
+
+    @cython.locals(
+        ret=cython.list,
+        content=cython.dict,
+        ignored=cython.set,
+        word_separator=cython.str,
+        candidates=cython.dict,
+        starts=cython.list,
+        nodes=cython.list,
+        last_end=cython.int,
+        state=cython.long,
+        node=cython.long,
+        child=cython.long,
+        start_index=cython.int,
+        end_index=cython.int,
+        earliest_index=cython.int,
+        current_index=cython.int,
+        total_length=cython.int,
+        progress_share=cython.int,
+        increment_chars=cython.int,
+        this_progress_position=cython.int,
+        last_progress_position=cython.int,
+        character=cython.str,
+        found_object=cython.dict
+    )
+    cpdef list spot_linked_entities(
+        self,
+        model,
+        dict trie,
+        str source_string,
+        str normalizer_name,
+        str include_query=*,
+        str exclude_query=*,
+        bint process_exclude=*,
+        str attrs_out_query=*,
+        int progress_from=*,
+        int progress_to=*,
+        dict attrs_filter=*
+    )
+
+    @cython.locals(
+        vocabulary=cython.dict,
+        token_ids=cython.list,
+        node=cython.dict,
+        word=cython.str,
+        word_index=cython.int
+    )
+    cpdef dict find_token_node(
+        self,
+        model,
+        dict subtrie,
+        str label
+    )
+
+    @cython.locals(
+        ret=cython.list,
+        content=cython.dict,
+        vocabulary=cython.dict,
+        tokens=cython.dict,
+        word_separator=cython.str,
+        separator_length=cython.int,
+        words=cython.list,
+        token_ids=cython.list,
+        offsets=cython.list,
+        offset=cython.int,
+        word=cython.str,
+        leaves=cython.list,
+        node=cython.dict,
+        tail_length=cython.int,
+        matched=cython.bint,
+        i=cython.int,
+        word_index=cython.int,
+        end_word=cython.int,
+        end_index=cython.int,
+        total_words=cython.int,
+        total_length=cython.int,
+        progress_share=cython.int,
+        increment_words=cython.int,
+        this_progress_position=cython.int,
+        last_progress_position=cython.int,
+        found_object=cython.dict
+    )
+    cpdef list spot_token_entities(
         self,
         model,
+        dict trie,
         str source_string,
         str normalizer_name,
         str include_query=*,
@@ -237,7 +626,8 @@ cdef class Utility():
         bint process_exclude=*,
         str attrs_out_query=*,
         int progress_from=*,
-        int progress_to=*
+        int progress_to=*,
+        dict attrs_filter=*
     )
 
     @cython.locals(
@@ -332,26 +722,26 @@ cdef class Utility():
 
     @cython.locals(
         attributes=cython.dict,
+        conditions=cython.dict,
         action=cython.str,
-        process_exclude=cython.bint,
-        include_set=cython.set,
-        include_query=cython.str,
-        attr_name=cython.str,
-        attr_value=cython.str,
-        exclude_set=cython.set,
-        exclude_query=cython.str,
-        attrs_out_query=cython.str,
+        key=cython.str,
+        attrs_names=cython.tuple,
+        attrs_filter=cython.dict
+    )
+    cpdef dict compile_attrs_filter(
+        self,
+        dict attrs_where=*,
+        list attrs_out=*,
+        bint in_memory=*
+    )
+
+    @cython.locals(
         rets=cython.list,
         total_normalizers=cython.int,
-        spot_progress_share=cython.int,
-        current_normalizer_index=cython.int,
         normalizer_name=cython.str,
-        normalized_string=cython.str,
-        character_map=cython.list,
-        r_character_map=cython.list,
-        progress_from=cython.int,
-        progress_to=cython.int,
-        parsed=cython.list,
+        normalized_strings=cython.dict,
+        character_maps=cython.dict,
+        spotted=cython.dict,
         layers=cython.list,
         spans=cython.dict,
         locations=cython.list,
@@ -362,5 +752,39 @@ cdef class Utility():
         model,
         str source_string,
         dict attrs_where=*,
-        list attrs_out=*
+        list attrs_out=*,
+        dict attrs_filter=*
+    )
+
+    @cython.locals(
+        initargs=cython.tuple
+    )
+    cpdef parse_many(
+        self,
+        model,
+        texts,
+        int workers=*,
+        int chunksize=*,
+        dict attrs_where=*,
+        list attrs_out=*,
+        dict attrs_filter=*,
+        str model_filename=*,
+        bint ordered=*
+    )
+
+    @cython.locals(
+        initargs=cython.tuple,
+        processes=cython.list
+    )
+    cpdef start_shard_workers(
+        self,
+        model,
+        int workers=*
+    )
+
+    @cython.locals(
+        processes=cython.list
+    )
+    cpdef stop_shard_workers(
+        self
     )
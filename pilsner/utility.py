@@ -1,5 +1,9 @@
+import io
+import heapq
 import logging
 import os
+import multiprocessing
+import queue
 
 class Utility():
     """This class is the utility for named entity recognition."""
@@ -24,6 +28,7 @@ class Utility():
             self.logger('Debug mode is on')
         self.callback_status = callback_status
         self.callback_progress = callback_progress
+        self.shard_workers = None
         logging.debug('Utility class has been initialized')
 
     def __del__(self):
@@ -136,8 +141,24 @@ class Utility():
         label_length = int(len(label))
         string_so_far = ''
         character_index = 0
-        for section in model[model.DICTIONARY_KEY]:
+        model.load_tries()
+        for dictionary_number in range(len(model[model.DICTIONARY_KEY])):
+            section = model[model.DICTIONARY_KEY][dictionary_number]
             content = section[model.CONTENT_KEY]
+            if section.get(model.LAYOUT_KEY) == model.COMPACT_LAYOUT:
+                for tokenizer_key in content:
+                    node = self.find_compact_node(model, content[tokenizer_key], label)
+                    if node >= 0 and content[tokenizer_key][model.LEAVES_KEY][node] < content[tokenizer_key][model.LEAVES_KEY][node + 1]:
+                        content[tokenizer_key][model.IGNORED_KEY].add(node)
+                        model.mark_dirty(dictionary_number)
+                continue
+            if section.get(model.LAYOUT_KEY) == model.TOKEN_LAYOUT:
+                for tokenizer_key in content:
+                    token_node = self.find_token_node(model, content[tokenizer_key], label)
+                    if token_node is not None and model.ENTITY_KEY in token_node:
+                        token_node[model.IGNORE_KEY] = []
+                        model.mark_dirty(dictionary_number)
+                continue
             for tokenizer_key in content:
                 trie = content[tokenizer_key]
                 for character_index in range(0, label_length):
@@ -147,8 +168,9 @@ class Utility():
                         string_so_far = ''
                 if character_index == label_length - 1 and model.ENTITY_KEY in trie and string_so_far == '':
                     trie[model.IGNORE_KEY] = []
+                    model.mark_dirty(dictionary_number)
 
-    def make_recognizer(self, model, filename, specs, word_separator, item_limit, compressed, column_separator, column_enclosure, tokenizer_option):
+    def make_recognizer(self, model, filename, specs, word_separator, item_limit, compressed, column_separator, column_enclosure, tokenizer_option, compact=False, workers=1, sort_attrs=False, keywords=None, token_level=False):
         """Reads tab-delimited text file, populates dict objects representing tries, and fills database associated with a given Model instance according to provided specs.
         Returns tuple(list *tries*, dict *line_numbers*) where *tries* are populated dicts representing tries, *line_numbers* is dict that maps line numbers from the text file to internally generated entity IDs.
 
@@ -162,6 +184,15 @@ class Utility():
             str *column_separator*: delimiter to split columns
             str *column_enclosure*: any string that columns are supposed to be trimmed of
             int *tokenizer_option*: tokenizer mode (see documentation for normalization for details)
+            bool *compact*: whether given tries must be converted into compact array-backed representation (see Model.compact_subtrie())
+            int *workers*: number of worker processes that normalize synonyms (default 1, no worker processes; 0 means as many as there are CPUs)
+            bool *sort_attrs*: whether sort attributes by line number, attribute name, and attribute value before they are inserted into the database (see Model.begin_bulk_insert())
+            tuple *keywords*: collection of keywords to fill while the text file is read (see start_keywords()), so that make_keywords() does not have to read it again
+            bool *token_level*: whether given tries must be converted into token tries keyed by word IDs (see Model.tokenize_subtrie()); *compact* is then ignored
+
+        NB: attributes are inserted in bulk, and index on them is created once all of them are inserted.
+        With *workers* other than 1, the text file is split into ranges of lines that are normalized by worker processes, while tries and the database are populated by this process in the same order as without workers.
+        Worker processes are forked from this process, which is not available on all platforms.
         """
         # TODO: review for refactoring
         self.logger('Making recognizer using %s' % (filename))
@@ -173,16 +204,25 @@ class Utility():
         this_progress_position = 0
         last_progress_position = 0
         if model.connection is not None:
-            rows = model.cursor.execute('select 0 where not exists (select name from sqlite_master where type = \'table\' and name = \'attrs\');')
+            rows = model.cursor.execute('select 0 where not exists (select name from sqlite_master where type in (\'table\', \'view\') and name = \'attrs\');')
             for _ in rows:
                 model.create_recognizer_schema(model.cursor)
                 break
+            model.begin_bulk_insert(sort_attrs)
+        if workers <= 0:
+            workers = os.cpu_count() or 1
         with open(filename, mode='r', encoding='utf8') as f:
             ret = []
             line_count = 0
             line_number = 0
             chars_read = 0
             trie = model.next_trie(specs, compressed, tokenizer_option, word_separator)
+            synonyms = None
+            if workers > 1:
+                assert 'fork' in multiprocessing.get_all_start_methods(), 'Model cannot be shared with worker processes on this platform'
+                self.logger('Normalizing synonyms with %d worker(s)...' % (workers))
+                initargs = (model, specs, word_separator, column_separator, column_enclosure, tokenizer_option)
+                synonyms = normalize_in_processes(multiprocessing.get_context('fork'), workers, initargs, filename)
             for line in f:
                 chars_read += int(len(line))
                 this_progress_position = int(chars_read / increment_bytes)
@@ -190,24 +230,34 @@ class Utility():
                     last_progress_position = this_progress_position
                     self.push_message(int(100 * chars_read / total_bytes), self.callback_progress)
                 if item_limit > 0 and line_count == item_limit:
-                    packed = model.pack_trie(trie, compressed)
+                    packed = model.tokenize_trie(trie, False) if token_level else model.compact_trie(trie, False) if compact else model.pack_trie(trie, compressed)
                     ret.append(packed)
                     trie = model.next_trie(specs, compressed, tokenizer_option, word_separator)
                     self.logger('Lines read: %d' % (line_count))
                     line_count = 0
                 columns, internal_id = model.get_dictionary_line(specs, entity_ids, line_numbers, line_number, line, column_separator, column_enclosure)
-                synonym, normalizer_name = model.get_dictionary_synonym(columns, specs, word_separator, tokenizer_option)
+                if synonyms is None:
+                    synonym, normalizer_name = model.get_dictionary_synonym(columns, specs, word_separator, tokenizer_option)
+                else:
+                    synonym, normalizer_name = next(synonyms)
                 subtrie = trie[model.CONTENT_KEY][normalizer_name]
                 self.insert_node(synonym, line_number, internal_id, subtrie, specs, columns, model)
+                if normalizer_name not in trie[model.USED_NORMALIZERS_KEY]:
+                    trie[model.USED_NORMALIZERS_KEY].append(normalizer_name)
+                if keywords is not None:
+                    self.collect_keywords(keywords, line_number, internal_id, synonym, word_separator)
                 line_count += 1
                 line_number += 1
+            if synonyms is not None:
+                synonyms.close()
         if line_count > 0 and len(trie) > 3:
-            packed = model.pack_trie(trie, compressed)
+            packed = model.tokenize_trie(trie, False) if token_level else model.compact_trie(trie, False) if compact else model.pack_trie(trie, compressed)
             ret.append(packed)
             self.logger('Lines read: %d' % (line_count))
         if model.connection is not None:
-            model.connection.commit()
-            model.cursor.execute('create index ix_attrs_n_attr_name_attr_value on attrs (n asc, attr_name asc, attr_value asc);')
+            model.flush_attributes()
+            model.create_recognizer_index(model.cursor)
+            model.end_bulk_insert()
         self.logger('Recognizer completed.')
         return ret, line_numbers
 
@@ -233,8 +283,7 @@ class Utility():
         this_progress_position = 0
         last_progress_position = 0
         entity_ids = {}
-        internal_id_map = {}
-        synonyms = {}
+        collected = self.start_keywords()
         with open(filename, mode='r', encoding='utf8') as f:
             line_count = 0
             chars_read = 0
@@ -245,34 +294,65 @@ class Utility():
                     last_progress_position = this_progress_position
                     self.push_message(int(100 * chars_read / total_bytes), self.callback_progress)
                 columns, internal_id = model.get_dictionary_line(specs, entity_ids, line_numbers, line_count, line, column_separator, column_enclosure)
-                internal_id_map[line_count] = internal_id
                 synonym = model.get_dictionary_synonym(columns, specs, word_separator, tokenizer_option)[0]
-                if synonym not in synonyms:
-                    synonyms[synonym] = set()
-                synonyms[synonym].add(internal_id)
+                self.collect_keywords(collected, line_count, internal_id, synonym, word_separator)
                 line_count += 1
+        return self.finish_keywords(model, collected, disambiguate_all)
+
+    def start_keywords(self):
+        """Returns empty collection of keywords to be filled by collect_keywords() and turned into keywords by finish_keywords().
+
+        Data structure for returned value:
+            (
+                {str synonym: set(int internal_ids)},
+                {int internal_id: set(str tokens)},
+                {int line_number: int internal_id}
+            )
+        """
+        return ({}, {}, {})
+
+    def collect_keywords(self, collected, line_number, internal_id, synonym, word_separator):
+        """Adds a line of the dictionary to collection of keywords.
+
+        Args:
+            tuple *collected*: collection of keywords (see start_keywords())
+            int *line_number*: number of the line in the text file
+            int *internal_id*: internally generated entity ID of the line
+            str *synonym*: normalized synonym of the line
+            str *word_separator*: string considered to be the word delimiter
+        """
+        synonyms, tokens, internal_id_map = collected
+        internal_id_map[line_number] = internal_id
+        if synonym not in synonyms:
+            synonyms[synonym] = set()
+        synonyms[synonym].add(internal_id)
+        if internal_id not in tokens:
+            tokens[internal_id] = set()
+        tokens[internal_id].update(synonym.split(word_separator))
+
+    def finish_keywords(self, model, collected, disambiguate_all):
+        """Turns collection of keywords into dictionary of keywords that can be plugged into model (only entities that have conflicting synonyms are kept unless *disambiguate_all* is True).
+        Returns dict object can be plugged into model.
+
+        Args:
+            Model *model*: Model instance to use
+            tuple *collected*: collection of keywords (see start_keywords())
+            bool *disambiguate_all*: whether generate keywords for all entities or only for those having conflicting synonyms
+        """
+        synonyms, tokens, internal_id_map = collected
         overlapping_ids = {}
         for s in synonyms:
             if len(synonyms[s]) > 1 or disambiguate_all:
                 for internal_id in synonyms[s]:
-                    overlapping_ids[internal_id] = set()
+                    overlapping_ids[internal_id] = tokens[internal_id]
         synonyms.clear()
-        entity_ids.clear()
-        with open(filename, mode='r', encoding='utf8') as f:
-            line_count = 0
-            for line in f:
-                columns, internal_id = model.get_dictionary_line(specs, entity_ids, line_numbers, line_count, line, column_separator, column_enclosure)
-                if internal_id in overlapping_ids:
-                    synonym = model.get_dictionary_synonym(columns, specs, word_separator, tokenizer_option)[0]
-                    tokens = synonym.split(word_separator)
-                    overlapping_ids[internal_id] = overlapping_ids[internal_id].union(set(tokens))
-                line_count += 1
-            # TODO: only leave tokens unique for a given internal_id (?)
+        tokens.clear()
+        # TODO: only leave tokens unique for a given internal_id (?)
         keywords = {model.CONTENT_KEY: overlapping_ids, model.INTERNAL_ID_KEY: internal_id_map}
         self.logger('Done compiling keywords.')
         return keywords
 
-    def compile_model(self, model, filename, fields, word_separator, column_separator, column_enclosure, compressed=True, item_limit=0, tokenizer_option=0, include_keywords=False, disambiguate_all=False):
+    def compile_model(self, model, filename, fields, word_separator, column_separator, column_enclosure, compressed=True, item_limit=0, tokenizer_option=0, include_keywords=False, disambiguate_all=False, compact=False, workers=1, sort_attrs=False, failure_links=False, token_level=False):
         """Populates given Model instance with tries and keywords.
 
         Args:
@@ -287,6 +367,11 @@ class Utility():
             int *tokenizer_option*: tokenizer mode (see documentation for normalization for details)
             bool *include_keywords*: whether generate keywords at all or not
             bool *disambiguate_all*: whether generate keywords for all entities or only for those having conflicting synonyms
+            bool *compact*: whether store tries in compact array-backed representation rather than in dict objects (*compressed* is then ignored)
+            int *workers*: number of worker processes that normalize synonyms while tries are made (default 1, no worker processes; 0 means as many as there are CPUs; see make_recognizer())
+            bool *sort_attrs*: whether sort attributes by line number, attribute name, and attribute value before they are inserted into the database
+            bool *failure_links*: whether add failure links to compact tries, so that strings are scanned by spot_linked_entities() (implies *compact*; see Model.link_subtrie())
+            bool *token_level*: whether store tries as token tries keyed by word IDs, so that strings are scanned word by word by spot_token_entities() (*compressed*, *compact*, and *failure_links* are then ignored; see Model.tokenize_subtrie())
 
         Data structure for *fields* argument (also see compile_dict_specs() function):
             [
@@ -301,12 +386,300 @@ class Utility():
             ]
         """
         specs = self.compile_dict_specs(fields)
-        tries, line_numbers = self.make_recognizer(model, filename, specs, word_separator, item_limit, compressed, column_separator, column_enclosure, tokenizer_option)
+        collected = self.start_keywords() if include_keywords else None
+        tries, line_numbers = self.make_recognizer(model, filename, specs, word_separator, item_limit, compressed, column_separator, column_enclosure, tokenizer_option, compact or failure_links, workers, sort_attrs, collected, token_level)
+        if failure_links and not token_level:
+            tries = [model.link_trie(trie) for trie in tries]
         keywords = {model.CONTENT_KEY: {}, model.INTERNAL_ID_KEY: {}}
         if include_keywords:
-            keywords = self.make_keywords(model, filename, specs, line_numbers, word_separator, disambiguate_all, column_separator, column_enclosure, tokenizer_option)
+            keywords = self.finish_keywords(model, collected, disambiguate_all)
         model[model.DICTIONARY_KEY] = tries
         model[model.KEYWORDS_KEY] = keywords
+        model.mark_dirty()
+        if model.normalization_cache_size > 0:
+            self.logger('Normalization cache: %d hit(s), %d miss(es), %d eviction(s)' % (model.normalization_cache_stats['hits'], model.normalization_cache_stats['misses'], model.normalization_cache_stats['evictions']))
+        model.clear_normalization_cache()
+        return True
+
+    def update_model(self, model, filename, column_separator, column_enclosure, disambiguate_all=False):
+        """Applies delta file with added and removed rows to compiled model, so that the model does not have to be compiled again.
+        Only branches of tries that labels are added to or removed from are rebuilt (see edit_subtrie()), and only attributes of added and removed rows are written to or deleted from the database.
+        Returns tuple (int *added*, int *removed*) with numbers of lines added to and removed from tries.
+
+        Args:
+            Model *model*: compiled Model instance to update
+            str *filename*: path and name of tab-delimited text file with the delta
+            str *column_separator*: delimiter to split columns
+            str *column_enclosure*: any string that columns are supposed to be trimmed of
+            bool *disambiguate_all*: whether keywords are generated for all entities or only for those having conflicting synonyms (must be the same as when the model was compiled)
+
+        Each line of the delta file is "+" (add) or "-" (remove), column separator, and a row with the same columns as in the file the model was compiled from.
+        Added rows are appended to the last trie of the model. Removed rows are looked up by entity ID, normalizer tag, and label, and all lines that match are removed from all tries.
+        If the model has keywords, keywords of entities that have their synonyms added or removed, or share them with other entities, are made again from labels of their lines (see index_labels() and update_keywords()).
+
+        NB: *model.normalizer_map* must be the same as when the model was compiled (it is not saved with the model).
+        Labels of lines are kept with keywords of the model once it is updated (they are not written to memory-mapped keywords, so they are indexed again after such keywords are loaded).
+        Compact tries (see Model.compact_subtrie()) and token tries (see Model.tokenize_subtrie()) are converted into dict objects and back once for each normalization unit that has labels added or removed.
+        """
+        assert len(model[model.DICTIONARY_KEY]) > 0, 'Model is empty, nothing to update'
+        model.load_tries()
+        self.logger('Updating model using %s' % (filename))
+        self.push_message('Updating model using %s' % (filename), self.callback_status)
+        specs = model[model.DICTIONARY_KEY][0][model.SPECS_KEY]
+        word_separator = model[model.DICTIONARY_KEY][0][model.WORD_SEPARATOR_KEY]
+        tokenizer_option = model[model.DICTIONARY_KEY][0][model.TOKENIZER_OPTION_KEY]
+        entity_ids, line_numbers = model.get_entity_ids(specs)
+        line_number = max(line_numbers) + 1 if line_numbers else 0
+        next_internal_id = max(entity_ids.values()) + 1 if entity_ids else 0
+        last_dictionary_number = len(model[model.DICTIONARY_KEY]) - 1
+        branches = {}
+        added_lines = []
+        added_labels = {}
+        removed_lines = []
+        internal_ids = set()
+        labels = set()
+        with open(filename, mode='r', encoding='utf8') as f:
+            for line in f:
+                if line.strip('\r\n') == '':
+                    continue
+                operation, line = line.split(column_separator, 1)
+                assert operation in ('+', '-'), 'Unknown operation "%s" in delta file (expected "+" or "-")' % (operation)
+                columns = [x.strip(column_enclosure) for x in line.strip('\n').split(column_separator)]
+                entity_id = columns[specs['id'][0]]
+                synonym, normalizer_name = model.get_dictionary_synonym(columns, specs, word_separator, tokenizer_option)
+                if synonym == '':
+                    continue
+                if operation == '+':
+                    if entity_id not in entity_ids:
+                        entity_ids[entity_id] = next_internal_id
+                        next_internal_id += 1
+                    internal_id = entity_ids[entity_id]
+                    subtrie, depth, branch = self.edit_subtrie(model, branches, last_dictionary_number, normalizer_name, synonym, False)
+                    model.mark_dirty(last_dictionary_number)
+                    if normalizer_name not in model[model.DICTIONARY_KEY][last_dictionary_number].get(model.USED_NORMALIZERS_KEY, [normalizer_name]):
+                        model[model.DICTIONARY_KEY][last_dictionary_number][model.USED_NORMALIZERS_KEY].append(normalizer_name)
+                    self.insert_node(synonym[depth:], line_number, internal_id, subtrie, specs, columns, model)
+                    if branch is not None:
+                        self.pack_branch(model, branch, synonym[depth], subtrie)
+                    line_numbers[line_number] = internal_id
+                    added_lines.append(line_number)
+                    added_labels[line_number] = synonym
+                    line_number += 1
+                else:
+                    if entity_id not in entity_ids:
+                        continue
+                    internal_id = entity_ids[entity_id]
+                    for dictionary_number in range(len(model[model.DICTIONARY_KEY])):
+                        if normalizer_name not in model[model.DICTIONARY_KEY][dictionary_number][model.CONTENT_KEY]:
+                            continue
+                        if (dictionary_number, normalizer_name) not in branches and not [n for n in self.find_label_ids(model, model[model.DICTIONARY_KEY][dictionary_number], normalizer_name, synonym) if line_numbers.get(n) == internal_id]:
+                            continue
+                        subtrie, depth, branch = self.edit_subtrie(model, branches, dictionary_number, normalizer_name, synonym, True)
+                        model.mark_dirty(dictionary_number)
+                        node = subtrie
+                        for character in synonym[depth:]:
+                            node = node.get(character, {})
+                        if model.ENTITY_KEY in node:
+                            kept = [n for n in node[model.ENTITY_KEY] if line_numbers.get(n) != internal_id]
+                            removed_lines.extend([n for n in node[model.ENTITY_KEY] if line_numbers.get(n) == internal_id])
+                            if kept:
+                                node[model.ENTITY_KEY] = kept
+                            else:
+                                self.remove_node(model, synonym[depth:], subtrie)
+                        if branch is not None:
+                            self.pack_branch(model, branch, synonym[depth], subtrie)
+                internal_ids.add(internal_id)
+                labels.add(synonym)
+        self.commit_subtries(model, branches)
+        model.clear_normalization_cache()
+        model.delete_attributes(removed_lines)
+        if model.connection is not None:
+            model.connection.commit()
+        if len(model[model.KEYWORDS_KEY][model.INTERNAL_ID_KEY]) > 0:
+            internal_id_map = dict(model[model.KEYWORDS_KEY][model.INTERNAL_ID_KEY])
+            internal_id_map.update({n: line_numbers[n] for n in added_lines})
+            for n in removed_lines:
+                internal_id_map.pop(n, None)
+            if model.LINE_LABELS_KEY in model[model.KEYWORDS_KEY]:
+                line_labels = dict(model[model.KEYWORDS_KEY][model.LINE_LABELS_KEY])
+                line_labels.update(added_labels)
+                for n in removed_lines:
+                    line_labels.pop(n, None)
+            else:
+                line_labels = self.index_labels(model)
+            model[model.KEYWORDS_KEY] = {model.CONTENT_KEY: dict(model[model.KEYWORDS_KEY][model.CONTENT_KEY]), model.INTERNAL_ID_KEY: internal_id_map, model.LINE_LABELS_KEY: line_labels}
+            self.update_keywords(model, internal_ids, labels, word_separator, disambiguate_all)
+        self.logger('Model updated: %d line(s) added, %d line(s) removed' % (len(added_lines), len(removed_lines)))
+        return len(added_lines), len(removed_lines)
+
+    def find_label_ids(self, model, trie, normalizer_name, label):
+        """Looks up *label* in a trie of given normalization unit without changing the trie.
+        Returns list of line numbers stored in the terminal node *label* leads to (empty list if *label* is not in the trie).
+
+        Args:
+            Model *model*: Model instance to use
+            dict *trie*: dict that contains tries and metadata (member of model[model.DICTIONARY_KEY])
+            str *normalizer_name*: name of normalization unit
+            str *label*: string to look up
+        """
+        content = trie[model.CONTENT_KEY][normalizer_name]
+        if trie.get(model.LAYOUT_KEY) == model.COMPACT_LAYOUT:
+            node = self.find_compact_node(model, content, label)
+            if node < 0:
+                return []
+            return list(content[model.ENTITY_IDS_KEY][content[model.LEAVES_KEY][node]:content[model.LEAVES_KEY][node + 1]])
+        if trie.get(model.LAYOUT_KEY) == model.TOKEN_LAYOUT:
+            token_node = self.find_token_node(model, content, label)
+            if token_node is None or model.ENTITY_KEY not in token_node:
+                return []
+            return list(token_node[model.ENTITY_KEY])
+        string_so_far = ''
+        for character in label:
+            string_so_far += character
+            if string_so_far in content:
+                content = content[string_so_far]
+                string_so_far = ''
+        if string_so_far != '' or model.ENTITY_KEY not in content:
+            return []
+        return list(content[model.ENTITY_KEY])
+
+    def edit_subtrie(self, model, branches, dictionary_number, normalizer_name, label, removal):
+        """Finds uncompressed subtrie that *label* can be inserted into or removed from (see insert_node() and remove_node()).
+        Uncompressed tries are edited in place, and compact and token tries are converted into dict objects (see Model.restore_subtrie() and Model.detokenize_subtrie()) that are kept in *branches* until commit_subtries() is called.
+        In compressed trie, every node that has more than one child stores its children compressed independently of each other (see Model.pack_subtrie()), so only the child of the deepest such node on the path of *label* is unpacked (see Model.expand_subtrie()) and must be put back by pack_branch() once edited.
+        If *label* is to be removed, the node whose child is unpacked must have more than two children, so that it still has more than one when the child is removed.
+        Returns tuple (dict *subtrie*, int *depth*, dict *branch*) where *subtrie* is uncompressed subtrie to insert or remove *label*[*depth*:], and *branch* is the node of compressed trie whose child *label*[*depth*] has been unpacked (None if trie is not compressed).
+
+        Args:
+            Model *model*: Model instance to use
+            dict *branches*: compact or token tries being edited, by tuple (int *dictionary_number*, str *normalizer_name*)
+            int *dictionary_number*: number of trie in model[model.DICTIONARY_KEY]
+            str *normalizer_name*: name of normalization unit
+            str *label*: string to insert or remove
+            bool *removal*: whether *label* is to be removed
+        """
+        trie = model[model.DICTIONARY_KEY][dictionary_number]
+        content = trie[model.CONTENT_KEY][normalizer_name]
+        if trie.get(model.LAYOUT_KEY) == model.COMPACT_LAYOUT:
+            if (dictionary_number, normalizer_name) not in branches:
+                branches[(dictionary_number, normalizer_name)] = model.restore_subtrie(content)
+            return branches[(dictionary_number, normalizer_name)], 0, None
+        if trie.get(model.LAYOUT_KEY) == model.TOKEN_LAYOUT:
+            if (dictionary_number, normalizer_name) not in branches:
+                branches[(dictionary_number, normalizer_name)] = model.detokenize_subtrie(content)
+            return branches[(dictionary_number, normalizer_name)], 0, None
+        if not trie[model.COMPRESSED_KEY]:
+            return content, 0, None
+        node = content
+        depth = 0
+        branch = content
+        branch_depth = 0
+        while depth < len(label) - 1 and isinstance(node.get(label[depth]), dict) and len(node[label[depth]]) > 1:
+            node = node[label[depth]]
+            depth += 1
+            if not removal or len(node) > 2:
+                branch = node
+                branch_depth = depth
+        character = label[branch_depth]
+        return model.expand_subtrie({character: branch[character]} if character in branch else {}, True), branch_depth, branch
+
+    def pack_branch(self, model, branch, character, subtrie):
+        """Compresses subtrie unpacked by edit_subtrie() and puts it back into compressed trie.
+
+        Args:
+            Model *model*: Model instance to use
+            dict *branch*: node of compressed trie whose child has been unpacked
+            str *character*: key of the child in *branch*
+            dict *subtrie*: edited uncompressed subtrie
+        """
+        packed = model.pack_subtrie(subtrie, True, '')[0]
+        if character in packed:
+            branch[character] = packed[character]
+        else:
+            branch.pop(character, None)
+
+    def commit_subtries(self, model, branches):
+        """Converts compact and token tries edited after edit_subtrie() back into their representation and puts them into tries of a model.
+
+        Args:
+            Model *model*: Model instance to use
+            dict *branches*: compact or token tries being edited (see edit_subtrie())
+        """
+        for dictionary_number, normalizer_name in branches:
+            trie = model[model.DICTIONARY_KEY][dictionary_number]
+            if trie.get(model.LAYOUT_KEY) == model.TOKEN_LAYOUT:
+                trie[model.CONTENT_KEY][normalizer_name] = model.tokenize_subtrie(branches[(dictionary_number, normalizer_name)], trie[model.WORD_SEPARATOR_KEY])
+                continue
+            compact = model.compact_subtrie(branches[(dictionary_number, normalizer_name)])
+            if model.FAILURE_KEY in trie[model.CONTENT_KEY][normalizer_name]:
+                compact.update(model.link_subtrie(compact, trie[model.WORD_SEPARATOR_KEY]))
+            trie[model.CONTENT_KEY][normalizer_name] = compact
+        branches.clear()
+
+    def index_labels(self, model):
+        """Walks all tries of a model once to map line numbers to labels they are stored under, so that update_keywords() can find labels of entities by their line numbers.
+        Returns dict {int *line_number*: str *label*}.
+
+        Args:
+            Model *model*: Model instance to use
+        """
+        line_labels = {}
+        for trie in model[model.DICTIONARY_KEY]:
+            for normalizer_name in trie[model.CONTENT_KEY]:
+                for label, line_numbers in model.get_trie_leaves(trie[model.CONTENT_KEY][normalizer_name]):
+                    for n in line_numbers:
+                        line_labels[n] = label
+        return line_labels
+
+    def find_label_entities(self, model, label):
+        """Looks up *label* in all tries of a model (see find_label_ids()).
+        Returns set of internal IDs of entities that have *label* as a synonym.
+
+        Args:
+            Model *model*: Model instance to use
+            str *label*: string to look up
+        """
+        internal_id_map = model[model.KEYWORDS_KEY][model.INTERNAL_ID_KEY]
+        internal_ids = set()
+        for trie in model[model.DICTIONARY_KEY]:
+            for normalizer_name in trie[model.CONTENT_KEY]:
+                internal_ids.update([internal_id_map[n] for n in self.find_label_ids(model, trie, normalizer_name, label) if n in internal_id_map])
+        return internal_ids
+
+    def update_keywords(self, model, internal_ids, labels, word_separator, disambiguate_all):
+        """Makes keywords again for given entities and for entities that share given labels with other entities (see finish_keywords()).
+        Entities that share given labels are looked up in tries (see find_label_entities()), and labels of affected entities are taken from labels of their lines kept with keywords (see index_labels()), so tries are not walked.
+
+        Args:
+            Model *model*: Model instance to use
+            set *internal_ids*: internal IDs of entities whose synonyms have been added or removed
+            set *labels*: labels that have been added or removed
+            str *word_separator*: string considered to be the word delimiter
+            bool *disambiguate_all*: whether generate keywords for all entities or only for those having conflicting synonyms
+        """
+        internal_id_map = model[model.KEYWORDS_KEY][model.INTERNAL_ID_KEY]
+        content = model[model.KEYWORDS_KEY][model.CONTENT_KEY]
+        line_labels = model[model.KEYWORDS_KEY][model.LINE_LABELS_KEY]
+        affected_ids = set(internal_ids)
+        for label in labels:
+            affected_ids.update(self.find_label_entities(model, label))
+        entity_labels = {}
+        for n in internal_id_map:
+            if internal_id_map[n] not in affected_ids or n not in line_labels:
+                continue
+            if internal_id_map[n] not in entity_labels:
+                entity_labels[internal_id_map[n]] = set()
+            entity_labels[internal_id_map[n]].add(line_labels[n])
+        synonyms = {}
+        for internal_id in entity_labels:
+            for label in entity_labels[internal_id]:
+                if label not in synonyms:
+                    synonyms[label] = self.find_label_entities(model, label)
+        for internal_id in affected_ids:
+            content.pop(internal_id, None)
+            if internal_id in entity_labels and (disambiguate_all or [s for s in entity_labels[internal_id] if len(synonyms[s]) > 1]):
+                content[internal_id] = set([token for s in entity_labels[internal_id] for token in s.split(word_separator)])
+        model.mark_dirty(model.KEYWORDS_KEY)
         return True
 
     def unpack_trie(self, model, packed_trie, compressed):
@@ -334,19 +707,30 @@ class Utility():
         unpacked_trie_pointer[radix[-1:]] = packed_trie[radix]
         return unpacked_trie
 
-    def unpack_attributes(self, model, cur, leaf_ids, include_query, exclude_query, process_exclude, attrs_out_query):
+    def unpack_attributes(self, model, cur, leaf_ids, include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter=None):
         """Loads attributes for internal IDs found in a leaf of a trie from a model's database using associated sqlite3.connect.cursor object.
+        IDs are looked up in batches of model.ATTRS_BATCH_SIZE, so the number of queries does not depend on the number of IDs in a leaf.
         Returns dict object that maps internal IDs with attributes.
 
         Args:
             sqlite3.connect.cursor *cur*: cursor to use for throwing queries
-            list *leaf_ids*: internal IDs found in a trie leaf
+            list *leaf_ids*: internal IDs found in a trie leaf (or in several leaves)
             str *include_query*: part of SQL query to filter something in
             str *exclude_query*: part of SQL query to filter something out
             bint *process_exclude*: whether use *exclude_query* at all
             str *attrs_out_query*: part of SQL query that specifies which attributes to eventually return
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, *include_query*, *exclude_query*, *process_exclude*, and *attrs_out_query* are ignored)
         """
         attributes = {}
+        if model.attrs_store is not None:
+            if attrs_filter is None:
+                assert include_query == exclude_query == attrs_out_query == '', 'Attributes that are not stored in SQLite database can only be filtered by filter compiled by compile_attrs_filter()'
+                attrs_filter = self.compile_attrs_filter()
+            unique_ids = sorted(set(leaf_ids))
+            include_attrs = model.attrs_store.match(unique_ids, attrs_filter['include'])
+            if attrs_filter['process_exclude']:
+                include_attrs -= model.attrs_store.match(unique_ids, attrs_filter['exclude'])
+            return model.attrs_store.fetch(sorted(include_attrs), attrs_filter['attrs_out'])
         if cur is None:
             for n in leaf_ids:
                 if n not in attributes:
@@ -355,31 +739,52 @@ class Utility():
                     attributes[n]['ID'] = []
                 attributes[n]['ID'].append(model[model.INTERNAL_ID_KEY][n])
             return attributes
+        include_params, exclude_params, attrs_out_params = (), (), ()
+        if attrs_filter is not None:
+            include_query, include_params = attrs_filter['include_query'], attrs_filter['include_params']
+            exclude_query, exclude_params = attrs_filter['exclude_query'], attrs_filter['exclude_params']
+            process_exclude = attrs_filter['process_exclude']
+            attrs_out_query, attrs_out_params = attrs_filter['attrs_out_query'], attrs_filter['attrs_out_params']
         include_attrs = set()
         exclude_attrs = set()
-        for n in leaf_ids:
-            rows = cur.execute('select distinct n from attrs where n = %d %s;' % (n, include_query))
-            for row in rows:
-                include_attrs.add(int(row[0]))
-        if process_exclude:
-            for n in leaf_ids:
-                rows = cur.execute('select distinct n from attrs where n = %d %s;' % (n, exclude_query))
+        unique_ids = sorted(set(leaf_ids))
+        batch_size = model.ATTRS_BATCH_SIZE
+        if attrs_filter is not None and attrs_filter['in_memory']:
+            include_bitset = model.get_filter_bitset(attrs_filter['include'])
+            exclude_bitset = model.get_filter_bitset(attrs_filter['exclude']) if process_exclude else bytearray()
+            for n in unique_ids:
+                if n >> 3 < len(include_bitset) and include_bitset[n >> 3] >> (n & 7) & 1:
+                    include_attrs.add(n)
+                if n >> 3 < len(exclude_bitset) and exclude_bitset[n >> 3] >> (n & 7) & 1:
+                    exclude_attrs.add(n)
+        else:
+            for i in range(0, len(unique_ids), batch_size):
+                batch = tuple(unique_ids[i:i + batch_size])
+                placeholders = ', '.join(['?'] * len(batch))
+                rows = cur.execute('select distinct n from attrs where n in (%s) %s;' % (placeholders, include_query), batch + include_params)
                 for row in rows:
-                    exclude_attrs.add(int(row[0]))
-        ns = include_attrs - exclude_attrs
-        for n in ns:
-            rows = cur.execute('select attr_name, attr_value from attrs where n = %d%s;' % (n, attrs_out_query))
-            if n not in attributes:
+                    include_attrs.add(int(row[0]))
+                if process_exclude:
+                    rows = cur.execute('select distinct n from attrs where n in (%s) %s;' % (placeholders, exclude_query), batch + exclude_params)
+                    for row in rows:
+                        exclude_attrs.add(int(row[0]))
+        ns = sorted(include_attrs - exclude_attrs)
+        for i in range(0, len(ns), batch_size):
+            batch = tuple(ns[i:i + batch_size])
+            for n in batch:
                 attributes[n] = {}
+            rows = cur.execute('select n, attr_name, attr_value from attrs where n in (%s)%s order by n, attr_name, attr_value;' % (', '.join(['?'] * len(batch)), attrs_out_query), batch + attrs_out_params)
             for row in rows:
-                attr_name, attr_value = str(row[0]), str(row[1])
+                n, attr_name, attr_value = int(row[0]), str(row[1]), str(row[2])
                 if attr_name not in attributes[n]:
                     attributes[n][attr_name] = []
                 attributes[n][attr_name].append(attr_value)
         return attributes
 
-    def check_attrs(self, model, trie_leaf, cur, include_query, exclude_query, process_exclude, attrs_out_query):
-        """Attaches attributes to a given trie leaf and returns it.
+    def check_attrs(self, model, trie_leaf, cur, include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter=None):
+        """Attaches attributes to a given trie leaf and returns it (only IDs that passed the filter are kept).
+        If *model* has attributes cache enabled, attributes are only loaded from the database once per leaf and filter.
+        Attributes are loaded and cached under the lock of *model* (see Model()), so that threads do not use the same cursor or cache at once.
 
         Args:
             Model *model*: Model instance to use
@@ -389,14 +794,29 @@ class Utility():
             str *exclude_query*: part of SQL query to filter something out
             bint *process_exclude*: whether use *exclude_query* at all
             str *attrs_out_query*: part of SQL query that specifies which attributes to eventually return
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, it is used instead of SQL query parts)
         """
         this_trie_leaf = dict(trie_leaf)
-        this_trie_leaf[model.ATTRS_KEY] = self.unpack_attributes(model, cur, trie_leaf[model.ENTITY_KEY], include_query, exclude_query, process_exclude, attrs_out_query)
+        with model.lock:
+            if model.attrs_cache_size > 0:
+                if attrs_filter is not None:
+                    cache_key = (tuple(trie_leaf[model.ENTITY_KEY]), attrs_filter['signature'])
+                else:
+                    cache_key = (tuple(trie_leaf[model.ENTITY_KEY]), include_query, exclude_query, process_exclude, attrs_out_query)
+                attributes = model.get_cached_attributes(cache_key)
+                if attributes is None:
+                    attributes = self.unpack_attributes(model, cur, trie_leaf[model.ENTITY_KEY], include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter)
+                    model.cache_attributes(cache_key, attributes)
+                this_trie_leaf[model.ATTRS_KEY] = attributes
+            else:
+                this_trie_leaf[model.ATTRS_KEY] = self.unpack_attributes(model, cur, trie_leaf[model.ENTITY_KEY], include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter)
         if int(len(this_trie_leaf[model.ATTRS_KEY])) == 0:
             return {}
+        if int(len(this_trie_leaf[model.ATTRS_KEY])) < int(len(trie_leaf[model.ENTITY_KEY])):
+            this_trie_leaf[model.ENTITY_KEY] = [n for n in trie_leaf[model.ENTITY_KEY] if n in this_trie_leaf[model.ATTRS_KEY]]
         return this_trie_leaf
 
-    def spot_entities(self, model, source_string, normalizer_name, include_query='', exclude_query='', process_exclude=False, attrs_out_query='', progress_from=0, progress_to=100):
+    def spot_entities(self, model, source_string, normalizer_name, include_query='', exclude_query='', process_exclude=False, attrs_out_query='', progress_from=0, progress_to=100, attrs_filter=None):
         """Zooms through a string, finds boundaries of synonyms stored in model's trie, and pulls associated attributes from the storage.
         Returns list(list(tuple *datapoint*)) where datapoint is tuple(list *ids*, dict *attributes*, str *found_synonym*, int *begin*, int *end*) where *ids* are internal IDs of entities, *attributes* is dict {id_entity: {attribute: [value]}}, *found_synonym* is identified substring, *begin* and *end* are indexes of first and last character of recognized substring.
 
@@ -410,6 +830,7 @@ class Utility():
             str *attrs_out_query*: part of SQL query that specifies which attributes to eventually return
             int *progress_from*: initial progress value to report
             int *progress_to*: maximum progress value to report
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, it is used instead of SQL query parts)
 
         Data structure for returned value:
             [
@@ -424,101 +845,494 @@ class Utility():
                 )
             ]
         """
-        # TODO: review for refactoring
-        self.logger('Analyzing "%s"... ' % (source_string))
-        rets = []
-        this_progress_position = 0
-        last_progress_position = 0
+        return self.spot_normalized_entities(model, {normalizer_name: source_string}, include_query, exclude_query, process_exclude, attrs_out_query, progress_from, progress_to, attrs_filter)[normalizer_name]
+
+    def spot_normalized_entities(self, model, normalized_strings, include_query='', exclude_query='', process_exclude=False, attrs_out_query='', progress_from=0, progress_to=100, attrs_filter=None):
+        """Does the same as spot_entities() for strings normalized by several normalization units in one pass over the model: each shard is visited once, and strings are looked up in its tries of respective normalization units.
+        Tries that do not have any labels are skipped. If shard workers are running (see start_shard_workers()), each shard is sent to a worker once along with all strings.
+        Returns dict {str *normalizer_name*: list(tuple *datapoint*)} (see spot_entities() for details).
+
+        Args:
+            Model *model*: Model instance to use
+            dict *normalized_strings*: strings to parse {str normalizer_name: str normalized_string} where *normalizer_name* is name of normalization unit applied to *normalized_string*
+            str *include_query*: part of SQL query to filter something in
+            str *exclude_query*: part of SQL query to filter something out
+            bint *process_exclude*: whether use *exclude_query* at all
+            str *attrs_out_query*: part of SQL query that specifies which attributes to eventually return
+            int *progress_from*: initial progress value to report
+            int *progress_to*: maximum progress value to report
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, it is used instead of SQL query parts)
+        """
+        self.logger('Analyzing "%s"... ' % ('", "'.join(normalized_strings.values())))
+        rets = {normalizer_name: [] for normalizer_name in normalized_strings}
         total_tries = int(len(model[model.DICTIONARY_KEY]))
-        if total_tries == 0:
+        total_steps = total_tries * len(normalized_strings)
+        if total_steps == 0:
+            return rets
+        if total_tries > 1 and self.shard_workers is not None and self.shard_workers[0] is model:
+            spotted = spot_in_processes(self.shard_workers, total_tries, [(normalized_strings[normalizer_name], normalizer_name, include_query, exclude_query, process_exclude, attrs_out_query, 0, 0, attrs_filter) for normalizer_name in normalized_strings])
+            rets = {normalizer_name: spotted[i] for i, normalizer_name in enumerate(normalized_strings)}
+            self.push_message(progress_to, self.callback_progress)
+            self.logger('Done.')
             return rets
         progress_share = progress_to - progress_from
-        trie_increment = int(progress_share / total_tries)
-        current_trie_index = 0
-        for trie in model[model.DICTIONARY_KEY]:
-            ret = []
-            word_separator = trie[model.WORD_SEPARATOR_KEY]
-            start_index, end_index, string_so_far = -1, 0, ''
-            reading_entity = source_string[0:1] != word_separator
-            trie_is_compressed = bool(trie[model.COMPRESSED_KEY])
-            subtrie = trie[model.CONTENT_KEY][normalizer_name]
-            shorter_alternative = None
-            current_index = 0
-            temporary_index = -1
-            total_length = int(len(source_string))
-            increment_chars = int(total_length / progress_share) if total_length > progress_share else total_length - 1
-            while current_index < total_length:
-                this_progress_position = int(current_index / increment_chars / total_tries)
-                if this_progress_position != last_progress_position:
-                    last_progress_position = this_progress_position
-                    self.push_message(int(progress_share * current_index / total_length / total_tries) + current_trie_index * trie_increment + progress_from, self.callback_progress)
-                if len(ret) > 0 and current_index < ret[-1][-1]:
-                    current_index = ret[-1][-1]
-                if not reading_entity: # wait for word separator
-                    character = source_string[current_index]
-                    start_index = current_index
-                    if character == word_separator:
-                        reading_entity = True
-                        end_index = start_index
-                else: # reading entity
-                    end_index = current_index
-                    character = source_string[current_index]
-                    if character == word_separator and model.ENTITY_KEY in subtrie and model.IGNORE_KEY not in subtrie:
-                        found_object = self.check_attrs(model, subtrie, model.cursor, include_query, exclude_query, process_exclude, attrs_out_query)
-                        if found_object:
-                            identified = found_object[model.ENTITY_KEY], found_object[model.ATTRS_KEY]
-                            shorter_alternative = (identified[0], identified[1], string_so_far, start_index + 1, end_index)
-                    if character in subtrie:
-                        if character == word_separator and temporary_index == -1:
-                            temporary_index = current_index
-                        string_so_far += character
-                        subtrie = self.unpack_trie(model, subtrie[character], trie_is_compressed)
+        current_step = 0
+        for current_trie_index in range(total_tries):
+            for normalizer_name in normalized_strings:
+                step_from = progress_from + int(progress_share * current_step / total_steps)
+                step_to = progress_from + int(progress_share * (current_step + 1) / total_steps)
+                current_step += 1
+                # empty tries are skipped before they are read from disk, if the model has been loaded with lazy_tries=True
+                if model.is_empty_trie(model[model.DICTIONARY_KEY][current_trie_index], normalizer_name):
+                    continue
+                trie = model.get_trie(current_trie_index, normalizer_name)
+                if model.is_empty_trie(trie, normalizer_name):
+                    continue
+                rets[normalizer_name] += self.spot_trie_entities(model, trie, normalized_strings[normalizer_name], normalizer_name, include_query, exclude_query, process_exclude, attrs_out_query, step_from, step_to, attrs_filter)
+        self.push_message(progress_to, self.callback_progress)
+        self.logger('Done.')
+        return rets
+
+    def spot_trie_entities(self, model, trie, source_string, normalizer_name, include_query='', exclude_query='', process_exclude=False, attrs_out_query='', progress_from=0, progress_to=100, attrs_filter=None):
+        """Does the same as spot_entities() for a single trie, using the method that matches its layout: spot_linked_entities(), spot_token_entities(), spot_compact_entities(), or spot_dict_entities().
+        Returns list(tuple *datapoint*) (see spot_entities() for details).
+
+        Args:
+            Model *model*: Model instance to use
+            dict *trie*: part of model that contains tries
+            str *source_string*: string to parse
+            str *normalizer_name*: name of normalization unit (used to pick the right trie from the model; supposed to match normalization unit applied to *source_string*)
+            str *include_query*: part of SQL query to filter something in
+            str *exclude_query*: part of SQL query to filter something out
+            bint *process_exclude*: whether use *exclude_query* at all
+            str *attrs_out_query*: part of SQL query that specifies which attributes to eventually return
+            int *progress_from*: initial progress value to report
+            int *progress_to*: maximum progress value to report
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, it is used instead of SQL query parts)
+        """
+        if model.FAILURE_KEY in trie[model.CONTENT_KEY][normalizer_name]:
+            return self.spot_linked_entities(model, trie, source_string, normalizer_name, include_query, exclude_query, process_exclude, attrs_out_query, progress_from, progress_to, attrs_filter)
+        if trie.get(model.LAYOUT_KEY) == model.TOKEN_LAYOUT:
+            return self.spot_token_entities(model, trie, source_string, normalizer_name, include_query, exclude_query, process_exclude, attrs_out_query, progress_from, progress_to, attrs_filter)
+        if trie.get(model.LAYOUT_KEY) == model.COMPACT_LAYOUT:
+            return self.spot_compact_entities(model, trie, source_string, normalizer_name, include_query, exclude_query, process_exclude, attrs_out_query, progress_from, progress_to, attrs_filter)
+        return self.spot_dict_entities(model, trie, source_string, normalizer_name, include_query, exclude_query, process_exclude, attrs_out_query, progress_from, progress_to, attrs_filter)
+
+    def spot_dict_entities(self, model, trie, source_string, normalizer_name, include_query='', exclude_query='', process_exclude=False, attrs_out_query='', progress_from=0, progress_to=100, attrs_filter=None):
+        """Does the same as spot_entities() for a single trie stored in nested dicts.
+        In compressed trie, a node whose only key is longer than one character (see Model.pack_subtrie()) is an edge that is read in place: characters of the string are compared with the characters of the key one by one, and the node the key leads to is taken once all of them match.
+        Returns list(tuple *datapoint*) (see spot_entities() for details).
+
+        Args:
+            Model *model*: Model instance to use
+            dict *trie*: part of model that contains tries
+            str *source_string*: string to parse
+            str *normalizer_name*: name of normalization unit (used to pick the right trie from the model; supposed to match normalization unit applied to *source_string*)
+            str *include_query*: part of SQL query to filter something in
+            str *exclude_query*: part of SQL query to filter something out
+            bint *process_exclude*: whether use *exclude_query* at all
+            str *attrs_out_query*: part of SQL query that specifies which attributes to eventually return
+            int *progress_from*: initial progress value to report
+            int *progress_to*: maximum progress value to report
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, it is used instead of SQL query parts)
+        """
+        ret = []
+        word_separator = trie[model.WORD_SEPARATOR_KEY]
+        start_index, end_index, string_so_far = -1, 0, ''
+        reading_entity = source_string[0:1] != word_separator
+        trie_is_compressed = bool(trie[model.COMPRESSED_KEY])
+        subtrie = trie[model.CONTENT_KEY][normalizer_name]
+        # edge of compressed trie that is being read, and number of its characters read so far
+        radix, radix_index, radix_length = '', 0, 0
+        shorter_alternative = None
+        current_index = 0
+        temporary_index = -1
+        total_length = int(len(source_string))
+        progress_share = progress_to - progress_from
+        increment_chars = max(int(total_length / progress_share) if progress_share > 0 else total_length, 1)
+        last_progress_position = 0
+        while current_index < total_length:
+            this_progress_position = int(current_index / increment_chars)
+            if this_progress_position != last_progress_position:
+                last_progress_position = this_progress_position
+                self.push_message(int(progress_share * current_index / total_length) + progress_from, self.callback_progress)
+            if len(ret) > 0 and current_index < ret[-1][-1]:
+                current_index = ret[-1][-1]
+            if not reading_entity: # wait for word separator
+                character = source_string[current_index]
+                start_index = current_index
+                if character == word_separator:
+                    reading_entity = True
+                    end_index = start_index
+            else: # reading entity
+                end_index = current_index
+                character = source_string[current_index]
+                if character == word_separator and radix_length == 0 and model.ENTITY_KEY in subtrie and model.IGNORE_KEY not in subtrie:
+                    found_object = self.check_attrs(model, subtrie, model.cursor, include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter)
+                    if found_object:
+                        identified = found_object[model.ENTITY_KEY], found_object[model.ATTRS_KEY]
+                        shorter_alternative = (identified[0], identified[1], string_so_far, start_index + 1, end_index)
+                if radix_length > 0:
+                    matched = character == radix[radix_index]
+                else:
+                    matched = character in subtrie
+                if matched:
+                    if character == word_separator and temporary_index == -1:
+                        temporary_index = current_index
+                    string_so_far += character
+                    if radix_length > 0:
+                        radix_index += 1
+                        if radix_index == radix_length:
+                            subtrie = subtrie[radix]
+                            radix_length = 0
                     else:
-                        #if everything_or_nothing and current_index == total_length: return []
-                        if character == word_separator or current_index == total_length: # - 1:
-                            if model.ENTITY_KEY in subtrie and model.IGNORE_KEY not in subtrie:
-                                found_object = self.check_attrs(model, subtrie, model.cursor, include_query, exclude_query, process_exclude, attrs_out_query)
-                                if found_object:
-                                    identified = found_object[model.ENTITY_KEY], found_object[model.ATTRS_KEY]
-                                    ret.append((identified[0], identified[1], string_so_far, start_index + 1, end_index))
-                                    shorter_alternative = None
-                                else:
-                                    if shorter_alternative:
-                                        ret.append(shorter_alternative)
-                                        shorter_alternative = None
+                        subtrie = subtrie[character]
+                        if trie_is_compressed and len(subtrie) == 1:
+                            for radix in subtrie:
+                                if len(radix) > 1:
+                                    radix_index, radix_length = 0, len(radix)
+                else:
+                    #if everything_or_nothing and current_index == total_length: return []
+                    if character == word_separator or current_index == total_length: # - 1:
+                        if radix_length == 0 and model.ENTITY_KEY in subtrie and model.IGNORE_KEY not in subtrie:
+                            found_object = self.check_attrs(model, subtrie, model.cursor, include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter)
+                            if found_object:
+                                identified = found_object[model.ENTITY_KEY], found_object[model.ATTRS_KEY]
+                                ret.append((identified[0], identified[1], string_so_far, start_index + 1, end_index))
+                                shorter_alternative = None
                             else:
                                 if shorter_alternative:
                                     ret.append(shorter_alternative)
                                     shorter_alternative = None
-                            start_index = current_index
                         else:
                             if shorter_alternative:
                                 ret.append(shorter_alternative)
                                 shorter_alternative = None
-                            if temporary_index == -1:
-                                reading_entity = False
-                            else:
-                                current_index = temporary_index
-                                temporary_index = -1
-                                reading_entity = True
-                        string_so_far = ''
                         start_index = current_index
-                        subtrie = trie[model.CONTENT_KEY][normalizer_name]
-                current_index += 1
-            if model.ENTITY_KEY in subtrie and model.IGNORE_KEY not in subtrie:
-                found_object = self.check_attrs(model, subtrie, model.cursor, include_query, exclude_query, process_exclude, attrs_out_query)
-                if found_object:
-                    identified = found_object[model.ENTITY_KEY], found_object[model.ATTRS_KEY]
-                    ret.append((identified[0], identified[1], string_so_far, start_index + 1, current_index - 1))
-                elif shorter_alternative:
-                    ret.append(shorter_alternative)
+                    else:
+                        if shorter_alternative:
+                            ret.append(shorter_alternative)
+                            shorter_alternative = None
+                        if temporary_index == -1:
+                            reading_entity = False
+                        else:
+                            current_index = temporary_index
+                            temporary_index = -1
+                            reading_entity = True
+                    string_so_far = ''
+                    start_index = current_index
+                    subtrie = trie[model.CONTENT_KEY][normalizer_name]
+                    radix_length = 0
+            current_index += 1
+        if radix_length == 0 and model.ENTITY_KEY in subtrie and model.IGNORE_KEY not in subtrie:
+            found_object = self.check_attrs(model, subtrie, model.cursor, include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter)
+            if found_object:
+                identified = found_object[model.ENTITY_KEY], found_object[model.ATTRS_KEY]
+                ret.append((identified[0], identified[1], string_so_far, start_index + 1, current_index - 1))
             elif shorter_alternative:
                 ret.append(shorter_alternative)
-            rets += ret
-            current_trie_index += 1
-        self.push_message(progress_to, self.callback_progress)
-        self.logger('Done.')
-        return rets
+        elif shorter_alternative:
+            ret.append(shorter_alternative)
+        return ret
+
+    def find_compact_node(self, model, compact, label):
+        """Looks up *label* in a given compact trie.
+        Returns int number of the node *label* leads to, or -1 if *label* is not in the trie.
+
+        Args:
+            Model *model*: Model instance to use
+            dict *compact*: compact trie (see Model.compact_subtrie())
+            str *label*: string to look up
+        """
+        labels = compact[model.LABELS_KEY]
+        children = compact[model.CHILDREN_KEY]
+        node = 0
+        for character in label:
+            node = labels.find(character, children[node], children[node + 1])
+            if node < 0:
+                break
+        return node
+
+    def spot_compact_entities(self, model, trie, source_string, normalizer_name, include_query='', exclude_query='', process_exclude=False, attrs_out_query='', progress_from=0, progress_to=100, attrs_filter=None):
+        """Does the same as spot_entities() for a single trie stored in compact array-backed representation (see Model.compact_trie()).
+        Returns list(tuple *datapoint*) (see spot_entities() for details).
+
+        Args:
+            Model *model*: Model instance to use
+            dict *trie*: part of model that contains compact tries
+            str *source_string*: string to parse
+            str *normalizer_name*: name of normalization unit (used to pick the right trie from the model; supposed to match normalization unit applied to *source_string*)
+            str *include_query*: part of SQL query to filter something in
+            str *exclude_query*: part of SQL query to filter something out
+            bint *process_exclude*: whether use *exclude_query* at all
+            str *attrs_out_query*: part of SQL query that specifies which attributes to eventually return
+            int *progress_from*: initial progress value to report
+            int *progress_to*: maximum progress value to report
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, it is used instead of SQL query parts)
+        """
+        ret = []
+        content = trie[model.CONTENT_KEY][normalizer_name]
+        labels = content[model.LABELS_KEY]
+        children = content[model.CHILDREN_KEY]
+        leaves = content[model.LEAVES_KEY]
+        entity_ids = content[model.ENTITY_IDS_KEY]
+        ignored = content[model.IGNORED_KEY]
+        word_separator = trie[model.WORD_SEPARATOR_KEY]
+        start_index, end_index, string_so_far = -1, 0, ''
+        reading_entity = source_string[0:1] != word_separator
+        node = 0
+        shorter_alternative = None
+        current_index = 0
+        temporary_index = -1
+        total_length = int(len(source_string))
+        progress_share = progress_to - progress_from
+        increment_chars = max(int(total_length / progress_share) if progress_share > 0 else total_length, 1)
+        last_progress_position = 0
+        while current_index < total_length:
+            this_progress_position = int(current_index / increment_chars)
+            if this_progress_position != last_progress_position:
+                last_progress_position = this_progress_position
+                self.push_message(int(progress_share * current_index / total_length) + progress_from, self.callback_progress)
+            if len(ret) > 0 and current_index < ret[-1][-1]:
+                current_index = ret[-1][-1]
+            if not reading_entity: # wait for word separator
+                character = source_string[current_index]
+                start_index = current_index
+                if character == word_separator:
+                    reading_entity = True
+                    end_index = start_index
+            else: # reading entity
+                end_index = current_index
+                character = source_string[current_index]
+                if character == word_separator and leaves[node] < leaves[node + 1] and node not in ignored:
+                    found_object = self.check_attrs(model, {model.ENTITY_KEY: entity_ids[leaves[node]:leaves[node + 1]].tolist()}, model.cursor, include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter)
+                    if found_object:
+                        shorter_alternative = (found_object[model.ENTITY_KEY], found_object[model.ATTRS_KEY], string_so_far, start_index + 1, end_index)
+                child = labels.find(character, children[node], children[node + 1])
+                if child > 0:
+                    if character == word_separator and temporary_index == -1:
+                        temporary_index = current_index
+                    string_so_far += character
+                    node = child
+                else:
+                    if character == word_separator or current_index == total_length:
+                        found_object = {}
+                        if leaves[node] < leaves[node + 1] and node not in ignored:
+                            found_object = self.check_attrs(model, {model.ENTITY_KEY: entity_ids[leaves[node]:leaves[node + 1]].tolist()}, model.cursor, include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter)
+                        if found_object:
+                            ret.append((found_object[model.ENTITY_KEY], found_object[model.ATTRS_KEY], string_so_far, start_index + 1, end_index))
+                            shorter_alternative = None
+                        elif shorter_alternative:
+                            ret.append(shorter_alternative)
+                            shorter_alternative = None
+                    else:
+                        if shorter_alternative:
+                            ret.append(shorter_alternative)
+                            shorter_alternative = None
+                        if temporary_index == -1:
+                            reading_entity = False
+                        else:
+                            current_index = temporary_index
+                            temporary_index = -1
+                            reading_entity = True
+                    string_so_far = ''
+                    start_index = current_index
+                    node = 0
+            current_index += 1
+        found_object = {}
+        if leaves[node] < leaves[node + 1] and node not in ignored:
+            found_object = self.check_attrs(model, {model.ENTITY_KEY: entity_ids[leaves[node]:leaves[node + 1]].tolist()}, model.cursor, include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter)
+        if found_object:
+            ret.append((found_object[model.ENTITY_KEY], found_object[model.ATTRS_KEY], string_so_far, start_index + 1, current_index - 1))
+        elif shorter_alternative:
+            ret.append(shorter_alternative)
+        return ret
+
+    def spot_linked_entities(self, model, trie, source_string, normalizer_name, include_query='', exclude_query='', process_exclude=False, attrs_out_query='', progress_from=0, progress_to=100, attrs_filter=None):
+        """Does the same as spot_compact_entities() for a single trie stored in compact representation with failure links (see Model.link_subtrie()), reading the string once from left to right.
+        Labels that begin and end at word boundaries are collected as they end, and the longest label that begins leftmost is taken once no label that is still being read can begin at or before it.
+        Returns list(tuple *datapoint*) (see spot_entities() for details).
+
+        Args:
+            Model *model*: Model instance to use
+            dict *trie*: part of model that contains compact tries with failure links
+            str *source_string*: string to parse
+            str *normalizer_name*: name of normalization unit (used to pick the right trie from the model; supposed to match normalization unit applied to *source_string*)
+            str *include_query*: part of SQL query to filter something in
+            str *exclude_query*: part of SQL query to filter something out
+            bint *process_exclude*: whether use *exclude_query* at all
+            str *attrs_out_query*: part of SQL query that specifies which attributes to eventually return
+            int *progress_from*: initial progress value to report
+            int *progress_to*: maximum progress value to report
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, it is used instead of SQL query parts)
+        """
+        ret = []
+        content = trie[model.CONTENT_KEY][normalizer_name]
+        labels = content[model.LABELS_KEY]
+        children = content[model.CHILDREN_KEY]
+        leaves = content[model.LEAVES_KEY]
+        entity_ids = content[model.ENTITY_IDS_KEY]
+        ignored = content[model.IGNORED_KEY]
+        failure = content[model.FAILURE_KEY]
+        output = content[model.OUTPUT_KEY]
+        depth = content[model.DEPTH_KEY]
+        word_separator = trie[model.WORD_SEPARATOR_KEY]
+        candidates = {}
+        starts = []
+        last_end = 0
+        state = 0
+        total_length = int(len(source_string))
+        progress_share = progress_to - progress_from
+        increment_chars = max(int(total_length / progress_share) if progress_share > 0 else total_length, 1)
+        last_progress_position = 0
+        for current_index in range(total_length + 1):
+            this_progress_position = int(current_index / increment_chars)
+            if this_progress_position != last_progress_position:
+                last_progress_position = this_progress_position
+                self.push_message(int(progress_share * current_index / max(total_length, 1)) + progress_from, self.callback_progress)
+            if current_index == total_length or source_string[current_index] == word_separator:
+                # labels that end here, longest first
+                node = state if leaves[state] < leaves[state + 1] and state not in ignored else output[state]
+                while node > 0:
+                    start_index = current_index - depth[node]
+                    if start_index not in candidates:
+                        candidates[start_index] = []
+                        heapq.heappush(starts, start_index)
+                    candidates[start_index].append(node)
+                    node = output[node]
+                # labels being read begin at current_index - depth[state] or later
+                earliest_index = current_index - depth[state] if current_index < total_length else total_length + 1
+                while len(starts) > 0 and starts[0] < earliest_index:
+                    start_index = heapq.heappop(starts)
+                    nodes = candidates.pop(start_index)
+                    if start_index < last_end:
+                        continue
+                    for node in reversed(nodes):
+                        found_object = self.check_attrs(model, {model.ENTITY_KEY: entity_ids[leaves[node]:leaves[node + 1]].tolist()}, model.cursor, include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter)
+                        if found_object:
+                            end_index = start_index + depth[node]
+                            ret.append((found_object[model.ENTITY_KEY], found_object[model.ATTRS_KEY], source_string[start_index:end_index], start_index, end_index if end_index < total_length else total_length - 1))
+                            last_end = end_index
+                            break
+                if current_index == total_length:
+                    break
+            character = source_string[current_index]
+            while state > 0:
+                child = labels.find(character, children[state], children[state + 1])
+                if child > 0:
+                    state = child
+                    break
+                state = failure[state]
+            else:
+                # root only begins labels at word boundaries
+                if (current_index == 0 and character != word_separator) or (current_index > 0 and source_string[current_index - 1] == word_separator):
+                    child = labels.find(character, children[0], children[1])
+                    state = child if child > 0 else 0
+        return ret
+
+    def find_token_node(self, model, subtrie, label):
+        """Looks up *label* in a given token trie.
+        Returns dict node *label* leads to, or None if *label* is not in the trie.
+
+        Args:
+            Model *model*: Model instance to use
+            dict *subtrie*: token trie (see Model.tokenize_subtrie())
+            str *label*: string to look up
+        """
+        vocabulary = subtrie[model.VOCABULARY_KEY]
+        token_ids = [vocabulary.get(word, -1) for word in label.split(subtrie[model.WORD_SEPARATOR_KEY])]
+        node = subtrie[model.TOKENS_KEY]
+        word_index = 0
+        while word_index < len(token_ids):
+            child = node.get(token_ids[word_index])
+            if child is None:
+                return None
+            if isinstance(child, tuple):
+                if child[0].tolist() != token_ids[word_index + 1:word_index + 1 + len(child[0])]:
+                    return None
+                word_index += len(child[0])
+                child = child[1]
+            node = child
+            word_index += 1
+        return node
+
+    def spot_token_entities(self, model, trie, source_string, normalizer_name, include_query='', exclude_query='', process_exclude=False, attrs_out_query='', progress_from=0, progress_to=100, attrs_filter=None):
+        """Does the same as spot_linked_entities() for a single trie stored as token trie (see Model.tokenize_subtrie()), reading the string word by word rather than character by character.
+        The string is split by word separator once and its words are replaced by their IDs in the vocabulary of the trie (-1 for words that are not there), so that each step down the trie is a single dict lookup.
+        Returns list(tuple *datapoint*) (see spot_entities() for details).
+
+        Args:
+            Model *model*: Model instance to use
+            dict *trie*: part of model that contains token tries
+            str *source_string*: string to parse
+            str *normalizer_name*: name of normalization unit (used to pick the right trie from the model; supposed to match normalization unit applied to *source_string*)
+            str *include_query*: part of SQL query to filter something in
+            str *exclude_query*: part of SQL query to filter something out
+            bint *process_exclude*: whether use *exclude_query* at all
+            str *attrs_out_query*: part of SQL query that specifies which attributes to eventually return
+            int *progress_from*: initial progress value to report
+            int *progress_to*: maximum progress value to report
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, it is used instead of SQL query parts)
+        """
+        ret = []
+        content = trie[model.CONTENT_KEY][normalizer_name]
+        vocabulary = content[model.VOCABULARY_KEY]
+        tokens = content[model.TOKENS_KEY]
+        word_separator = trie[model.WORD_SEPARATOR_KEY]
+        separator_length = int(len(word_separator))
+        words = source_string.split(word_separator)
+        token_ids = [vocabulary.get(word, -1) for word in words]
+        offsets = []
+        offset = 0
+        for word in words:
+            offsets.append(offset)
+            offset += int(len(word)) + separator_length
+        total_words = int(len(words))
+        total_length = int(len(source_string))
+        progress_share = progress_to - progress_from
+        increment_words = max(int(total_words / progress_share) if progress_share > 0 else total_words, 1)
+        last_progress_position = 0
+        # string that begins with word separator begins with empty word that cannot begin a label
+        word_index = 0 if source_string[0:1] != word_separator else 1
+        while word_index < total_words:
+            this_progress_position = int(word_index / increment_words)
+            if this_progress_position != last_progress_position:
+                last_progress_position = this_progress_position
+                self.push_message(int(progress_share * word_index / total_words) + progress_from, self.callback_progress)
+            leaves = []
+            child = tokens.get(token_ids[word_index])
+            end_word = word_index
+            while child is not None:
+                if isinstance(child, tuple):
+                    # merged chain of nodes, following words are compared with its tail in place
+                    tail = child[0]
+                    tail_length = int(len(tail))
+                    matched = end_word + tail_length < total_words
+                    i = 0
+                    while matched and i < tail_length:
+                        matched = token_ids[end_word + 1 + i] == tail[i]
+                        i += 1
+                    if not matched:
+                        break
+                    end_word += tail_length
+                    child = child[1]
+                node = child
+                if model.ENTITY_KEY in node and model.IGNORE_KEY not in node:
+                    leaves.append((end_word, node))
+                end_word += 1
+                if end_word == total_words:
+                    break
+                child = node.get(token_ids[end_word])
+            # the longest label that passes the filter is taken
+            for end_word, node in reversed(leaves):
+                found_object = self.check_attrs(model, {model.ENTITY_KEY: node[model.ENTITY_KEY]}, model.cursor, include_query, exclude_query, process_exclude, attrs_out_query, attrs_filter)
+                if found_object:
+                    end_index = offsets[end_word] + int(len(words[end_word]))
+                    ret.append((found_object[model.ENTITY_KEY], found_object[model.ATTRS_KEY], source_string[offsets[word_index]:end_index], offsets[word_index], end_index if end_index < total_length else total_length - 1))
+                    word_index = end_word
+                    break
+            word_index += 1
+        return ret
 
     def disambiguate(self, model, recognized, srcs, word_separator):
         """For a list of identified datapoints, weighs context of identified labels that belong to more than 1 entity and keeps heaviest ones.
@@ -728,7 +1542,50 @@ class Utility():
         ret = [x[0] for x in sorted_segments if len(x) > 0]
         return ret
 
-    def parse(self, model, source_string, attrs_where=None, attrs_out=None):
+    def compile_attrs_filter(self, attrs_where=None, attrs_out=None, in_memory=False):
+        """Compiles specifications for filtering model's data into reusable filter that can be passed to parse() function multiple times.
+        Returns dict with compiled filter (queries in the filter use bound parameters, so the database only has to prepare them once).
+
+        Args:
+            dict *attrs_where*: specifications for filtering model's data used for recognition
+            list *attrs_out*: list of attribute names to output
+            bool *in_memory*: if True, conditions are resolved once per model into bitsets of qualifying line numbers (see Model.get_filter_bitset()), and filtering spotted entities does not query the database
+
+        Data structure for *attrs_where*:
+            {
+                '+': {str attribute_name: {str attribute_value}}, # if indicated, only entities that have these attributes will be considered
+                '-': {str attribute_name: {str attribute_value}} # if indicated, entities that have these attributes will not be considered
+            }
+        """
+        attributes = attrs_where if attrs_where is not None else {}
+        conditions = {}
+        for action in ['+', '-']:
+            conditions[action] = tuple(sorted(set([(attr_name, attr_value) for attr_name in attributes.get(action, {}) for attr_value in attributes[action][attr_name]])))
+        attrs_names = tuple(attrs_out) if attrs_out is not None else ()
+        attrs_filter = {
+            'include': conditions['+'],
+            'exclude': conditions['-'],
+            'attrs_out': attrs_names,
+            'signature': (conditions['+'], conditions['-'], attrs_names),
+            'include_query': '',
+            'include_params': (),
+            'exclude_query': '',
+            'exclude_params': (),
+            'process_exclude': len(conditions['-']) > 0,
+            'in_memory': in_memory,
+            'attrs_out_query': '',
+            'attrs_out_params': ()
+        }
+        for action, key in [('+', 'include'), ('-', 'exclude')]:
+            if len(conditions[action]) > 0:
+                attrs_filter['%s_query' % (key)] = 'and (' + ' or '.join(['(attr_name = ? and attr_value = ?)'] * len(conditions[action])) + ')'
+                attrs_filter['%s_params' % (key)] = tuple([x for condition in conditions[action] for x in condition])
+        if len(attrs_names) > 0:
+            attrs_filter['attrs_out_query'] = ' and attr_name in (%s)' % (', '.join(['?'] * len(attrs_names)))
+            attrs_filter['attrs_out_params'] = attrs_names
+        return attrs_filter
+
+    def parse(self, model, source_string, attrs_where=None, attrs_out=None, attrs_filter=None):
         """Wraps around all functions that normalize string, spot entities, disambiguate, and post-process the output.
         Returns dict {(int *begin*, int *end*): {str *attribute_name*: {str attribute_value}}}.
 
@@ -737,6 +1594,7 @@ class Utility():
             str *source_string*: source string to parse
             dict *attrs_where*: specifications for filtering model's data used for recognition
             list *attrs_out*: list of attribute names to output
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, *attrs_where* and *attrs_out* are ignored)
 
         Data structure for *attrs_where*:
             {
@@ -744,52 +1602,397 @@ class Utility():
                 '-': {str attribute_name: {str attribute_value}} # if indicated, entities that have these attributes will not be considered
             }
         """
-        attributes = attrs_where
-        if attributes is None:
-            attributes = {}
-        for action in ['+', '-']:
-            if action not in attributes:
-                attributes[action] = {}
-        process_exclude = False
-        include_set, include_query = set(), ''
-        for attr_name in attributes['+']:
-            for attr_value in attributes['+'][attr_name]:
-                include_set.add('(attr_name = \'' + attr_name.replace('\'', '\'\'') + '\' and attr_value = \'' + attr_value.replace('\'', '\'\'') + '\')')
-        if len(include_set) > 0:
-            include_query = 'and (' + ' or '.join(include_set) + ')'
-        exclude_set, exclude_query = set(), ''
-        for attr_name in attributes['-']:
-            for attr_value in attributes['-'][attr_name]:
-                exclude_set.add('(attr_name = \'' + attr_name.replace('\'', '\'\'') + '\' and attr_value = \'' + attr_value.replace('\'', '\'\'') + '\')')
-        if len(exclude_set) > 0:
-            exclude_query = 'and (' + ' or '.join(exclude_set) + ')'
-            process_exclude = True
-        attrs_out_query = ''
-        if attrs_out is not None and len(attrs_out) > 0:
-            attrs_out_query = ' and attr_name in (\'%s\')' % ('\', \''.join([x.replace('\'', '\'\'') for x in attrs_out]))
+        if attrs_filter is None:
+            attrs_filter = self.compile_attrs_filter(attrs_where, attrs_out)
         self.logger('Parsing text...')
         self.push_message('Parsing text', self.callback_status)
-        rets = []
         total_normalizers = int(len(model[model.NORMALIZER_KEY]))
         try:
             assert total_normalizers > 0, 'Model does not have normalization units'
         except Exception as e:
             model.destroy()
             raise e
-        spot_progress_share = int(100 / total_normalizers)
-        current_normalizer_index = 0
-        for normalizer_name in model[model.NORMALIZER_KEY]:
-            normalized_string = model[model.NORMALIZER_KEY][normalizer_name].normalize(source_string, model[model.WORD_SEPARATOR_KEY], model[model.TOKENIZER_OPTION_KEY])
-            character_map = model[model.NORMALIZER_KEY][normalizer_name].result['map']
-            r_character_map = model[model.NORMALIZER_KEY][normalizer_name].result['r_map']
-            progress_from = current_normalizer_index * spot_progress_share
-            progress_to = (current_normalizer_index + 1) * spot_progress_share
-            parsed = self.spot_entities(model, normalized_string, normalizer_name, include_query, exclude_query, process_exclude, attrs_out_query, progress_from=progress_from, progress_to=progress_to)
-            rets.append(((character_map, r_character_map), parsed, normalized_string))
-            current_normalizer_index += 1
+        # strings are only normalized by normalization units that have labels in the model
+        normalized_strings = {}
+        character_maps = {}
+        for normalizer_name in model.get_used_normalizers():
+            normalized_strings[normalizer_name] = model[model.NORMALIZER_KEY][normalizer_name].normalize(source_string, model[model.WORD_SEPARATOR_KEY], model[model.TOKENIZER_OPTION_KEY])
+            character_maps[normalizer_name] = (model[model.NORMALIZER_KEY][normalizer_name].result['map'], model[model.NORMALIZER_KEY][normalizer_name].result['r_map'])
+        spotted = self.spot_normalized_entities(model, normalized_strings, attrs_filter=attrs_filter)
+        rets = [(character_maps[normalizer_name], spotted[normalizer_name], normalized_strings[normalizer_name]) for normalizer_name in normalized_strings]
         layers = self.flatten_layers(model, rets)
         spans = self.flatten_spans(layers)
         locations = self.reduce_spans(set(spans.keys()))
         ret = {location: spans[location] for location in locations}
         self.logger('Done parsing text.')
         return ret
+
+    def parse_stream(self, model, stream, attrs_where=None, attrs_out=None, attrs_filter=None, chunk_size=65536, window=1024):
+        """Parses text that comes from file object or iterable of strings piece by piece, so that the whole text never has to be held in memory.
+        Text is accumulated until it is longer than *chunk_size* + *window*, then it is cut at the last word separator and parsed (see parse()).
+        If there is no word separator to cut at, the text is cut inside a word, so that it is never accumulated without bound.
+        Entities that begin within the last *window* characters of the parsed piece are not reported, and the text from there (or from the end of the last reported entity) is carried over to the next piece.
+        Returns generator of tuples ((int *begin*, int *end*), {str *attribute_name*: {str attribute_value}}) in order of *begin* where *begin* and *end* are counted from the beginning of the whole text.
+
+        Args:
+            Model *model*: Model instance to use
+            *stream*: file object opened in text mode, or iterable of strings
+            dict *attrs_where*: specifications for filtering model's data used for recognition
+            list *attrs_out*: list of attribute names to output
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, *attrs_where* and *attrs_out* are ignored)
+            int *chunk_size*: number of characters to read from *stream* at once
+            int *window*: number of characters to carry over to the next piece (must be greater than the longest label in *model*, otherwise labels on the boundary might be missed)
+
+        NB: keywords used for disambiguation are only looked up within a single piece of text.
+        """
+        if attrs_filter is None:
+            attrs_filter = self.compile_attrs_filter(attrs_where, attrs_out)
+        word_separator = model[model.WORD_SEPARATOR_KEY]
+        chunks = iter(lambda: stream.read(chunk_size), '') if hasattr(stream, 'read') else iter(stream)
+        buffer = ''
+        offset = 0
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) < chunk_size + window:
+                continue
+            limit = buffer.rfind(word_separator)
+            if limit <= window:
+                # no word separator beyond the window: parse the whole buffer
+                limit = len(buffer)
+            commit = buffer.rfind(word_separator, 0, max(limit - window, 0))
+            if commit <= 0:
+                # no word separator before the window: cut inside a word rather than let the buffer grow
+                commit = limit - window
+            parsed = self.parse(model, buffer[:limit], attrs_filter=attrs_filter)
+            restart = commit
+            for location in sorted(parsed):
+                if location[0] >= commit:
+                    break
+                restart = max(restart, location[1])
+                yield (location[0] + offset, location[1] + offset), parsed[location]
+            buffer = buffer[restart:]
+            offset += restart
+        if buffer:
+            parsed = self.parse(model, buffer, attrs_filter=attrs_filter)
+            for location in sorted(parsed):
+                yield (location[0] + offset, location[1] + offset), parsed[location]
+
+    def parse_many(self, model, texts, workers=0, chunksize=1, attrs_where=None, attrs_out=None, attrs_filter=None, model_filename='', ordered=True):
+        """Parses many strings in parallel worker processes (see parse()).
+        Returns generator of dicts {(int *begin*, int *end*): {str *attribute_name*: {str attribute_value}}} in the same order as *texts*, or tuples (int *index*, dict *parsed*) in order of completion if *ordered* is False.
+
+        Args:
+            Model *model*: Model instance to use
+            *texts*: iterable of strings to parse
+            int *workers*: number of worker processes (default 0, as many as there are CPUs)
+            int *chunksize*: number of strings sent to a worker at once
+            dict *attrs_where*: specifications for filtering model's data used for recognition
+            list *attrs_out*: list of attribute names to output
+            dict *attrs_filter*: filter compiled by compile_attrs_filter() (if provided, *attrs_where* and *attrs_out* are ignored)
+            str *model_filename*: path and filename prefix of saved *model* (if provided, each worker loads the model from disk rather than inherits it from this process)
+            bool *ordered*: whether yield results in the order of *texts*
+
+        NB: if *model_filename* is not provided, the model is shared with workers by forking this process, which is not available on all platforms.
+        Each worker opens its own read-only connection to the database that stores attributes.
+        """
+        if attrs_filter is None:
+            attrs_filter = self.compile_attrs_filter(attrs_where, attrs_out)
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        chunksize = max(chunksize, 1)
+        if model_filename != '':
+            context = multiprocessing.get_context()
+            initargs = (type(model), model_filename, None, attrs_filter, self.debug, self.verbose)
+        else:
+            assert 'fork' in multiprocessing.get_all_start_methods(), 'Model cannot be shared with worker processes on this platform, save it and provide model_filename'
+            assert model.connection is None or os.path.exists(model[model.DATASOURCE_KEY]), 'Attributes stored in memory cannot be shared with worker processes'
+            context = multiprocessing.get_context('fork')
+            initargs = (type(model), '', model, attrs_filter, self.debug, self.verbose)
+        self.logger('Parsing texts with %d worker(s)...' % (workers))
+        return parse_in_processes(context, workers, initargs, texts, chunksize, ordered)
+
+    def start_shard_workers(self, model, workers=0):
+        """Starts worker processes that spot entities in tries of a sharded model (compiled with *item_limit* > 0) simultaneously.
+        Once started, spot_entities() (hence parse()) sends each trie of *model* to a worker and merges results in the same order as tries are stored in the model.
+
+        Args:
+            Model *model*: Model instance to use (must not be changed while workers are running; restart workers if it is)
+            int *workers*: number of worker processes (default 0, as many as there are CPUs, but not more than there are tries in the model)
+
+        NB: the model is shared with workers by forking this process, which is not available on all platforms.
+        Each worker opens its own read-only connection to the database that stores attributes.
+        Sending data to workers takes time, so this is only worth it for long strings and models with several large tries.
+        """
+        self.stop_shard_workers()
+        assert 'fork' in multiprocessing.get_all_start_methods(), 'Model cannot be shared with worker processes on this platform'
+        assert model.connection is None or os.path.exists(model[model.DATASOURCE_KEY]), 'Attributes stored in memory cannot be shared with worker processes'
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        workers = max(min(workers, len(model[model.DICTIONARY_KEY])), 1)
+        context = multiprocessing.get_context('fork')
+        tasks = context.Queue()
+        results = context.Queue()
+        initargs = (type(model), '', model, self.debug, self.verbose)
+        processes = [context.Process(target=run_shard_worker, args=(initargs, tasks, results), daemon=True) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        self.shard_workers = (model, processes, tasks, results)
+        self.logger('Started %d shard worker(s)' % (workers))
+
+    def stop_shard_workers(self):
+        """Stops worker processes started by start_shard_workers(), if any."""
+        if self.shard_workers is None:
+            return
+        _, processes, tasks, _ = self.shard_workers
+        self.shard_workers = None
+        for process in processes:
+            tasks.put(None)
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.logger('Stopped shard workers')
+
+# connections inherited by worker processes from parent process, kept so that they are never closed (nor garbage-collected) in a worker
+inherited_connections = []
+
+def init_parse_worker(model_class, model_filename, model):
+    """Prepares model for worker process of Utility.parse_many().
+    Returns Model instance that has its own read-only connection to the database that stores attributes.
+
+    Args:
+        type *model_class*: class of the model
+        str *model_filename*: path and filename prefix of saved model (if provided, the model is loaded from disk)
+        Model *model*: Model instance inherited from parent process (used if *model_filename* is not provided)
+    """
+    if model_filename != '':
+        model = model_class(filename=model_filename, storage_location=':memory:')
+        if model.connection is not None:
+            model.connection.close()
+    elif model.connection is not None:
+        # connection inherited from parent process must not be used or closed here
+        inherited_connections.append((model.connection, model.cursor))
+    if model.connection is not None:
+        model.connect(read_only=True)
+    return model
+
+def run_parse_worker(initargs, tasks, results):
+    """Parses chunks of strings from *tasks* queue and puts results to *results* queue until None is received.
+
+    Args:
+        tuple *initargs*: (type *model_class*, str *model_filename*, Model *model*, dict *attrs_filter*, bool *debug_mode*, bool *verbose_mode*)
+        *tasks*: queue of tuples (int *chunk_number*, list *chunk*) where *chunk* is list of tuples (int *index*, str *source_string*)
+        *results*: queue of tuples (int *chunk_number*, list *parsed*) where *parsed* is list of tuples (int *index*, dict *parsed*), or (int *chunk_number*, Exception *e*) if parsing failed
+    """
+    model = init_parse_worker(initargs[0], initargs[1], initargs[2])
+    utility = Utility(debug_mode=initargs[4], verbose_mode=initargs[5])
+    for chunk_number, chunk in iter(tasks.get, None):
+        try:
+            results.put((chunk_number, [(index, utility.parse(model, source_string, attrs_filter=initargs[3])) for index, source_string in chunk]))
+        except Exception as e:
+            results.put((chunk_number, e))
+
+def parse_in_processes(context, workers, initargs, texts, chunksize, ordered):
+    """Distributes strings across worker processes (see Utility.parse_many()).
+    Returns generator of parsed strings.
+
+    Args:
+        *context*: multiprocessing context to start processes with
+        int *workers*: number of worker processes
+        tuple *initargs*: arguments for run_parse_worker()
+        *texts*: iterable of strings to parse
+        int *chunksize*: number of strings sent to a worker at once
+        bool *ordered*: whether yield results in the order of *texts*
+    """
+    tasks = context.Queue()
+    results = context.Queue()
+    processes = [context.Process(target=run_parse_worker, args=(initargs, tasks, results), daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    completed = {}
+    next_chunk_number = 0
+    pending = 0
+    chunk = []
+    chunk_number = 0
+    finished = False
+    try:
+        texts = iter(texts)
+        while True:
+            while not finished and pending < 2 * workers:
+                chunk = [x for _, x in zip(range(chunksize), texts)]
+                if not chunk:
+                    finished = True
+                    break
+                tasks.put((chunk_number, [(chunk_number * chunksize + i, chunk[i]) for i in range(len(chunk))]))
+                chunk_number += 1
+                pending += 1
+            if pending == 0:
+                break
+            while True:
+                try:
+                    received = results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    assert all([process.is_alive() for process in processes]), 'Worker process exited unexpectedly'
+            pending -= 1
+            if isinstance(received[1], Exception):
+                raise received[1]
+            if not ordered:
+                for parsed in received[1]:
+                    yield parsed
+                continue
+            completed[received[0]] = received[1]
+            while next_chunk_number in completed:
+                for parsed in completed.pop(next_chunk_number):
+                    yield parsed[1]
+                next_chunk_number += 1
+        for process in processes:
+            tasks.put(None)
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+def run_shard_worker(initargs, tasks, results):
+    """Spots entities in single tries from *tasks* queue and puts results to *results* queue until None is received.
+
+    Args:
+        tuple *initargs*: (type *model_class*, str *model_filename*, Model *model*, bool *debug_mode*, bool *verbose_mode*)
+        *tasks*: queue of tuples (int *trie_number*, list *args_list*) where *args_list* is list of tuples of arguments for Utility.spot_trie_entities() that follow *trie*
+        *results*: queue of tuples (int *trie_number*, list *spotted*) where *spotted* is list of results for each member of *args_list*, or (int *trie_number*, Exception *e*) if spotting failed
+    """
+    model = init_parse_worker(initargs[0], initargs[1], initargs[2])
+    utility = Utility(debug_mode=initargs[3], verbose_mode=initargs[4])
+    for trie_number, args_list in iter(tasks.get, None):
+        try:
+            spotted = []
+            for args in args_list:
+                if model.is_empty_trie(model[model.DICTIONARY_KEY][trie_number], args[1]):
+                    spotted.append([])
+                    continue
+                trie = model.get_trie(trie_number, args[1])
+                if model.is_empty_trie(trie, args[1]):
+                    spotted.append([])
+                else:
+                    spotted.append(utility.spot_trie_entities(model, trie, *args))
+            results.put((trie_number, spotted))
+        except Exception as e:
+            results.put((trie_number, e))
+
+def spot_in_processes(shard_workers, total_tries, args_list):
+    """Sends every trie of a model to shard workers (see Utility.start_shard_workers()) and collects results.
+    Returns list(list(tuple *datapoint*)) with results for each member of *args_list* (see Utility.spot_entities() for details).
+
+    Args:
+        tuple *shard_workers*: (Model *model*, list *processes*, *tasks*, *results*)
+        int *total_tries*: number of tries in the model
+        list *args_list*: list of tuples of arguments for Utility.spot_dict_entities() that follow *trie*
+    """
+    _, processes, tasks, results = shard_workers
+    for trie_number in range(total_tries):
+        tasks.put((trie_number, args_list))
+    completed = {}
+    while len(completed) < total_tries:
+        try:
+            received = results.get(timeout=1)
+        except queue.Empty:
+            assert all([process.is_alive() for process in processes]), 'Worker process exited unexpectedly'
+            continue
+        completed[received[0]] = received[1]
+    rets = [[] for _ in args_list]
+    for trie_number in range(total_tries):
+        if isinstance(completed[trie_number], Exception):
+            raise completed[trie_number]
+        for i in range(len(args_list)):
+            rets[i] += completed[trie_number][i]
+    return rets
+
+def split_file(filename, parts):
+    """Splits a file into ranges of whole lines.
+    Returns list of tuples (int *begin*, int *end*) where *begin* and *end* are byte offsets.
+
+    Args:
+        str *filename*: path and name of the file
+        int *parts*: minimum number of ranges (unless the file has fewer lines)
+    """
+    total_bytes = os.path.getsize(filename)
+    part_bytes = max(int(total_bytes / parts), 1)
+    ret = []
+    begin = 0
+    with open(filename, mode='rb') as f:
+        while begin < total_bytes:
+            f.seek(min(begin + part_bytes, total_bytes) - 1)
+            f.readline()
+            end = f.tell()
+            ret.append((begin, end))
+            begin = end
+    return ret
+
+def run_normalize_worker(initargs, tasks, results):
+    """Normalizes synonyms in ranges of lines from *tasks* queue and puts results to *results* queue until None is received.
+
+    Args:
+        tuple *initargs*: (Model *model*, dict *specs*, str *word_separator*, str *column_separator*, str *column_enclosure*, int *tokenizer_option*)
+        *tasks*: queue of tuples (int *chunk_number*, str *filename*, int *begin*, int *end*) where *begin* and *end* are byte offsets of the range
+        *results*: queue of tuples (int *chunk_number*, list *synonyms*) where *synonyms* is list of tuples (str *normalized_synonym*, str *normalization_unit_name*), or (int *chunk_number*, Exception *e*) if normalization failed
+    """
+    model, specs, word_separator, column_separator, column_enclosure, tokenizer_option = initargs
+    for chunk_number, filename, begin, end in iter(tasks.get, None):
+        try:
+            with open(filename, mode='rb') as f:
+                f.seek(begin)
+                lines = io.StringIO(f.read(end - begin).decode('utf8'), newline=None)
+            chunk = []
+            for line in lines:
+                columns = [x.strip(column_enclosure) for x in line.strip('\n').split(column_separator)]
+                chunk.append(model.get_dictionary_synonym(columns, specs, word_separator, tokenizer_option))
+            results.put((chunk_number, chunk))
+        except Exception as e:
+            results.put((chunk_number, e))
+
+def normalize_in_processes(context, workers, initargs, filename):
+    """Distributes ranges of lines of a file across worker processes that normalize synonyms (see Utility.make_recognizer()).
+    Returns generator of tuples (str *normalized_synonym*, str *normalization_unit_name*) in the same order as lines in the file.
+
+    Args:
+        *context*: multiprocessing context to start processes with
+        int *workers*: number of worker processes
+        tuple *initargs*: arguments for run_normalize_worker()
+        str *filename*: path and name of tab-delimited text file with the content
+    """
+    ranges = split_file(filename, workers * 16)
+    tasks = context.Queue()
+    results = context.Queue()
+    processes = [context.Process(target=run_normalize_worker, args=(initargs, tasks, results), daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    completed = {}
+    next_chunk_number = 0
+    chunk_number = 0
+    try:
+        while next_chunk_number < len(ranges):
+            while chunk_number < len(ranges) and chunk_number < next_chunk_number + 2 * workers:
+                tasks.put((chunk_number, filename, ranges[chunk_number][0], ranges[chunk_number][1]))
+                chunk_number += 1
+            while next_chunk_number not in completed:
+                try:
+                    received = results.get(timeout=1)
+                except queue.Empty:
+                    assert all([process.is_alive() for process in processes]), 'Worker process exited unexpectedly'
+                    continue
+                if isinstance(received[1], Exception):
+                    raise received[1]
+                completed[received[0]] = received[1]
+            for synonym in completed.pop(next_chunk_number):
+                yield synonym
+            next_chunk_number += 1
+        for process in processes:
+            tasks.put(None)
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
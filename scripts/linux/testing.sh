@@ -7,6 +7,8 @@ ENV=.env.36
 TEST=${ROOT}/test
 FILES="ut_model.py ut_utility.py performance.py"
 cd ${ROOT}
+echo Importing pilsner
+${ROOT}/${ENV}/bin/python3 -c "import pilsner" || exit 1
 for FILE in ${FILES}
 do
     echo Running ${FILE}
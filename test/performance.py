@@ -3,6 +3,8 @@ import sys; sys.path.insert(0, '')
 import random
 import string
 import timeit
+import tracemalloc
+import importlib
 
 ENTITIES_IN_DICTIONARY = 50000
 WORDS_IN_TEXT = 100000
@@ -225,6 +227,79 @@ model.destroy()
             )
         )
 
+def perf_trie_layouts(modules_to_test):
+    n = 1
+    fields = [
+        {'name': 'entity_id', 'include': True, 'delimiter': None, 'id_flag': True, 'normalizer_flag': False, 'value_flag': False},
+        {'name': 'label', 'include': True, 'delimiter': None, 'id_flag': False, 'normalizer_flag': False, 'value_flag': True},
+        {'name': 'label_attr', 'include': True, 'delimiter': ',', 'id_flag': False, 'normalizer_flag': False, 'value_flag': False},
+        {'name': 'entity_attr', 'include': True, 'delimiter': None, 'id_flag': False, 'normalizer_flag': False, 'value_flag': False}
+    ]
+    for x in modules_to_test:
+        pilsner = importlib.import_module(x)
+        for layout in ['dict', 'compact', 'mapped']:
+            model = pilsner.Model()
+            model.add_normalizer('standard', None)
+            utility = pilsner.Utility()
+            utility.compile_model(model, '.test-dict.txt', fields, ' ', '\t', '\n', compact=layout != 'dict')
+            model.save('.test-model-%s' % (layout), mapped=layout == 'mapped')
+            model.destroy()
+            tracemalloc.start()
+            model = pilsner.Model()
+            model.load('.test-model-%s' % (layout))
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            model.destroy()
+            print(
+                '%s: model with %d entities in %s layout takes %f MB in memory' % (
+                    x,
+                    ENTITIES_IN_DICTIONARY,
+                    layout,
+                    memory / 1048576
+                )
+            )
+            print(
+                '%s: loaded model with %d entities in %s layout in %f seconds' % (
+                    x,
+                    ENTITIES_IN_DICTIONARY,
+                    layout,
+                    timeit.timeit(
+                        setup = """
+import %s as pilsner
+model = pilsner.Model()
+""" % (x),
+                        stmt="""
+model.load('.test-model-%s')
+model.destroy()
+""" % (layout),
+                        number=n
+                    )
+                )
+            )
+            print(
+                '%s: parsed text with %d words in .test-text.txt using model with %d entities in %s layout in %f seconds' % (
+                    x,
+                    WORDS_IN_TEXT,
+                    ENTITIES_IN_DICTIONARY,
+                    layout,
+                    timeit.timeit(
+                        setup = """
+import %s as pilsner
+model = pilsner.Model()
+model.load('.test-model-%s')
+utility = pilsner.Utility()
+with open('.test-text.txt', mode='r', encoding='utf8') as f:
+    test_text = f.read()
+""" % (x, layout),
+                        stmt="""
+found = utility.parse(model, test_text)
+model.destroy()
+""",
+                        number=n
+                    )
+                )
+            )
+
 def cleanup():
     for filename in [
         '.test-dict.txt',
@@ -234,6 +309,10 @@ def cleanup():
         '.test-model.attributes',
         '.test-model.keywords',
         '.test-model.normalizers'
+    ] + [
+        '.test-model-%s.%s' % (layout, ext) for layout in ['dict', 'compact'] for ext in ['0.dictionary', 'attributes', 'keywords', 'normalizers']
+    ] + [
+        '.test-model-mapped.%s' % (ext) for ext in ['0.mapped_dictionary', 'attributes', 'mapped_keywords', 'normalizers']
     ]:
         os.remove(filename)
 
@@ -241,4 +320,5 @@ if __name__ == '__main__':
     create_test_dataset()
     perf_compile_model_save_model(['pilsner', 'bin'])
     perf_load_model_parse_test(['pilsner', 'bin'])
+    perf_trie_layouts(['pilsner', 'bin'])
     cleanup()
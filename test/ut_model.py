@@ -1,4 +1,7 @@
+import gc
 import os
+import pickle
+import sqlite3
 import sys
 import unittest
 
@@ -42,6 +45,30 @@ class TestModel(unittest.TestCase):
         os.remove('./.test_save.keywords')
         os.remove('./.test_save.normalizers')
 
+    def test_save_attributes_without_backup(self):
+        class Connection():
+            # connection of Python 3.6 has no backup() method
+            def __init__(self, connection):
+                self.connection = connection
+            def commit(self):
+                return self.connection.commit()
+            def iterdump(self):
+                return self.connection.iterdump()
+        for model in [self.model, pilsner.Model(storage_location=':memory:')]:
+            connection = model.connection
+            model.cursor.execute('create table test_table (x int);')
+            model.cursor.execute('insert into test_table values (1);')
+            model.connection = Connection(connection)
+            model.save_attributes('./.test_save_attributes_without_backup')
+            model.connection = connection
+            saved = sqlite3.connect('./.test_save_attributes_without_backup')
+            rows = list(saved.execute('select x from test_table;'))
+            saved.close()
+            os.remove('./.test_save_attributes_without_backup')
+            if model is not self.model:
+                model.destroy()
+            assert rows == [(1,)], 'Expected [(1,)], got %s' % (str(rows))
+
     def test_save_simple(self):
         self.simple_model[self.model.DICTIONARY_KEY].append({})
         self.simple_model.save('./.test_save_simple')
@@ -69,6 +96,23 @@ class TestModel(unittest.TestCase):
         os.remove('./.test_load.keywords')
         os.remove('./.test_load.normalizers')
 
+    def test_load_pause_gc(self):
+        self.model[self.model.DICTIONARY_KEY].append({'a': {'b': {'c': 'def'}}})
+        self.model.save('./.test_load_pause_gc')
+        states = []
+        class GcModel(pilsner.Model):
+            def load_trie(self, filename, lazy=False):
+                states.append(gc.isenabled())
+                return pilsner.Model.load_trie(self, filename, lazy)
+        for pause_gc in [False, True]:
+            another_model = GcModel(pause_gc=pause_gc)
+            another_model.load('./.test_load_pause_gc')
+            another_model.destroy()
+        for filename in ['./.test_load_pause_gc.0.dictionary', './.test_load_pause_gc.attributes', './.test_load_pause_gc.keywords', './.test_load_pause_gc.normalizers']:
+            os.remove(filename)
+        assert states == [True, False], 'Garbage collector is expected to be paused only with pause_gc=True, got %s' % (str(states))
+        assert gc.isenabled(), 'Garbage collector is expected to be enabled once model is loaded'
+
     def test_load_simple(self):
         self.simple_model[self.model.DICTIONARY_KEY].append({'a': {'b': {'c': 'def'}}})
         self.simple_model[self.model.DICTIONARY_KEY].append({'g': {'h': {'i': 'jkl'}}})
@@ -84,11 +128,197 @@ class TestModel(unittest.TestCase):
         os.remove('./.test_load_simple.keywords')
         os.remove('./.test_load_simple.normalizers')
 
+    def test_save_load_mapped(self):
+        # radiology, radiotelescope
+        subtrie = {'r': {'a': {'d': {'i': {'o': {'l': {'o': {'g': {'y': {self.model.ENTITY_KEY: [1]}}}}, 't': {'e': {'l': {'e': {'s': {'c': {'o': {'p': {'e': {self.model.ENTITY_KEY: [2]}}}}}}}}}}}}}}}
+        packed = self.model.pack_trie({self.model.CONTENT_KEY: {'t1': subtrie}, self.model.COMPRESSED_KEY: 1}, True)
+        keywords = {self.model.CONTENT_KEY: {0: {'x', 'y'}, 2: {'z'}}, self.model.INTERNAL_ID_KEY: {0: 0, 1: 2, 3: 2}}
+        self.model[self.model.DICTIONARY_KEY].append(packed)
+        self.model[self.model.KEYWORDS_KEY] = keywords
+        self.model.save('./.test_load_mapped', mapped=True)
+        assert os.path.exists('./.test_load_mapped.0.mapped_dictionary'), 'Dictionary file was not saved'
+        assert os.path.exists('./.test_load_mapped.mapped_keywords'), 'Keywords file was not saved'
+        another_model = pilsner.Model()
+        another_model.load('./.test_load_mapped')
+        content = another_model[another_model.DICTIONARY_KEY][0][another_model.CONTENT_KEY]['t1']
+        assert content[another_model.LABELS_KEY].find('t', 6, 8) == 7, 'Label \'t\' is expected to be found at node 7'
+        assert content[another_model.LABELS_KEY].find('x', 0, 19) == -1, 'Label \'x\' is not expected to be found'
+        assert 2 in another_model[another_model.KEYWORDS_KEY][another_model.CONTENT_KEY] and 1 not in another_model[another_model.KEYWORDS_KEY][another_model.CONTENT_KEY], 'Unexpected keys in mapped keywords'
+        loaded_keywords = {k: dict(another_model[another_model.KEYWORDS_KEY][k]) for k in another_model[another_model.KEYWORDS_KEY]}
+        assert loaded_keywords == keywords, 'Loaded keywords %s != saved keywords %s' % (str(loaded_keywords), str(keywords))
+        another_model.set_trie_layout(another_model.DICT_LAYOUT)
+        assert another_model[another_model.DICTIONARY_KEY] == [packed], 'Loaded model %s != saved model %s' % (str(another_model[another_model.DICTIONARY_KEY]), str([packed]))
+        another_model.destroy()
+        del(another_model)
+        os.remove('./.test_load_mapped.0.mapped_dictionary')
+        os.remove('./.test_load_mapped.attributes')
+        os.remove('./.test_load_mapped.mapped_keywords')
+        os.remove('./.test_load_mapped.normalizers')
+
+    def test_save_load_trie(self):
+        # radiology, radiotelescope
+        subtrie = {'r': {'a': {'d': {'i': {'o': {'l': {'o': {'g': {'y': {self.model.ENTITY_KEY: [1]}}}}, 't': {'e': {'l': {'e': {'s': {'c': {'o': {'p': {'e': {self.model.ENTITY_KEY: [2], self.model.IGNORE_KEY: []}}}}}}}}}}}}}}}
+        trie = {self.model.CONTENT_KEY: {'t1': subtrie, 't2': {}}, self.model.COMPRESSED_KEY: 0}
+        self.model.save_trie('./.test_save_load_trie', trie)
+        with open('./.test_save_load_trie', mode='rb') as f:
+            signature = f.read(8)
+        output = self.model.load_trie('./.test_save_load_trie')
+        with open('./.test_save_load_trie', mode='wb') as f:
+            pickle.dump(trie, f)
+        legacy_output = self.model.load_trie('./.test_save_load_trie')
+        os.remove('./.test_save_load_trie')
+        assert signature == self.model.TRIE_SIGNATURE, 'File is expected to start with %s, got %s' % (str(self.model.TRIE_SIGNATURE), str(signature))
+        assert output == trie, 'Loaded trie %s != saved trie %s' % (str(output), str(trie))
+        assert list(output[self.model.CONTENT_KEY]) == ['t1', 't2'], 'Unexpected tries %s' % (str(list(output[self.model.CONTENT_KEY])))
+        assert legacy_output == trie, 'Loaded pickled trie %s != saved trie %s' % (str(legacy_output), str(trie))
+
+    def test_lazy_tries(self):
+        tries = [
+            {self.model.CONTENT_KEY: {'t1': {'a': {'b': {self.model.ENTITY_KEY: [0]}}}, 't2': {'c': {self.model.ENTITY_KEY: [1]}}}, self.model.COMPRESSED_KEY: 0},
+            {self.model.CONTENT_KEY: {'t1': {'d': {self.model.ENTITY_KEY: [2]}}, 't2': {'e': {'f': {self.model.ENTITY_KEY: [3]}}}}, self.model.COMPRESSED_KEY: 0}
+        ]
+        self.model[self.model.DICTIONARY_KEY] = tries
+        self.model.save('./.test_lazy_tries')
+        another_model = pilsner.Model('./.test_lazy_tries', lazy_tries=True, resident_tries=1)
+        output = [list(trie[another_model.CONTENT_KEY]) for trie in another_model[another_model.DICTIONARY_KEY]]
+        assert output == [[], []], 'Tries are not expected to be read yet, got %s' % (str(output))
+        trie = another_model.get_trie(0, 't1')
+        assert trie[another_model.CONTENT_KEY] == {'t1': tries[0][another_model.CONTENT_KEY]['t1']}, 'Unexpected tries %s' % (str(trie[another_model.CONTENT_KEY]))
+        another_model.get_trie(1, 't2')
+        output = [list(trie[another_model.CONTENT_KEY]) for trie in another_model[another_model.DICTIONARY_KEY]]
+        assert output == [[], ['t2']], 'Least recently used tries are expected to be unloaded, got %s' % (str(output))
+        another_model.mark_dirty(1)
+        assert not another_model.unload_trie(1, 't2'), 'Changed tries are not expected to be unloaded'
+        another_model.load_tries()
+        output = [{k: trie[k] for k in trie if k != another_model.SOURCE_KEY} for trie in another_model[another_model.DICTIONARY_KEY]]
+        another_model.destroy()
+        del(another_model)
+        for filename in ['./.test_lazy_tries.0.dictionary', './.test_lazy_tries.1.dictionary', './.test_lazy_tries.attributes', './.test_lazy_tries.keywords', './.test_lazy_tries.normalizers']:
+            os.remove(filename)
+        assert output == tries, 'Loaded tries %s != saved tries %s' % (str(output), str(tries))
+
+    def test_memory_usage(self):
+        self.model[self.model.DICTIONARY_KEY].append({self.model.CONTENT_KEY: {'t1': {'a': {'b': {self.model.ENTITY_KEY: [0]}}}}, self.model.COMPRESSED_KEY: 0})
+        usage = self.model.memory_usage()
+        assert sorted(usage) == ['attributes', 'keywords', 'total', 'tries'], 'Unexpected keys %s' % (str(list(usage)))
+        assert usage['tries'] > 0 and usage['total'] == usage['tries'] + usage['keywords'] + usage['attributes'], 'Unexpected usage %s' % (str(usage))
+        assert (0, 't1') in self.model.memory_sizes, 'Size of trie is expected to be remembered'
+        self.model[self.model.DICTIONARY_KEY][0][self.model.CONTENT_KEY]['t1']['c'] = {self.model.ENTITY_KEY: [1]}
+        self.model.mark_dirty(0)
+        assert (0, 't1') not in self.model.memory_sizes, 'Size of changed trie is expected to be forgotten'
+        output = self.model.memory_usage()['tries']
+        assert output > usage['tries'], 'Size of changed trie %d is expected to be greater than %d' % (output, usage['tries'])
+        specs = {'fields': {'entity_id': (0, None, False, False), 'label': (1, None, False, True)}, 'id': (0, None, False, False), 'tokenizer': None, 'value': (1, None, False, True)}
+        model = pilsner.Model(attrs_store=pilsner.MemoryAttributes())
+        usage = model.memory_usage()['attributes']
+        for line_number in range(100):
+            model.store_attributes(line_number, line_number, {}, specs, ['e%d' % (line_number), 'label'])
+        output = model.memory_usage()['attributes']
+        model.destroy()
+        assert output > usage, 'Size of attributes %d is expected to be greater than %d once they are stored' % (output, usage)
+
+    def test_model_registry(self):
+        self.model[self.model.DICTIONARY_KEY].append({self.model.CONTENT_KEY: {'t1': {'a': {'b': {self.model.ENTITY_KEY: [0]}}}}, self.model.COMPRESSED_KEY: 0})
+        self.model.save('./.test_model_registry')
+        registry = pilsner.ModelRegistry()
+        registry.register('m1', './.test_model_registry')
+        registry.register('m2', './.test_model_registry')
+        m1 = registry.acquire('m1')
+        assert registry.acquire('m1') is m1 and registry.references['m1'] == 2, 'Model is expected to be loaded once and referenced twice'
+        with registry.use('m2') as m2:
+            assert m2[m2.DICTIONARY_KEY] == self.model[self.model.DICTIONARY_KEY], 'Unexpected tries %s' % (str(m2[m2.DICTIONARY_KEY]))
+            assert sorted(registry.memory_usage()) == ['m1', 'm2'], 'Unexpected memory usage %s' % (str(registry.memory_usage()))
+        assert registry.references['m2'] == 0, 'Model is expected to be released'
+        registry.memory_budget = registry.sizes['m1'] + 1
+        registry.trim()
+        assert list(registry.models) == ['m1'], 'Unused model is expected to be unloaded, got %s' % (str(list(registry.models)))
+        registry.memory_budget = 1
+        registry.trim()
+        assert list(registry.models) == ['m1'], 'Model in use is not expected to be unloaded'
+        registry.release('m1')
+        registry.release('m1')
+        assert list(registry.models) == [], 'Unused model is expected to be unloaded, got %s' % (str(list(registry.models)))
+        registry.destroy()
+        for filename in ['./.test_model_registry.0.dictionary', './.test_model_registry.attributes', './.test_model_registry.keywords', './.test_model_registry.normalizers']:
+            os.remove(filename)
+
+    def test_mark_dirty(self):
+        self.model[self.model.DICTIONARY_KEY].append({'a': {'b': {'c': 'def'}}})
+        self.model[self.model.DICTIONARY_KEY].append({'g': {'h': {'i': 'jkl'}}})
+        self.model[self.model.DICTIONARY_KEY].append({'m': {'n': {'o': 'pqr'}}})
+        self.model.save('./.test_mark_dirty')
+        files = ['./.test_mark_dirty.0.dictionary', './.test_mark_dirty.1.dictionary', './.test_mark_dirty.2.dictionary', './.test_mark_dirty.keywords', './.test_mark_dirty.normalizers', './.test_mark_dirty.attributes']
+        saved = [os.stat(filename).st_ino for filename in files]
+        self.model[self.model.DICTIONARY_KEY][1]['g']['h']['i'] = 'xyz'
+        self.model.mark_dirty(1)
+        self.model.save('./.test_mark_dirty')
+        resaved = [os.stat(filename).st_ino for filename in files]
+        expected = [True, False, True, True, True, True]
+        output = [saved[i] == resaved[i] for i in range(len(files))]
+        assert output == expected, 'Expected %s, got %s' % (str(expected), str(output))
+        self.model.mark_dirty()
+        self.model.save('./.test_mark_dirty')
+        saved = [os.stat(filename).st_ino for filename in files]
+        output = [saved[i] == resaved[i] for i in range(len(files))]
+        assert output == [False] * len(files), 'Expected all files to be written again, got %s' % (str(output))
+        self.model[self.model.DICTIONARY_KEY].pop()
+        self.model.save('./.test_mark_dirty')
+        assert not os.path.exists('./.test_mark_dirty.2.dictionary'), 'Stale dictionary file was not removed'
+        another_model = pilsner.Model('./.test_mark_dirty')
+        assert another_model.saved_as == ('./.test_mark_dirty', False) and another_model.dirty == set(), 'Unexpected saved state %s, %s' % (str(another_model.saved_as), str(another_model.dirty))
+        output = another_model[another_model.DICTIONARY_KEY][1]
+        another_model.destroy()
+        del(another_model)
+        for filename in files[:2] + files[3:]:
+            os.remove(filename)
+        assert output == {'g': {'h': {'i': 'xyz'}}}, 'Loaded trie %s != saved trie' % (str(output))
+
     def test_add_normalizer(self):
         self.model.add_normalizer('t1', 'test/assets/tokenizer1.xml')
         normalization_units_count = len(self.model[self.model.NORMALIZER_KEY])
         assert normalization_units_count == 1, 'Model is expected to have 1 normalization unit (it has %d instead)' % (normalization_units_count)
 
+    def test_attrs_cache(self):
+        m = pilsner.Model(attrs_cache_size=2)
+        assert m.get_cached_attributes(((1,), '')) is None, 'Empty cache is not supposed to return anything'
+        m.cache_attributes(((1,), ''), {1: {'a': ['b']}})
+        m.cache_attributes(((2,), ''), {2: {'c': ['d']}})
+        assert m.get_cached_attributes(((1,), '')) == {1: {'a': ['b']}}, 'Cached attributes were not returned'
+        m.cache_attributes(((3,), ''), {})
+        assert m.get_cached_attributes(((2,), '')) is None, 'Least recently used entry was supposed to be evicted'
+        assert m.get_cached_attributes(((3,), '')) == {}, 'Cached empty attributes were not returned'
+        expected = {'hits': 2, 'misses': 2, 'evictions': 1}
+        assert m.attrs_cache_stats == expected, 'Expected %s, got %s' % (str(expected), str(m.attrs_cache_stats))
+        m.create_recognizer_schema(m.cursor)
+        assert len(m.attrs_cache) == 0, 'Cache was not invalidated once attributes database has changed'
+        m.destroy()
+
+    def test_normalization_cache(self):
+        m = pilsner.Model(simple=True, normalization_cache_size=2)
+        m.add_normalizer('t1', 'test/assets/tokenizer1.xml')
+        expected = m[m.NORMALIZER_KEY]['t1'].normalize('Tom-Sawyer', ' ', 0)
+        assert m.normalize_synonym('t1', 'Tom-Sawyer', ' ', 0) == expected, 'Normalized label does not match normalizer output'
+        assert m.normalize_synonym('t1', 'Tom-Sawyer', ' ', 0) == expected, 'Cached normalized label does not match normalizer output'
+        m.normalize_synonym('t1', 'Huck', ' ', 0)
+        m.normalize_synonym('t1', 'Huck', ' ', 1)
+        assert ('t1', 'Tom-Sawyer', ' ', 0) not in m.normalization_cache, 'Least recently used entry was supposed to be evicted'
+        expected = {'hits': 1, 'misses': 3, 'evictions': 1}
+        assert m.normalization_cache_stats == expected, 'Expected %s, got %s' % (str(expected), str(m.normalization_cache_stats))
+        m.add_normalizer('t2', 'test/assets/tokenizer2.xml')
+        assert len(m.normalization_cache) == 0, 'Cache was not invalidated once normalizers have changed'
+        m.destroy()
+
+    def test_get_filter_bitset(self):
+        self.model.create_recognizer_schema(self.model.cursor)
+        self.model.cursor.executemany('insert into attrs (n, iid, attr_name, attr_value) values (?, ?, ?, ?);', [(1, 0, 'a', 'x'), (9, 1, 'a', 'y'), (10, 1, 'b', 'x')])
+        bitset = self.model.get_filter_bitset((('a', 'x'), ('b', 'x')))
+        assert bitset == bytearray([2, 4]), 'Expected %s, got %s' % (str(bytearray([2, 4])), str(bitset))
+        bitset = self.model.get_filter_bitset(())
+        assert bitset == bytearray([2, 6]), 'Expected %s, got %s' % (str(bytearray([2, 6])), str(bitset))
+        assert len(self.model.filter_bitsets) == 2, 'Bitsets are supposed to be cached'
+        self.model.clear_attrs_cache()
+        assert len(self.model.filter_bitsets) == 0, 'Bitsets are supposed to be dropped with attributes cache'
+
     def test_create_recognizer_schema(self):
         self.model.create_recognizer_schema(self.model.cursor)
         rows = self.model.cursor.execute('select name from sqlite_master where type = \'table\' and name = \'attrs\';')
@@ -96,6 +326,51 @@ class TestModel(unittest.TestCase):
         rows = self.model.cursor.execute('select * from attrs;')
         assert len(list(rows)) == 0, 'Table \'attrs\' in newly created schema is not empty'
 
+    def test_create_recognizer_schema_normalized(self):
+        model = pilsner.Model(storage_location=':memory:', normalized_attrs=True)
+        model.create_recognizer_schema(model.cursor)
+        rows = model.cursor.execute('select name from sqlite_master where type = \'table\' and name in (\'attr_names\', \'attr_values\', \'attrs_data\');')
+        assert len(list(rows)) == 3, 'Created schema does not contain lookup tables'
+        model.insert_attributes([(1, 10, 'habitat', 'sea'), (1, 10, 'type', 'fish'), (2, 20, 'habitat', 'sea')])
+        model.create_recognizer_index(model.cursor)
+        rows = list(model.cursor.execute('select count(*) from attr_values;'))
+        assert rows[0][0] == 2, 'Expected 2 distinct values, got %d' % (rows[0][0])
+        rows = list(model.cursor.execute('select n, iid, attr_name, attr_value from attrs order by n, attr_name;'))
+        expected = [(1, 10, 'habitat', 'sea'), (1, 10, 'type', 'fish'), (2, 20, 'habitat', 'sea')]
+        assert rows == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(rows))
+        model.normalized_attrs = False
+        assert model.detect_attrs_schema(), 'Normalized schema is supposed to be detected'
+        model.destroy()
+
+    def test_memory_attributes(self):
+        store = pilsner.MemoryAttributes()
+        store.insert([(1, 10, 'habitat', 'sea'), (1, 10, 'type', 'fish'), (1, 10, 'type', 'food'), (3, 20, 'habitat', 'land')])
+        got = store.match([0, 1, 2, 3], ())
+        assert got == {1, 3}, 'Expected {1, 3}, got %s' % (str(got))
+        got = store.match([0, 1, 2, 3], (('type', 'food'), ('habitat', 'air')))
+        assert got == {1}, 'Expected {1}, got %s' % (str(got))
+        expected = {1: {'type': ['fish', 'food']}, 3: {}}
+        got = store.fetch([1, 3], ('type',))
+        assert got == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(got))
+        store.save(self.model, './.test_memory_attributes')
+        loaded = pilsner.MemoryAttributes()
+        loaded.load(self.model, './.test_memory_attributes')
+        os.remove('./.test_memory_attributes')
+        expected = store.fetch([0, 1, 2, 3], ())
+        got = loaded.fetch([0, 1, 2, 3], ())
+        assert got == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(got))
+        assert loaded.lines((('habitat', 'land'),)) == [3], 'Expected [3], got %s' % (str(loaded.lines((('habitat', 'land'),))))
+        got = [type(x).__name__ for column in loaded.columns for x in column]
+        assert got == ['array'] * 4, 'Columns are expected to be loaded as arrays, got %s' % (str(got))
+        loaded.insert([(0, 5, 'type', 'fish'), (1, 10, 'type', 'fish')])
+        loaded.delete([3])
+        expected = {0: {'type': ['fish']}, 1: {'habitat': ['sea'], 'type': ['fish', 'food']}, 2: {}, 3: {}}
+        got = loaded.fetch([0, 1, 2, 3], ())
+        assert got == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(got))
+        expected = [(0, 5, 'fish'), (1, 10, 'fish'), (1, 10, 'food')]
+        got = loaded.rows('type')
+        assert got == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(got))
+
     def test_pack_subtrie(self):
         # radiology, radiotelescope
         subtrie = {'r': {'a': {'d': {'i': {'o': {'l': {'o': {'g': {'y': {self.model.ENTITY_KEY: [1]}}}}, 't': {'e': {'l': {'e': {'s': {'c': {'o': {'p': {'e': {self.model.ENTITY_KEY: [2]}}}}}}}}}}}}}}}
@@ -116,6 +391,99 @@ class TestModel(unittest.TestCase):
         expected = {self.model.CONTENT_KEY: {'t1': {'r': {'adio': {'l': {'ogy': {self.model.ENTITY_KEY: [1]}}, 't': {'elescope': {self.model.ENTITY_KEY: [2]}}}}}, 't2': {'r': {'adio': {'l': {'ogy': {self.model.ENTITY_KEY: [1]}}, 't': {'elescope': {self.model.ENTITY_KEY: [2]}}}}}}}
         assert packed == expected, '%s != %s' % (str(packed), str(expected))
 
+    def test_expand_subtrie(self):
+        # radiology, radiotelescope
+        subtrie = {'r': {'a': {'d': {'i': {'o': {'l': {'o': {'g': {'y': {self.model.ENTITY_KEY: [1]}}}}, 't': {'e': {'l': {'e': {'s': {'c': {'o': {'p': {'e': {self.model.ENTITY_KEY: [2]}}}}}}}}}}}}}}}
+        packed = self.model.pack_subtrie(subtrie, True, '')[0]
+        expanded = self.model.expand_subtrie(packed, True)
+        assert expanded == subtrie, '%s != %s' % (str(expanded), str(subtrie))
+        expanded = self.model.expand_subtrie(subtrie, False)
+        assert expanded == subtrie, '%s != %s' % (str(expanded), str(subtrie))
+
+    def test_compact_subtrie(self):
+        # ab, ac, b
+        subtrie = {'a': {'b': {self.model.ENTITY_KEY: [1, 2]}, 'c': {self.model.ENTITY_KEY: [3], self.model.IGNORE_KEY: []}}, 'b': {self.model.ENTITY_KEY: [4]}}
+        compact = self.model.compact_subtrie(subtrie)
+        assert compact[self.model.LABELS_KEY] == '\x00abbc', 'Unexpected labels: %s' % (repr(compact[self.model.LABELS_KEY]))
+        assert list(compact[self.model.CHILDREN_KEY]) == [1, 3, 5, 5, 5, 5], 'Unexpected children: %s' % (str(compact[self.model.CHILDREN_KEY]))
+        assert list(compact[self.model.LEAVES_KEY]) == [0, 0, 0, 1, 3, 4], 'Unexpected leaves: %s' % (str(compact[self.model.LEAVES_KEY]))
+        assert list(compact[self.model.ENTITY_IDS_KEY]) == [4, 1, 2, 3], 'Unexpected entity IDs: %s' % (str(compact[self.model.ENTITY_IDS_KEY]))
+        assert compact[self.model.IGNORED_KEY] == {4}, 'Unexpected ignored nodes: %s' % (str(compact[self.model.IGNORED_KEY]))
+        restored = self.model.restore_subtrie(compact)
+        assert restored == subtrie, '%s != %s' % (str(restored), str(subtrie))
+
+    def test_link_subtrie(self):
+        # a b, ab, b
+        subtrie = {'a': {' ': {'b': {self.model.ENTITY_KEY: [1]}}, 'b': {self.model.ENTITY_KEY: [2]}}, 'b': {self.model.ENTITY_KEY: [3]}}
+        compact = self.model.compact_subtrie(subtrie)
+        assert compact[self.model.LABELS_KEY] == '\x00ab bb', 'Unexpected labels: %s' % (repr(compact[self.model.LABELS_KEY]))
+        links = self.model.link_subtrie(compact, ' ')
+        # 'b' in 'a b' begins after word separator, 'b' in 'ab' does not
+        assert list(links[self.model.FAILURE_KEY]) == [0, 0, 0, 0, 0, 2], 'Unexpected failure links: %s' % (str(links[self.model.FAILURE_KEY]))
+        assert list(links[self.model.OUTPUT_KEY]) == [0, 0, 0, 0, 0, 2], 'Unexpected output links: %s' % (str(links[self.model.OUTPUT_KEY]))
+        assert list(links[self.model.DEPTH_KEY]) == [0, 1, 1, 2, 2, 3], 'Unexpected depths: %s' % (str(links[self.model.DEPTH_KEY]))
+
+    def test_tokenize_subtrie(self):
+        # a b, a b c, a d e f
+        subtrie = {'a': {' ': {'b': {self.model.ENTITY_KEY: [1], ' ': {'c': {self.model.ENTITY_KEY: [2]}}}, 'd': {' ': {'e': {' ': {'f': {self.model.ENTITY_KEY: [3]}}}}}}}}
+        tokenized = self.model.tokenize_subtrie(subtrie, ' ')
+        vocabulary = tokenized[self.model.VOCABULARY_KEY]
+        assert sorted(vocabulary) == ['a', 'b', 'c', 'd', 'e', 'f'], 'Unexpected vocabulary: %s' % (str(vocabulary))
+        tokens = tokenized[self.model.TOKENS_KEY][vocabulary['a']]
+        expected = {self.model.ENTITY_KEY: [1], vocabulary['c']: {self.model.ENTITY_KEY: [2]}}
+        assert tokens[vocabulary['b']] == expected, '%s != %s' % (str(tokens[vocabulary['b']]), str(expected))
+        # chain of nodes after 'd' is merged
+        expected = ([vocabulary['e'], vocabulary['f']], {self.model.ENTITY_KEY: [3]})
+        output = (tokens[vocabulary['d']][0].tolist(), tokens[vocabulary['d']][1])
+        assert output == expected, '%s != %s' % (str(output), str(expected))
+        leaves = sorted(self.model.get_trie_leaves(tokenized))
+        expected = [('a b', [1]), ('a b c', [2]), ('a d e f', [3])]
+        assert leaves == expected, '%s != %s' % (str(leaves), str(expected))
+        restored = self.model.detokenize_subtrie(tokenized)
+        assert restored == subtrie, '%s != %s' % (str(restored), str(subtrie))
+
+    def test_get_trie_leaves(self):
+        # radiology, radiotelescope
+        subtrie = {'r': {'a': {'d': {'i': {'o': {'l': {'o': {'g': {'y': {self.model.ENTITY_KEY: [1]}}}}, 't': {'e': {'l': {'e': {'s': {'c': {'o': {'p': {'e': {self.model.ENTITY_KEY: [2]}}}}}}}}}}}}}}}
+        expected = [('radiology', [1]), ('radiotelescope', [2])]
+        for trie in [subtrie, self.model.pack_subtrie(subtrie, True, '')[0], self.model.compact_subtrie(subtrie)]:
+            leaves = sorted(self.model.get_trie_leaves(trie))
+            assert leaves == expected, '%s != %s' % (str(leaves), str(expected))
+
+    def test_delete_attributes(self):
+        specs = {'fields': {'entity_id': (0, None, False, False), 'label': (1, None, False, True)}, 'id': (0, None, False, False), 'tokenizer': None, 'value': (1, None, False, True)}
+        for model in [self.model, pilsner.Model(attrs_store=pilsner.MemoryAttributes())]:
+            model.create_recognizer_schema(model.cursor)
+            model.store_attributes(0, 0, {}, specs, ['e1', 'a'])
+            model.store_attributes(1, 1, {}, specs, ['e2', 'b'])
+            model.store_attributes(2, 0, {}, specs, ['e1', 'c'])
+            expected = ({'e1': 0, 'e2': 1}, {0: 0, 1: 1, 2: 0})
+            got = model.get_entity_ids(specs)
+            assert got == expected, '%s != %s' % (str(got), str(expected))
+            model.delete_attributes([1, 2])
+            expected = ({'e1': 0}, {0: 0})
+            got = model.get_entity_ids(specs)
+            assert got == expected, '%s != %s' % (str(got), str(expected))
+
+    def test_set_trie_layout(self):
+        # radiology, radiotelescope
+        subtrie = {'r': {'a': {'d': {'i': {'o': {'l': {'o': {'g': {'y': {self.model.ENTITY_KEY: [1]}}}}, 't': {'e': {'l': {'e': {'s': {'c': {'o': {'p': {'e': {self.model.ENTITY_KEY: [2]}}}}}}}}}}}}}}}
+        packed = self.model.pack_trie({self.model.CONTENT_KEY: {'t1': subtrie}, self.model.COMPRESSED_KEY: 1, self.model.WORD_SEPARATOR_KEY: ' '}, True)
+        self.model[self.model.DICTIONARY_KEY] = [packed]
+        self.model.set_trie_layout(self.model.COMPACT_LAYOUT)
+        trie = self.model[self.model.DICTIONARY_KEY][0]
+        assert trie[self.model.LAYOUT_KEY] == self.model.COMPACT_LAYOUT, 'Trie is supposed to be compact'
+        assert trie[self.model.COMPRESSED_KEY] == 0, 'Compact trie is not supposed to be flagged as compressed'
+        assert len(trie[self.model.CONTENT_KEY]['t1'][self.model.LABELS_KEY]) == 19, 'Expected 19 nodes, got %d' % (len(trie[self.model.CONTENT_KEY]['t1'][self.model.LABELS_KEY]))
+        self.model.set_trie_layout(self.model.DICT_LAYOUT)
+        assert self.model[self.model.DICTIONARY_KEY][0] == packed, '%s != %s' % (str(self.model[self.model.DICTIONARY_KEY][0]), str(packed))
+        self.model.set_trie_layout(self.model.TOKEN_LAYOUT)
+        trie = self.model[self.model.DICTIONARY_KEY][0]
+        assert trie[self.model.LAYOUT_KEY] == self.model.TOKEN_LAYOUT, 'Trie is supposed to be made of tokens'
+        assert len(trie[self.model.CONTENT_KEY]['t1'][self.model.VOCABULARY_KEY]) == 2, 'Expected 2 words, got %d' % (len(trie[self.model.CONTENT_KEY]['t1'][self.model.VOCABULARY_KEY]))
+        self.model.set_trie_layout(self.model.DICT_LAYOUT)
+        assert self.model[self.model.DICTIONARY_KEY][0] == packed, '%s != %s' % (str(self.model[self.model.DICTIONARY_KEY][0]), str(packed))
+
     def test_store_attributes(self):
         line_number = 123
         internal_id = 456
@@ -139,6 +507,26 @@ class TestModel(unittest.TestCase):
         for entry in expected:
             assert entry in stored, 'Entry %s was not stored' % str(entry)
 
+    def test_bulk_insert(self):
+        specs = {'fields': {'attr1': (0, None, False, False), 'attr2': (1, ',', False, False)}}
+        self.model.create_recognizer_schema(self.model.cursor)
+        journal_mode = list(self.model.cursor.execute('pragma journal_mode;'))[0][0]
+        self.model.ATTRS_INSERT_BATCH_SIZE = 4
+        assert self.model.begin_bulk_insert(sort_rows=True), 'Bulk insert is supposed to begin'
+        self.model.store_attributes(2, 1, {}, specs, ['b', 'y,x'])
+        stored = list(self.model.cursor.execute('select * from attrs;'))
+        assert stored == [], 'Rows are not supposed to be stored before batch is full, got %s' % (str(stored))
+        self.model.store_attributes(1, 0, {}, specs, ['a', 'z'])
+        self.model.store_attributes(3, 2, {}, specs, ['c', 'w'])
+        stored = list(self.model.cursor.execute('select count(*) from attrs;'))[0][0]
+        assert stored == 5, 'Expected 5 rows to be flushed, got %d' % (stored)
+        assert self.model.end_bulk_insert(), 'Bulk insert is supposed to end'
+        stored = list(self.model.cursor.execute('select n, attr_name, attr_value from attrs order by rowid;'))
+        expected = [(1, 'attr1', 'a'), (1, 'attr2', 'z'), (2, 'attr1', 'b'), (2, 'attr2', 'x'), (2, 'attr2', 'y'), (3, 'attr1', 'c'), (3, 'attr2', 'w')]
+        assert stored == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(stored))
+        restored = list(self.model.cursor.execute('pragma journal_mode;'))[0][0]
+        assert restored == journal_mode, 'Journal mode is supposed to be restored to %s, got %s' % (journal_mode, restored)
+
     def test_get_dictionary_line(self):
         specs = {
             'fields': {
@@ -195,7 +583,8 @@ class TestModel(unittest.TestCase):
             self.model.SPECS_KEY: specs,
             self.model.COMPRESSED_KEY: int(compressed),
             self.model.TOKENIZER_OPTION_KEY: tokenizer_option,
-            self.model.WORD_SEPARATOR_KEY: word_separator
+            self.model.WORD_SEPARATOR_KEY: word_separator,
+            self.model.USED_NORMALIZERS_KEY: []
         }
         assert got_trie == expected, 'Expected %s, got %s' % (str(expected), str(got_trie))
 
@@ -1,4 +1,7 @@
+import io
+import os
 import sys
+import threading
 import unittest
 
 class TestUtility(unittest.TestCase):
@@ -15,39 +18,27 @@ class TestUtility(unittest.TestCase):
         self.simple_model.destroy()
         del(self.simple_model)
 
-    def compile_test_model(self):
+    def compile_test_model(self, filename='test/assets/sample_dictionary.txt', model=None, **compile_kwargs):
         fields = [
             {'name': 'normalizer', 'include': True, 'delimiter': None, 'id_flag': False, 'normalizer_flag': True, 'value_flag': False},
             {'name': 'entity_id', 'include': True, 'delimiter': None, 'id_flag': True, 'normalizer_flag': False, 'value_flag': False},
             {'name': 'label', 'include': True, 'delimiter': None, 'id_flag': False, 'normalizer_flag': False, 'value_flag': True},
             {'name': 'some_attribute', 'include': True, 'delimiter': ',', 'id_flag': False, 'normalizer_flag': False, 'value_flag': False}
         ]
-        model = self.model
+        if model is None:
+            model = self.model
         model.add_normalizer('t1', 'test/assets/tokenizer1.xml')
         model.add_normalizer('t2', 'test/assets/tokenizer2.xml')
         model.normalizer_map = {
             'tokenizer1': 't1',
             'tokenizer2': 't2'
         }
-        compiled = self.utility.compile_model(model=model, filename='test/assets/sample_dictionary.txt', fields=fields, word_separator=' ', column_separator='\t', column_enclosure='', include_keywords=True)
+        compile_kwargs = dict({'include_keywords': True}, **compile_kwargs)
+        compiled = self.utility.compile_model(model=model, filename=filename, fields=fields, word_separator=' ', column_separator='\t', column_enclosure='', **compile_kwargs)
         return compiled, model
 
     def compile_test_simple_model(self):
-        fields = [
-            {'name': 'normalizer', 'include': True, 'delimiter': None, 'id_flag': False, 'normalizer_flag': True, 'value_flag': False},
-            {'name': 'entity_id', 'include': True, 'delimiter': None, 'id_flag': True, 'normalizer_flag': False, 'value_flag': False},
-            {'name': 'label', 'include': True, 'delimiter': None, 'id_flag': False, 'normalizer_flag': False, 'value_flag': True},
-            {'name': 'some_attribute', 'include': True, 'delimiter': ',', 'id_flag': False, 'normalizer_flag': False, 'value_flag': False}
-        ]
-        model = self.simple_model
-        model.add_normalizer('t1', 'test/assets/tokenizer1.xml')
-        model.add_normalizer('t2', 'test/assets/tokenizer2.xml')
-        model.normalizer_map = {
-            'tokenizer1': 't1',
-            'tokenizer2': 't2'
-        }
-        compiled = self.utility.compile_model(model=model, filename='test/assets/sample_dictionary.txt', fields=fields, word_separator=' ', column_separator='\t', column_enclosure='', include_keywords=True)
-        return compiled, model
+        return self.compile_test_model(model=self.simple_model)
 
     def test_init(self):
         r = pilsner.Utility()
@@ -139,6 +130,7 @@ class TestUtility(unittest.TestCase):
                 model.COMPRESSED_KEY: 1,
                 model.TOKENIZER_OPTION_KEY: 0,
                 model.WORD_SEPARATOR_KEY: ' ',
+                model.USED_NORMALIZERS_KEY: ['bypass'],
                 model.CONTENT_KEY: {
                     'bypass': {'a': {'w': {'e': {'some white refrigerator': {'s': {model.ENTITY_KEY: [0, 3]}, 'x': {model.ENTITY_KEY: [1]}, model.ENTITY_KEY: [4]}}, 'w': {'some white refrigerator': {model.ENTITY_KEY: [5]}}}}, 'c': {'onflicting refrigerator': {model.ENTITY_KEY: [2, 8]}}, 'i': {'t': {model.ENTITY_KEY: [6]}}, 'o': {model.ENTITY_KEY: [7]}}
                 }
@@ -187,6 +179,10 @@ class TestUtility(unittest.TestCase):
             }
         }
         assert keywords == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(keywords))
+        collected = self.utility.start_keywords()
+        self.utility.make_recognizer(model=self.simple_model, filename='test/assets/sample_dictionary.txt', specs=specs, word_separator=' ', item_limit=0, compressed=True, column_separator='\t', column_enclosure='', tokenizer_option=0, keywords=collected)
+        keywords = self.utility.finish_keywords(model, collected, False)
+        assert keywords == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(keywords))
 
     def test_compile_model(self):
         compiled, model = self.compile_test_model()
@@ -216,6 +212,7 @@ class TestUtility(unittest.TestCase):
                 model.COMPRESSED_KEY: 1,
                 model.TOKENIZER_OPTION_KEY: 0,
                 model.WORD_SEPARATOR_KEY: ' ',
+                model.USED_NORMALIZERS_KEY: ['t1', 't2'],
                 model.CONTENT_KEY: {'t1': {'a': {'wesome white refrigera': {' ': {'tors': {model.ENTITY_KEY: [0]}}, 't': {'or': {'x': {model.ENTITY_KEY: [1]}, model.ENTITY_KEY: [4]}}}}}, 't2': {'c': {'onflicting refrigerator': {model.ENTITY_KEY: [2, 8]}}, 'a': {'w': {'e': {'some refrigerators': {model.ENTITY_KEY: [3]}}, 'w': {'some refrigerator': {model.ENTITY_KEY: [5]}}}}, 'i': {'t': {model.ENTITY_KEY: [6]}}, 'o': {model.ENTITY_KEY: [7]}}}
             }
         ]
@@ -242,6 +239,22 @@ class TestUtility(unittest.TestCase):
         attributes = self.utility.unpack_attributes(model, cur, leaf_ids, include_query, exclude_query, process_exclude, attrs_out_query)
         assert attributes == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(attributes))
 
+    def test_unpack_attributes_batched(self):
+        _, model = self.compile_test_model()
+        model.ATTRS_BATCH_SIZE = 2
+        cur = model.cursor
+        leaf_ids = [8, 2, 7, 2]
+        include_query = 'and (attr_name = \'some_attribute\' and attr_value = \'C\')'
+        exclude_query = 'and (attr_name = \'entity_id\' and attr_value = \'entity2\')'
+        process_exclude = True
+        attrs_out_query = ' and attr_name in (\'entity_id\', \'some_attribute\')'
+        expected = {
+            7: {'entity_id': ['entity1'], 'some_attribute': ['A', 'B', 'C']},
+            8: {'entity_id': ['entity1'], 'some_attribute': ['A', 'B', 'C']}
+        }
+        attributes = self.utility.unpack_attributes(model, cur, leaf_ids, include_query, exclude_query, process_exclude, attrs_out_query)
+        assert attributes == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(attributes))
+
     def test_check_attrs(self):
         _, model = self.compile_test_model()
         trie_leaf = {model.ENTITY_KEY: [8]}
@@ -254,6 +267,19 @@ class TestUtility(unittest.TestCase):
         got_leaf = self.utility.check_attrs(model, trie_leaf, cur, include_query, exclude_query, process_exclude, attrs_out_query)
         assert got_leaf == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(got_leaf))
 
+    def test_check_attrs_cached(self):
+        _, model = self.compile_test_model()
+        model.attrs_cache_size = 10
+        trie_leaf = {model.ENTITY_KEY: [8]}
+        expected = {model.ENTITY_KEY: [8], model.ATTRS_KEY: {8: {'entity_id': ['entity1'], 'normalizer': ['tokenizer2'], 'some_attribute': ['A', 'B', 'C']}}}
+        for _ in range(3):
+            got_leaf = self.utility.check_attrs(model, trie_leaf, model.cursor, '', '', False, '')
+            assert got_leaf == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(got_leaf))
+        expected_stats = {'hits': 2, 'misses': 1, 'evictions': 0}
+        assert model.attrs_cache_stats == expected_stats, '\nExpected\n%s\nGot\n%s' % (str(expected_stats), str(model.attrs_cache_stats))
+        got_leaf = self.utility.check_attrs(model, trie_leaf, model.cursor, 'and (attr_name = \'some_attribute\' and attr_value = \'D\')', '', False, '')
+        assert got_leaf == {}, 'Leaf filtered out by a different query is not supposed to be taken from cache'
+
     def test_spot_entities(self):
         _, model = self.compile_test_model()
         source_string = 'this is awesome white refrigerator , and this is not'
@@ -262,6 +288,18 @@ class TestUtility(unittest.TestCase):
         spotted = self.utility.spot_entities(model, source_string, normalizer_name)
         assert spotted == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(spotted))
 
+    def test_spot_dict_entities_compressed(self):
+        _, model = self.compile_test_model()
+        # strings end or mismatch in the middle of compressed edges
+        source_strings = ['this is awesome white refrigerator , and this is not', 'awesome white refrig awesome whitex awesome white refrigerators awesome white refrigerator', 'conflicting refrigerator awesome white refrigerator']
+        expected = [self.utility.spot_dict_entities(model, model[model.DICTIONARY_KEY][0], source_string, 't1') for source_string in source_strings]
+        model.set_trie_layout(model.COMPACT_LAYOUT)
+        model.set_trie_layout(model.DICT_LAYOUT, compressed=False)
+        assert model[model.DICTIONARY_KEY][0][model.COMPRESSED_KEY] == 0, 'Trie is not supposed to be compressed'
+        output = [self.utility.spot_dict_entities(model, model[model.DICTIONARY_KEY][0], source_string, 't1') for source_string in source_strings]
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        assert len(output[1]) > 0, 'Expected entities in %s' % (source_strings[1])
+
     def test_disambiguate(self):
         _, model = self.compile_test_model()
         # source string: this is awwsome and conflicting refrigerator, hey
@@ -411,6 +449,78 @@ class TestUtility(unittest.TestCase):
         output = self.utility.parse(model, source_string)
         assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
 
+    def test_parse_unused_normalizer(self):
+        _, model = self.compile_test_model()
+        model.add_normalizer('t3', 'test/assets/tokenizer1.xml')
+        output = model.get_used_normalizers()
+        assert output == ['t1', 't2'], 'Expected used normalization units [\'t1\', \'t2\'], got %s' % (str(output))
+        class UnusedNormalizer():
+            def normalize(self, *args):
+                raise AssertionError('Unused normalization unit is not expected to be applied')
+        model[model.NORMALIZER_KEY]['t3'] = UnusedNormalizer()
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey'
+        expected = {
+            (8, 34): {'entity_id': {'entity1'}, 'normalizer': {'tokenizer2'}, 'some_attribute': {'C', 'B', 'A'}},
+            (35, 36): {'entity_id': {'entity1'}, 'normalizer': {'tokenizer2'}, 'some_attribute': {'C', 'B', 'A'}},
+            (54, 56): {'entity_id': {'entity2'}, 'normalizer': {'tokenizer2'}, 'some_attribute': {'C', 'B', 'A'}},
+            (66, 90): {'entity_id': {'entity2'}, 'normalizer': {'tokenizer2'}, 'some_attribute': {'D', 'E'}}
+        }
+        output = self.utility.parse(model, source_string)
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        normalized_strings = {'t1': 'this is awesome white refrigerator', 't2': 'conflicting refrigerator'}
+        expected = {normalizer_name: self.utility.spot_entities(model, normalized_strings[normalizer_name], normalizer_name) for normalizer_name in normalized_strings}
+        output = self.utility.spot_normalized_entities(model, normalized_strings)
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+
+    def test_compile_attrs_filter(self):
+        attrs_where = {'+': {'some_attribute': {'E', 'D'}}, '-': {'entity_id': {'entity3'}}}
+        attrs_out = ['entity_id']
+        attrs_filter = self.utility.compile_attrs_filter(attrs_where, attrs_out)
+        expected = {
+            'include': (('some_attribute', 'D'), ('some_attribute', 'E')),
+            'exclude': (('entity_id', 'entity3'),),
+            'attrs_out': ('entity_id',),
+            'signature': ((('some_attribute', 'D'), ('some_attribute', 'E')), (('entity_id', 'entity3'),), ('entity_id',)),
+            'include_query': 'and ((attr_name = ? and attr_value = ?) or (attr_name = ? and attr_value = ?))',
+            'include_params': ('some_attribute', 'D', 'some_attribute', 'E'),
+            'exclude_query': 'and ((attr_name = ? and attr_value = ?))',
+            'exclude_params': ('entity_id', 'entity3'),
+            'process_exclude': True,
+            'in_memory': False,
+            'attrs_out_query': ' and attr_name in (?)',
+            'attrs_out_params': ('entity_id',)
+        }
+        assert attrs_filter == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(attrs_filter))
+
+    def test_parse_filtered(self):
+        _, model = self.compile_test_model()
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey'
+        attrs_where = {'+': {'some_attribute': {'D'}}}
+        attrs_out = ['some_attribute']
+        expected = {(66, 90): {'some_attribute': {'D', 'E'}}}
+        output = self.utility.parse(model, source_string, attrs_where, attrs_out)
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        attrs_filter = self.utility.compile_attrs_filter({'-': {'some_attribute': {'D'}, 'normalizer': {'tokenizer1'}}}, ['entity_id'])
+        expected = {
+            (8, 34): {'entity_id': {'entity1'}},
+            (35, 36): {'entity_id': {'entity1'}},
+            (54, 56): {'entity_id': {'entity2'}},
+            (66, 90): {'entity_id': {'entity1'}}
+        }
+        for _ in range(2):
+            output = self.utility.parse(model, source_string, attrs_filter=attrs_filter)
+            assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+
+    def test_parse_filtered_in_memory(self):
+        _, model = self.compile_test_model()
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey'
+        attrs_where = {'+': {'some_attribute': {'A', 'D'}}, '-': {'normalizer': {'tokenizer1'}, 'some_attribute': {'E'}}}
+        expected = self.utility.parse(model, source_string, attrs_where)
+        attrs_filter = self.utility.compile_attrs_filter(attrs_where, in_memory=True)
+        output = self.utility.parse(model, source_string, attrs_filter=attrs_filter)
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        assert len(model.filter_bitsets) == 2, 'Expected 2 bitsets to be cached, got %d' % (len(model.filter_bitsets))
+
     def test_ignore_node(self):
         _, model = self.compile_test_model()
         source_string = 'this is awesome white refrigerator hey hey'
@@ -422,6 +532,338 @@ class TestUtility(unittest.TestCase):
         assert recognized_normally == expected_normally, '\nExpected\n%s\nGot\n%s' % (str(expected_normally), str(recognized_normally))
         assert recognized_after_exclusion == expected_after_exclusion, '\nExpected\n%s\nGot\n%s' % (str(expected_after_exclusion), str(recognized_after_exclusion))
 
+    def test_parse_compact(self):
+        _, model = self.compile_test_model()
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey'
+        expected = self.utility.parse(model, source_string)
+        model.set_trie_layout(model.COMPACT_LAYOUT)
+        output = self.utility.parse(model, source_string)
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        self.utility.ignore_node(model, 'awesome white refrigerator')
+        output = self.utility.parse(model, 'this is awesome white refrigerator hey hey')
+        assert output == {}, '\nExpected\n%s\nGot\n%s' % (str({}), str(output))
+
+    def test_parse_failure_links(self):
+        _, model = self.compile_test_model()
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey awesome white refrigerator'
+        expected = self.utility.parse(model, source_string)
+        model.set_trie_layout(model.COMPACT_LAYOUT, failure_links=True)
+        output = self.utility.parse(model, source_string)
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        model.save('./.test_parse_failure_links', mapped=True)
+        mapped_model = pilsner.Model('./.test_parse_failure_links')
+        linked = [model.FAILURE_KEY in trie[model.CONTENT_KEY][normalizer_name] for trie in mapped_model[mapped_model.DICTIONARY_KEY] for normalizer_name in trie[mapped_model.CONTENT_KEY]]
+        output = self.utility.parse(mapped_model, source_string)
+        mapped_model.destroy()
+        for filename in ['./.test_parse_failure_links.0.mapped_dictionary', './.test_parse_failure_links.attributes', './.test_parse_failure_links.mapped_keywords', './.test_parse_failure_links.normalizers']:
+            os.remove(filename)
+        assert all(linked) and len(linked) == 2, 'Failure links are expected to be saved, got %s' % (str(linked))
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        # every word boundary of a partially matched label is a possible beginning of another label
+        trie = model[model.DICTIONARY_KEY][0]
+        source_string = 'awesome white refrigeratorx conflicting awesome white refrigerator'
+        expected = self.utility.spot_compact_entities(model, trie, source_string, 't1')
+        output = self.utility.spot_linked_entities(model, trie, source_string, 't1')
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+
+    def test_parse_token_level(self):
+        _, model = self.compile_test_model()
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey awesome white refrigerator'
+        expected = self.utility.parse(model, source_string)
+        model.set_trie_layout(model.TOKEN_LAYOUT)
+        output = self.utility.parse(model, source_string)
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        model.save('./.test_parse_token_level')
+        loaded_model = pilsner.Model('./.test_parse_token_level', lazy_tries=True)
+        output = self.utility.parse(loaded_model, source_string)
+        layouts = [trie[loaded_model.LAYOUT_KEY] for trie in loaded_model[loaded_model.DICTIONARY_KEY]]
+        loaded_model.destroy()
+        for filename in ['./.test_parse_token_level.0.dictionary', './.test_parse_token_level.attributes', './.test_parse_token_level.keywords', './.test_parse_token_level.normalizers']:
+            os.remove(filename)
+        assert layouts == [model.TOKEN_LAYOUT], 'Token tries are expected to be saved, got %s' % (str(layouts))
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        # labels that share beginning with a longer one are found after it fails
+        trie = model[model.DICTIONARY_KEY][0]
+        source_string = 'awesome white refrigeratorx conflicting awesome white refrigerator'
+        expected = self.utility.spot_compact_entities(model, model.compact_trie(model.detokenize_trie(trie), False), source_string, 't1')
+        output = self.utility.spot_token_entities(model, trie, source_string, 't1')
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        self.utility.ignore_node(model, 'awesome white refrigerator')
+        output = self.utility.parse(model, 'this is awesome white refrigerator hey hey')
+        assert output == {}, '\nExpected\n%s\nGot\n%s' % (str({}), str(output))
+
+    def test_compile_model_compact(self):
+        _, model = self.compile_test_model(model=self.simple_model, include_keywords=False, compact=True)
+        tries = model[model.DICTIONARY_KEY]
+        assert len(tries) == 1, 'Expected 1 trie, got %d' % (len(tries))
+        assert tries[0][model.LAYOUT_KEY] == model.COMPACT_LAYOUT, 'Trie is supposed to be compact'
+        source_string = 'this is awesome white refrigerator hey hey'
+        expected = {(8, 34): {'ID': {'entity1'}}}
+        parsed = self.utility.parse(model, source_string)
+        assert parsed == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(parsed))
+
+    def test_compile_model_workers(self):
+        _, expected_model = self.compile_test_model()
+        _, model = self.compile_test_model(model=pilsner.Model(), workers=2)
+        assert model[model.DICTIONARY_KEY] == expected_model[model.DICTIONARY_KEY], '\nExpected\n%s\nGot\n%s' % (str(expected_model[model.DICTIONARY_KEY]), str(model[model.DICTIONARY_KEY]))
+        assert model[model.KEYWORDS_KEY] == expected_model[model.KEYWORDS_KEY], '\nExpected\n%s\nGot\n%s' % (str(expected_model[model.KEYWORDS_KEY]), str(model[model.KEYWORDS_KEY]))
+        expected = list(expected_model.cursor.execute('select n, iid, attr_name, attr_value from attrs order by rowid;'))
+        output = list(model.cursor.execute('select n, iid, attr_name, attr_value from attrs order by rowid;'))
+        model.destroy()
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+
+    def test_compile_model_normalization_cache(self):
+        _, expected_model = self.compile_test_model()
+        _, model = self.compile_test_model(model=pilsner.Model(normalization_cache_size=100))
+        stats = dict(model.normalization_cache_stats)
+        cached = len(model.normalization_cache)
+        model.destroy()
+        assert model[model.DICTIONARY_KEY] == expected_model[model.DICTIONARY_KEY], '\nExpected\n%s\nGot\n%s' % (str(expected_model[model.DICTIONARY_KEY]), str(model[model.DICTIONARY_KEY]))
+        assert model[model.KEYWORDS_KEY] == expected_model[model.KEYWORDS_KEY], '\nExpected\n%s\nGot\n%s' % (str(expected_model[model.KEYWORDS_KEY]), str(model[model.KEYWORDS_KEY]))
+        assert stats['hits'] > 0, 'Repeated labels were not taken from cache'
+        assert cached == 0, 'Cache was not dropped once model was compiled'
+
+    def test_update_model(self):
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey white refrigerator and awesome white fridge'
+        for compact, failure_links, token_level in [(False, False, False), (True, False, False), (True, True, False), (False, False, True)]:
+            models = []
+            for filename in ['test/assets/sample_dictionary_updated.txt', 'test/assets/sample_dictionary.txt']:
+                _, model = self.compile_test_model(filename=filename, model=pilsner.Model(), item_limit=4, compact=compact, failure_links=failure_links, token_level=token_level)
+                models.append(model)
+            expected_model, model = models
+            # labels of lines are indexed by the first update of a model and kept up to date afterwards
+            model[model.KEYWORDS_KEY][model.LINE_LABELS_KEY] = self.utility.index_labels(model)
+            output = self.utility.update_model(model, 'test/assets/sample_delta.txt', '\t', '')
+            assert output == (2, 2), 'Expected (2, 2), got %s' % (str(output))
+            expected = self.utility.index_labels(model)
+            output = model[model.KEYWORDS_KEY][model.LINE_LABELS_KEY]
+            assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+            expected = self.utility.parse(expected_model, source_string)
+            output = self.utility.parse(model, source_string)
+            assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+            expected = expected_model[expected_model.KEYWORDS_KEY][expected_model.CONTENT_KEY]
+            output = model[model.KEYWORDS_KEY][model.CONTENT_KEY]
+            assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+            output = [model.FAILURE_KEY in trie[model.CONTENT_KEY][normalizer_name] for trie in model[model.DICTIONARY_KEY] for normalizer_name in trie[model.CONTENT_KEY]]
+            assert output == [failure_links] * len(output), 'Failure links are expected to be kept: %s' % (str(output))
+            output = model[model.DICTIONARY_KEY][-1][model.USED_NORMALIZERS_KEY]
+            assert output == ['t2', 't1'], 'Expected used normalization units [\'t2\', \'t1\'] in the last trie, got %s' % (str(output))
+            output = [trie.get(model.LAYOUT_KEY, model.DICT_LAYOUT) for trie in model[model.DICTIONARY_KEY]]
+            expected = [expected_model[expected_model.DICTIONARY_KEY][0].get(model.LAYOUT_KEY, model.DICT_LAYOUT)] * len(output)
+            assert output == expected, '%s != %s' % (str(output), str(expected))
+            expected_model.destroy()
+            model.destroy()
+
+    def test_save_updated_model(self):
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey white refrigerator and awesome white fridge'
+        for mapped in [False, True]:
+            extension = 'mapped_dictionary' if mapped else 'dictionary'
+            keywords_filename = './.test_save_updated_model.%s' % ('mapped_keywords' if mapped else 'keywords')
+            _, model = self.compile_test_model(model=pilsner.Model(), item_limit=4)
+            model.save('./.test_save_updated_model', mapped=mapped)
+            files = ['./.test_save_updated_model.%d.%s' % (n, extension) for n in range(len(model[model.DICTIONARY_KEY]))] + [keywords_filename, './.test_save_updated_model.normalizers', './.test_save_updated_model.attributes']
+            saved = [os.stat(filename).st_ino for filename in files]
+            self.utility.update_model(model, 'test/assets/sample_delta.txt', '\t', '')
+            model.save('./.test_save_updated_model', mapped=mapped)
+            resaved = [os.stat(filename).st_ino for filename in files]
+            expected = [True, False, False, False, True, False]
+            output = [saved[i] == resaved[i] for i in range(len(files))]
+            assert output == expected, 'Expected %s, got %s' % (str(expected), str(output))
+            expected = self.utility.parse(model, source_string)
+            model.destroy()
+            model = pilsner.Model('./.test_save_updated_model')
+            output = self.utility.parse(model, source_string)
+            model.destroy()
+            for filename in files:
+                os.remove(filename)
+            assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+
+    def test_parse_lazy_tries(self):
+        _, model = self.compile_test_model(model=pilsner.Model(), item_limit=4)
+        model.save('./.test_parse_lazy_tries')
+        tries = len(model[model.DICTIONARY_KEY])
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey'
+        expected = self.utility.parse(model, source_string)
+        model.destroy()
+        model = pilsner.Model('./.test_parse_lazy_tries', lazy_tries=True, resident_tries=2)
+        output = [self.utility.parse(model, source_string), self.utility.parse(model, source_string)]
+        resident = sum([len(trie[model.CONTENT_KEY]) for trie in model[model.DICTIONARY_KEY]])
+        model.destroy()
+        for filename in ['./.test_parse_lazy_tries.%d.dictionary' % (i) for i in range(tries)] + ['./.test_parse_lazy_tries.attributes', './.test_parse_lazy_tries.keywords', './.test_parse_lazy_tries.normalizers']:
+            os.remove(filename)
+        assert output == [expected, expected], '\nExpected\n%s\nGot\n%s' % (str([expected, expected]), str(output))
+        assert resident == 2, 'Expected 2 tries in memory, got %d' % (resident)
+
+    def test_parse_lazy_tries_used_normalizers(self):
+        _, model = self.compile_test_model(model=pilsner.Model(), item_limit=4)
+        model.add_normalizer('t3', 'test/assets/tokenizer1.xml')
+        model.save('./.test_parse_lazy_tries_used_normalizers')
+        tries = len(model[model.DICTIONARY_KEY])
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey'
+        expected = self.utility.parse(model, source_string)
+        model.destroy()
+        model = pilsner.Model('./.test_parse_lazy_tries_used_normalizers', lazy_tries=True)
+        used_normalizers = model.get_used_normalizers()
+        output = self.utility.parse(model, source_string)
+        resident = [sorted(trie[model.CONTENT_KEY]) for trie in model[model.DICTIONARY_KEY]]
+        model.destroy()
+        for filename in ['./.test_parse_lazy_tries_used_normalizers.%d.dictionary' % (i) for i in range(tries)] + ['./.test_parse_lazy_tries_used_normalizers.attributes', './.test_parse_lazy_tries_used_normalizers.keywords', './.test_parse_lazy_tries_used_normalizers.normalizers']:
+            os.remove(filename)
+        assert used_normalizers == ['t1', 't2'], 'Expected used normalization units [\'t1\', \'t2\'], got %s' % (str(used_normalizers))
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        assert resident == [['t1', 't2'], ['t1', 't2'], ['t2']], 'Only tries that have labels are expected to be read, got %s' % (str(resident))
+
+    def test_parse_normalized_attrs(self):
+        _, expected_model = self.compile_test_model()
+        _, model = self.compile_test_model(model=pilsner.Model(normalized_attrs=True))
+        model.save('./.test_parse_normalized_attrs')
+        model.destroy()
+        model = pilsner.Model()
+        model.load('./.test_parse_normalized_attrs')
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey'
+        attrs_where = {'+': {'some_attribute': ['A', 'D']}}
+        expected = [self.utility.parse(expected_model, source_string), self.utility.parse(expected_model, source_string, attrs_where=attrs_where, attrs_out=['entity_id'])]
+        output = [self.utility.parse(model, source_string), self.utility.parse(model, source_string, attrs_where=attrs_where, attrs_out=['entity_id'])]
+        normalized_attrs = model.normalized_attrs
+        model.destroy()
+        for filename in ['./.test_parse_normalized_attrs.0.dictionary', './.test_parse_normalized_attrs.attributes', './.test_parse_normalized_attrs.keywords', './.test_parse_normalized_attrs.normalizers']:
+            os.remove(filename)
+        assert normalized_attrs, 'Loaded model is supposed to have normalized attributes'
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+
+    def test_parse_memory_attributes(self):
+        _, expected_model = self.compile_test_model()
+        _, model = self.compile_test_model(model=pilsner.Model(attrs_store=pilsner.MemoryAttributes()))
+        assert model.connection is None, 'Model is not supposed to use SQLite database'
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey'
+        filters = [{}, {'attrs_where': {'+': {'some_attribute': ['A', 'D']}}, 'attrs_out': ['entity_id']}, {'attrs_where': {'-': {'some_attribute': ['E']}}}]
+        expected = [self.utility.parse(expected_model, source_string, **x) for x in filters]
+        output = [self.utility.parse(model, source_string, **x) for x in filters]
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        model.save('./.test_parse_memory_attributes')
+        model = pilsner.Model()
+        model.load('./.test_parse_memory_attributes')
+        output = [self.utility.parse(model, source_string, **x) for x in filters]
+        for filename in ['./.test_parse_memory_attributes.0.dictionary', './.test_parse_memory_attributes.memory_attributes', './.test_parse_memory_attributes.keywords', './.test_parse_memory_attributes.normalizers']:
+            os.remove(filename)
+        assert isinstance(model.attrs_store, pilsner.MemoryAttributes), 'Loaded model is supposed to store attributes in memory'
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+
+    def test_parse_mapped(self):
+        _, model = self.compile_test_model()
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey'
+        expected = self.utility.parse(model, source_string)
+        model.save('./.test_parse_mapped', mapped=True)
+        mapped_model = pilsner.Model('./.test_parse_mapped')
+        output = self.utility.parse(mapped_model, source_string)
+        mapped_model.destroy()
+        for filename in ['./.test_parse_mapped.0.mapped_dictionary', './.test_parse_mapped.attributes', './.test_parse_mapped.mapped_keywords', './.test_parse_mapped.normalizers']:
+            os.remove(filename)
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+
+    def test_parse_many(self):
+        _, model = self.compile_test_model()
+        texts = [
+            'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey',
+            'this is awesome white refrigerator hey hey',
+            'nothing to see here',
+            'conflicting refrigerator'
+        ] * 3
+        expected = [self.utility.parse(model, text) for text in texts]
+        output = list(self.utility.parse_many(model, texts, workers=2, chunksize=2))
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        model.save('./.test_parse_many')
+        output = sorted(self.utility.parse_many(model, texts, workers=2, model_filename='./.test_parse_many', ordered=False), key=lambda x: x[0])
+        for filename in ['./.test_parse_many.0.dictionary', './.test_parse_many.attributes', './.test_parse_many.keywords', './.test_parse_many.normalizers']:
+            os.remove(filename)
+        assert [x[1] for x in output] == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str([x[1] for x in output]))
+
+    def test_init_parse_worker(self):
+        _, model = self.compile_test_model()
+        utility_module = sys.modules[self.utility.__class__.__module__]
+        inherited_connection, inherited_cursor = model.connection, model.cursor
+        worker_model = utility_module.init_parse_worker(model.__class__, '', model)
+        assert (inherited_connection, inherited_cursor) in utility_module.inherited_connections, 'Inherited connection is not kept'
+        assert worker_model.connection is not inherited_connection, 'Worker process uses inherited connection'
+        inherited_cursor.execute('select 1;')
+        assert inherited_cursor.fetchone() == (1,), 'Inherited connection is closed'
+
+    def test_registry_threads(self):
+        _, model = self.compile_test_model()
+        source_string = 'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey'
+        expected = self.utility.parse(model, source_string)
+        model.save('./.test_registry_threads')
+        registry = pilsner.ModelRegistry()
+        registry.register('m', './.test_registry_threads', attrs_cache_size=2, lazy_tries=True, resident_tries=1)
+        errors = []
+        def run():
+            try:
+                with registry.use('m') as m:
+                    for _ in range(50):
+                        output = self.utility.parse(m, source_string)
+                        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        with registry.use('m'):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        registry.destroy()
+        for filename in ['./.test_registry_threads.0.dictionary', './.test_registry_threads.attributes', './.test_registry_threads.keywords', './.test_registry_threads.normalizers']:
+            os.remove(filename)
+        assert errors == [], 'Threads failed: %s' % (str(errors))
+
+    def test_shard_workers(self):
+        _, model = self.compile_test_model(item_limit=2)
+        assert len(model[model.DICTIONARY_KEY]) > 1, 'Model is supposed to have several tries'
+        texts = [
+            'this is awwsome white refrigerator o refrigerator, is it tors not conflicting refrigerator hey',
+            'this is awesome white refrigerator hey hey',
+            'nothing to see here'
+        ]
+        expected = [self.utility.parse(model, text) for text in texts]
+        self.utility.start_shard_workers(model, workers=2)
+        try:
+            output = [self.utility.parse(model, text) for text in texts]
+        finally:
+            self.utility.stop_shard_workers()
+        assert self.utility.shard_workers is None, 'Shard workers are supposed to be stopped'
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+
+    def test_parse_stream(self):
+        _, model = self.compile_test_simple_model()
+        text = ' '.join(['this is awesome white refrigerator hey hey', 'o refrigerator, is it tors', 'nothing to see here'] * 20)
+        expected = self.utility.parse(model, text)
+        output = dict(self.utility.parse_stream(model, io.StringIO(text), chunk_size=50, window=40))
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+        output = list(self.utility.parse_stream(model, [text[i:i + 7] for i in range(0, len(text), 7)], chunk_size=30, window=40))
+        assert output == sorted(expected.items()), '\nExpected\n%s\nGot\n%s' % (str(sorted(expected.items())), str(output))
+
+    def test_parse_stream_no_separator(self):
+        _, model = self.compile_test_simple_model()
+        chunks = ['this is awesome white refrigerator hey hey '] + ['x' * 30] * 20 + [' awesome white refrigerator']
+        text = ''.join(chunks)
+        expected = sorted(self.utility.parse(model, text).items())
+        consumed = []
+        def stream():
+            for chunk in chunks:
+                consumed.append(chunk)
+                yield chunk
+        output = []
+        for item in self.utility.parse_stream(model, stream(), chunk_size=30, window=40):
+            output.append((item, len(consumed)))
+        assert [x[0] for x in output] == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str([x[0] for x in output]))
+        assert output[0][1] < len(chunks), 'Text without word separators is accumulated until the end of stream'
+
+    def test_parse_stream_small_chunk(self):
+        _, model = self.compile_test_simple_model()
+        text = 'this is awesome white refrigerator hey hey ' * 10
+        expected = sorted(self.utility.parse(model, text).items())
+        output = list(self.utility.parse_stream(model, [text[i:i + 5] for i in range(0, len(text), 5)], chunk_size=5, window=60))
+        assert output == expected, '\nExpected\n%s\nGot\n%s' % (str(expected), str(output))
+
     def test_simple_model(self):
         _, model = self.compile_test_simple_model()
         source_string = 'this is awesome white refrigerator hey hey'